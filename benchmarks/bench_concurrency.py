@@ -0,0 +1,78 @@
+"""
+Concurrency scaling of /apply-insurance work: blocking manager vs async path.
+
+Uses a throwaway SQLite database and a simulated chain that takes BLOCK_TIME
+seconds to confirm, so the numbers show how requests overlap rather than raw
+database speed. Run from the repository root:
+
+    python -m benchmarks.bench_concurrency
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from src.database import init_db
+from src.insurance_manager import InsuranceManager
+from src.async_insurance_manager import AsyncInsuranceManager
+from src.micro_batcher import RiskScoringBatcher
+from src.risk_assessment import RiskAssessment
+from benchmarks.bench_inference import make_training_data
+from tests.fake_chain import InProcessChain
+
+BLOCK_TIME = 0.05
+
+def make_application(i):
+    return {
+        'wallet_address': f"0x{i:040x}",
+        'age': 30 + i % 40,
+        'claim_history': i % 4,
+        'risk_factors': 0.5,
+        'requested_coverage': 10000.0,
+        'duration': 365
+    }
+
+async def run_blocking(manager, applications):
+    async def apply(application):
+        # What the endpoints did before: a sync call straight on the event loop
+        return manager.process_insurance_application(application)
+    await asyncio.gather(*(apply(application) for application in applications))
+
+async def run_async(async_manager, applications):
+    # Same wiring as api.py: micro-batched scoring, then the async pipeline
+    batcher = RiskScoringBatcher(async_manager.risk_assessor, executor=async_manager.executor)
+
+    async def apply(application):
+        risk_result = await batcher.score(application)
+        return await async_manager.process_insurance_application(application, risk_result)
+
+    await asyncio.gather(*(apply(application) for application in applications))
+    await batcher.close()
+
+def main(levels=(1, 10, 50)):
+    init_db()
+    manager = InsuranceManager(None, None, smart_contract=InProcessChain(BLOCK_TIME))
+    assessor = RiskAssessment()
+    assessor.train_model(*make_training_data(2000))
+    manager.risk_assessor.activate(assessor)
+    async_manager = AsyncInsuranceManager(manager)
+
+    offset = 0
+    for concurrency in levels:
+        for name, runner, target in (
+            ("blocking", run_blocking, manager),
+            ("async", run_async, async_manager)
+        ):
+            applications = [make_application(offset + i) for i in range(concurrency)]
+            offset += concurrency
+            start = time.perf_counter()
+            asyncio.run(runner(target, applications))
+            elapsed = time.perf_counter() - start
+            print(f"concurrency {concurrency:>3} {name:>8}: {concurrency / elapsed:8.1f} req/s  {elapsed:6.2f} s")
+
+    async_manager.shutdown()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
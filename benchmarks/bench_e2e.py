@@ -0,0 +1,396 @@
+"""
+End-to-end benchmark: scoring micro-benchmarks plus concurrent load on every API endpoint.
+
+The FastAPI app runs in-process behind httpx's ASGI transport, against a
+throwaway SQLite database (or the database in DATABASE_URL, e.g. a local
+PostgreSQL) and an in-process chain stand-in that confirms each transaction
+after --block-time seconds. Each load scenario reports requests/sec,
+p50/p95/p99 latency and process memory; client time is included, so compare
+runs against each other rather than against a deployed server. Run from the
+repository root:
+
+    python -m benchmarks.bench_e2e --save-baseline
+    python -m benchmarks.bench_e2e            # compare against the saved baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR}/bench.db")
+os.environ.setdefault("MODEL_PATH", f"{WORK_DIR}/model.joblib")
+os.environ.setdefault("MODEL_DIR", WORK_DIR)
+os.environ.setdefault("ADMIN_API_TOKEN", "bench")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_TO_FILE", "false")
+os.environ.setdefault("EVIDENCE_BACKEND", "local")
+os.environ.setdefault("EVIDENCE_LOCAL_DIR", f"{WORK_DIR}/evidence")
+
+import httpx
+import numpy as np
+from src.api import app, insurance_manager, async_manager
+from src.database import init_db, get_db_session
+from src.models import User, Policy, Claim, PolicyStatus, ClaimStatus
+from src.portfolio_summary import PortfolioChanges
+from src.risk_assessment import RiskAssessment
+from src.config import settings
+from benchmarks.bench_inference import make_training_data
+from tests.fake_chain import InProcessChain
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline_e2e.json")
+AUTH_HEADERS = {"Authorization": f"Bearer {os.environ['ADMIN_API_TOKEN']}"}
+
+class Fixture:
+    """
+    Seeded wallets, policies and claims the read scenarios pick from
+    """
+    def __init__(self, n_users, policies_per_user, seed=0):
+        self.rng = random.Random(seed)
+        self.wallets = []
+        self.policy_ids = []
+        self.claim_ids = []
+        self.counter = 0
+        self.claim_cursor = 0
+        now = datetime.utcnow()
+        run = uuid.uuid4().hex[:8]
+        with get_db_session() as db:
+            users = [
+                User(wallet_address=f"0x{run}{i:032x}", age=25 + i % 50, credit_score=600 + i % 200)
+                for i in range(n_users)
+            ]
+            db.add_all(users)
+            db.flush()
+            policies = [
+                Policy(
+                    policy_id=f"bench-{run}-{user.id}-{j}",
+                    user_id=user.id,
+                    coverage_amount=10000.0,
+                    premium=150.0,
+                    status=PolicyStatus.ACTIVE,
+                    start_date=now - timedelta(days=30),
+                    end_date=now + timedelta(days=335),
+                    contract_address="0x" + "c" * 40
+                )
+                for user in users
+                for j in range(policies_per_user)
+            ]
+            db.add_all(policies)
+            db.flush()
+            claims = [
+                Claim(
+                    claim_id=f"bench-{run}-claim-{policy.id}",
+                    policy_id=policy.id,
+                    amount=500.0,
+                    status=ClaimStatus.PROCESSING,
+                    evidence_hash="Qm" + "b" * 44,
+                    created_at=now
+                )
+                for policy in policies[::policies_per_user]
+            ]
+            db.add_all(claims)
+            changes = PortfolioChanges()
+            for policy in policies:
+                changes.policy(policy)
+            for policy, claim in zip(policies[::policies_per_user], claims):
+                changes.claim(policy, claim.status)
+            changes.apply(db)
+            db.commit()
+            self.wallets = [user.wallet_address for user in users]
+            self.policy_ids = [policy.policy_id for policy in policies]
+            self.claim_ids = [claim.claim_id for claim in claims]
+
+    def unique(self, prefix):
+        self.counter += 1
+        return f"{prefix}-{uuid.uuid4().hex[:12]}-{self.counter}"
+
+    def application(self):
+        self.counter += 1
+        return {
+            'wallet_address': f"0x{uuid.uuid4().hex}{self.counter:08x}",
+            'age': self.rng.randint(18, 80),
+            'claim_history': self.rng.randint(0, 5),
+            'risk_factors': self.rng.random(),
+            'requested_coverage': 10000.0,
+            'duration': 365
+        }
+
+    def wallet(self):
+        return self.rng.choice(self.wallets)
+
+    def policy_id(self):
+        return self.rng.choice(self.policy_ids)
+
+    def claim_policy_id(self):
+        # Walk the policies in order so new claims stay inside the fraud screening limits
+        self.claim_cursor += 1
+        return self.policy_ids[self.claim_cursor % len(self.policy_ids)]
+
+    def claim_id(self):
+        return self.rng.choice(self.claim_ids)
+
+def scenarios(fixture, compiled_path):
+    """
+    (name, build_request, request cap, concurrency cap) per endpoint; build_request returns httpx kwargs
+    """
+    bulk_rows = 50
+    # Every request after the first is a retry, answered from the idempotency index
+    replayed_claim = {
+        'claim_id': fixture.unique("claim"), 'amount': 250.0,
+        'evidence_hash': "Qm" + uuid.uuid4().hex.ljust(44, "e"), 'policy_id': fixture.claim_policy_id()
+    }
+    return [
+        ("apply_insurance", lambda: dict(method="POST", url="/apply-insurance", json=fixture.application()), None, None),
+        ("apply_insurance_bulk", lambda: dict(
+            method="POST", url="/apply-insurance/bulk?format=ndjson",
+            content="\n".join(json.dumps(fixture.application()) for _ in range(bulk_rows))
+        ), 50, 4),
+        ("submit_claim", lambda: dict(method="POST", url="/submit-claim", json={
+            'claim_id': fixture.unique("claim"), 'amount': 250.0,
+            'evidence_hash': "Qm" + uuid.uuid4().hex.ljust(44, "e"), 'policy_id': fixture.claim_policy_id()
+        }), None, None),
+        ("submit_claim_replay", lambda: dict(method="POST", url="/submit-claim", json=replayed_claim), None, None),
+        ("upload_evidence", lambda: dict(
+            method="POST", url="/evidence?filename=evidence.bin", content=os.urandom(256 * 1024)
+        ), None, None),
+        ("get_policy", lambda: dict(method="GET", url=f"/policy/{fixture.policy_id()}", headers=AUTH_HEADERS), None, None),
+        ("get_user_policies", lambda: dict(method="GET", url=f"/user-policies/{fixture.wallet()}"), None, None),
+        ("get_user_policies_page", lambda: dict(method="GET", url=f"/user-policies/{fixture.wallet()}?limit=5"), None, None),
+        ("get_user_portfolio", lambda: dict(method="GET", url=f"/user-portfolio/{fixture.wallet()}"), None, None),
+        ("get_user_policies_ndjson", lambda: dict(method="GET", url=f"/user-policies/{fixture.wallet()}?format=ndjson"), None, None),
+        ("get_claim_status", lambda: dict(method="GET", url=f"/claim-status/{fixture.claim_id()}"), None, None),
+        ("risk_assessment", lambda: dict(method="POST", url="/risk-assessment", json={'user_data': fixture.application()}), None, None),
+        ("risk_assessment_batch", lambda: dict(method="POST", url="/risk-assessment/batch", json={
+            'users': [fixture.application() for _ in range(32)]
+        }), None, None),
+        ("health", lambda: dict(method="GET", url="/health"), None, None),
+        ("ready", lambda: dict(method="GET", url="/ready"), None, None),
+        ("risk_batch_stats", lambda: dict(method="GET", url="/risk-assessment/batch-stats"), None, None),
+        ("cache_stats", lambda: dict(method="GET", url="/cache/stats"), None, None),
+        ("metrics", lambda: dict(method="GET", url="/metrics"), None, None),
+        ("get_model_info", lambda: dict(method="GET", url="/admin/model", headers=AUTH_HEADERS), None, None),
+        # A swap reloads the artifact, so only a handful run, one at a time
+        ("swap_model", lambda: dict(method="POST", url="/admin/model", headers=AUTH_HEADERS, json={
+            'artifact': os.path.basename(compiled_path)
+        }), 10, 1),
+    ]
+
+def percentiles(timings):
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99))
+    }
+
+def memory_mib():
+    """
+    Current and peak resident set size of this process
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        current = peak
+    return {'rss_mib': current, 'peak_rss_mib': peak}
+
+async def run_load(client, build_request, n_requests, concurrency):
+    timings = np.empty(n_requests)
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < n_requests:
+            index = next_index
+            next_index += 1
+            request = build_request()
+            start = time.perf_counter()
+            response = await client.request(**request)
+            timings[index] = time.perf_counter() - start
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'requests_per_sec': n_requests / elapsed,
+        **percentiles(timings * 1000),
+        **memory_mib()
+    }
+
+async def run_scenarios(fixture, compiled_path, n_requests, concurrency, only=None):
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            await wait_until_ready(client)
+            for name, build_request, request_cap, concurrency_cap in scenarios(fixture, compiled_path):
+                if only and name not in only:
+                    continue
+                result = await run_load(
+                    client,
+                    build_request,
+                    min(n_requests, request_cap or n_requests),
+                    min(concurrency, concurrency_cap or concurrency)
+                )
+                results[name] = result
+                print(
+                    f"{name:>26}: {result['requests_per_sec']:8.1f} req/s  p50 {result['p50_ms']:7.2f} ms  "
+                    f"p95 {result['p95_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms  "
+                    f"rss {result['rss_mib']:6.1f} MiB  errors {result['errors']}"
+                )
+    return results
+
+async def wait_until_ready(client, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await client.get("/ready")
+        if response.status_code == 200:
+            return
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"API not ready: {response.text}")
+        await asyncio.sleep(0.05)
+
+def time_calls(func, args, repeat):
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+def micro_benchmarks(model_path, compiled_path, quote, repeat):
+    results = {}
+
+    def record(name, timings):
+        results[name] = {
+            'calls_per_sec': 1e6 / timings.mean(),
+            'p50_us': float(np.percentile(timings, 50)),
+            'p95_us': float(np.percentile(timings, 95)),
+            'p99_us': float(np.percentile(timings, 99))
+        }
+        print(
+            f"{name:>26}: p50 {results[name]['p50_us']:10.1f} us  p95 {results[name]['p95_us']:10.1f} us  "
+            f"p99 {results[name]['p99_us']:10.1f} us"
+        )
+
+    for engine, path in (("sklearn", model_path), ("compiled", compiled_path)):
+        assessor = RiskAssessment(inference_engine=engine)
+        record(f"model_load_{engine}", time_calls(assessor.load_model, (path,), max(repeat // 50, 5)))
+        record(f"analyze_user_risk_{engine}", time_calls(assessor.analyze_user_risk, (quote,), repeat))
+    record("extract_features", time_calls(assessor._extract_features, (quote,), repeat * 10))
+    return results
+
+def train_model(model_path, compiled_path, n_rows):
+    assessor = RiskAssessment()
+    assessor.train_model(*make_training_data(n_rows))
+    assessor.save_model(model_path, version="bench")
+    assessor.save_compiled(compiled_path, version="bench-compiled")
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change against the baseline for each tracked metric; returns the regressions
+    """
+    tracked = (
+        ('micro', 'p50_us', False),
+        ('load', 'requests_per_sec', True),
+        ('load', 'p95_ms', False),
+    )
+    regressions = []
+    print(f"\nAgainst baseline (tolerance {tolerance:.0%}):")
+    for section, metric, higher_is_better in tracked:
+        for name, result in results[section].items():
+            previous = baseline.get(section, {}).get(name, {}).get(metric)
+            if not previous:
+                continue
+            change = result[metric] / previous - 1
+            worse = -change if higher_is_better else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append(f"{section}.{name}.{metric}")
+            print(f"{section + '.' + name:>32} {metric:>16}: {previous:10.2f} -> {result[metric]:10.2f}  ({change:+.1%}){flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API end to end and compare against a baseline")
+    parser.add_argument("--requests", type=int, default=300, help="requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per load scenario")
+    parser.add_argument("--users", type=int, default=500, help="seeded wallets")
+    parser.add_argument("--policies-per-user", type=int, default=4)
+    parser.add_argument("--training-rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=500, help="calls per micro-benchmark")
+    parser.add_argument("--block-time", type=float, default=0.0, help="seconds the chain stand-in takes to confirm")
+    parser.add_argument("--scenario", action="append", help="only run this load scenario (repeatable)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--output", help="also write the results JSON here")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    compiled_path = os.path.join(WORK_DIR, "model.forest")
+    if not os.path.exists(settings.MODEL_PATH):
+        train_model(settings.MODEL_PATH, compiled_path, args.training_rows)
+    else:
+        assessor = RiskAssessment()
+        assessor.load_model(settings.MODEL_PATH)
+        assessor.save_compiled(compiled_path)
+
+    init_db()
+    chain = InProcessChain(block_time=args.block_time)
+    insurance_manager.smart_contract = chain
+    async_manager.smart_contract = chain
+    fixture = Fixture(args.users, args.policies_per_user)
+
+    print(f"database {settings.DATABASE_URL.split('@')[-1]}, block time {args.block_time}s\n")
+    print("Micro-benchmarks:")
+    micro = micro_benchmarks(settings.MODEL_PATH, compiled_path, fixture.application(), args.repeat)
+    print(f"\nLoad ({args.requests} requests, {args.concurrency} concurrent clients per scenario):")
+    load = asyncio.run(run_scenarios(fixture, compiled_path, args.requests, args.concurrency, args.scenario))
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'database': settings.DATABASE_URL.split("://")[0],
+            'block_time': args.block_time,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'recorded_at': datetime.utcnow().isoformat()
+        },
+        'micro': micro,
+        'load': load
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    else:
+        print(f"\nNo baseline at {args.baseline}; rerun with --save-baseline to record one")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
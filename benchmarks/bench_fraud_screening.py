@@ -0,0 +1,141 @@
+"""
+Fraud screening: aggregate lookups against scanning the claims table, at millions of claims.
+
+Seeds --claims claims across policies and users in a throwaway SQLite
+database (or DATABASE_URL), rebuilds the aggregates the way migration 4
+does, then screens --checks claims two ways: through FraudScreener, which
+reads three rows by primary key, and through the equivalent queries over
+the claims table (per-policy totals, per-user totals through the policies
+join, and an evidence hash lookup on a column with no index). Every check
+is rolled back so the data stays fixed. Run from the repository root:
+
+    python -m benchmarks.bench_fraud_screening --claims 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+WORK_DIR = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR}/bench.db")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+os.environ.setdefault("LOG_TO_FILE", "false")
+
+import numpy as np
+from sqlalchemy import select, func, insert
+from src.database import init_db, get_db_session, get_engine
+from src.models import User, Policy, Claim, PolicyStatus, ClaimStatus
+from src.fraud_screening import FraudScreener, rebuild_aggregates
+
+INSERT_BATCH = 50000
+
+def seed(n_claims, claims_per_policy, policies_per_user, now):
+    n_policies = max(1, n_claims // claims_per_policy)
+    n_users = max(1, n_policies // policies_per_user)
+    rng = random.Random(0)
+    statuses = [ClaimStatus.PROCESSING, ClaimStatus.APPROVED, ClaimStatus.REJECTED]
+    with get_engine().begin() as conn:
+        conn.execute(insert(User), [{'id': i + 1, 'wallet_address': f"0x{i:040x}"} for i in range(n_users)])
+        conn.execute(insert(Policy), [
+            {
+                'id': i + 1,
+                'policy_id': f"policy-{i}",
+                'user_id': i % n_users + 1,
+                'coverage_amount': 1e9,
+                'status': PolicyStatus.ACTIVE,
+                'start_date': now - timedelta(days=365)
+            }
+            for i in range(n_policies)
+        ])
+        for start in range(0, n_claims, INSERT_BATCH):
+            conn.execute(insert(Claim), [
+                {
+                    'claim_id': f"claim-{i}",
+                    'policy_id': i % n_policies + 1,
+                    'amount': rng.uniform(10, 1000),
+                    'status': rng.choice(statuses),
+                    'evidence_hash': f"Qm{i:044x}",
+                    'created_at': now - timedelta(seconds=rng.uniform(0, 365 * 86400))
+                }
+                for i in range(start, min(start + INSERT_BATCH, n_claims))
+            ])
+    return n_policies, n_users
+
+def screen_with_aggregates(db, screener, policy, claim_data):
+    screener.screen(db, policy, claim_data)
+
+def screen_with_scans(db, screener, policy, claim_data):
+    cutoff = datetime.utcnow() - timedelta(seconds=screener.window)
+    policy_claims = select(
+        func.count(Claim.id),
+        func.sum(Claim.amount).filter(Claim.status != ClaimStatus.REJECTED),
+        func.max(Claim.created_at),
+        func.count(Claim.id).filter(Claim.created_at >= cutoff)
+    ).where(Claim.policy_id == policy.id)
+    user_claims = select(
+        func.count(Claim.id).filter(Claim.created_at >= cutoff),
+        func.sum(Claim.amount).filter(Claim.created_at >= cutoff)
+    ).join(Policy, Claim.policy_id == Policy.id).where(Policy.user_id == policy.user_id)
+    evidence_reuse = select(Claim.policy_id).where(
+        Claim.evidence_hash == claim_data['evidence_hash'], Claim.policy_id != policy.id
+    ).limit(1)
+    db.execute(policy_claims).one()
+    db.execute(user_claims).one()
+    db.execute(evidence_reuse).first()
+
+def measure(screen, screener, policy_ids, checks, rng):
+    timings = []
+    with get_db_session() as db:
+        policies = {policy.id: policy for policy in db.scalars(select(Policy).where(Policy.id.in_(policy_ids)))}
+        for i in range(checks):
+            policy = policies[rng.choice(policy_ids)]
+            claim_data = {
+                'claim_id': f"check-{i}",
+                'policy_id': policy.policy_id,
+                'amount': 100.0,
+                # Fresh hashes are the worst case for a scan: nothing matches, so every row is read
+                'evidence_hash': f"Qm{rng.getrandbits(128):044x}"
+            }
+            start = time.perf_counter()
+            screen(db, screener, policy, claim_data)
+            timings.append(time.perf_counter() - start)
+            db.rollback()
+    return np.array(timings) * 1000
+
+def report(name, timings):
+    print(
+        f"{name:>12}: p50 {np.percentile(timings, 50):9.3f} ms  p95 {np.percentile(timings, 95):9.3f} ms  "
+        f"p99 {np.percentile(timings, 99):9.3f} ms  {len(timings) / (timings.sum() / 1000):9.0f} checks/s"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fraud screening against scanning the claims table")
+    parser.add_argument("--claims", type=int, default=1000000)
+    parser.add_argument("--claims-per-policy", type=int, default=5)
+    parser.add_argument("--policies-per-user", type=int, default=4)
+    parser.add_argument("--checks", type=int, default=1000, help="screening checks per method")
+    parser.add_argument("--scan-checks", type=int, default=50, help="checks for the scan method, which reads every row")
+    args = parser.parse_args()
+
+    init_db()
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    n_policies, n_users = seed(args.claims, args.claims_per_policy, args.policies_per_user, now)
+    print(f"seeded {args.claims} claims, {n_policies} policies, {n_users} users in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    with get_engine().begin() as conn:
+        rebuild_aggregates(conn, now)
+    print(f"rebuilt aggregates in {time.perf_counter() - start:.1f} s")
+
+    # Flag mode, so a sample claim that trips a rule is still timed end to end
+    screener = FraudScreener(mode="flag")
+    rng = random.Random(1)
+    policy_ids = rng.sample(range(1, n_policies + 1), min(n_policies, 1000))
+    report("aggregates", measure(screen_with_aggregates, screener, policy_ids, args.checks, rng))
+    report("scans", measure(screen_with_scans, screener, policy_ids, args.scan_checks, rng))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
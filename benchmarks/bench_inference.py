@@ -0,0 +1,54 @@
+"""
+Single-quote latency benchmark for the sklearn and compiled inference engines.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_inference
+"""
+import time
+import numpy as np
+from src.risk_assessment import RiskAssessment, FEATURE_KEYS, extract_feature_matrix
+
+def make_training_data(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    training_data = [
+        {key: float(value) for key, value in zip(FEATURE_KEYS, row)}
+        for row in rng.normal(50, 20, size=(n_rows, len(FEATURE_KEYS)))
+    ]
+    labels = rng.integers(0, 2, size=n_rows)
+    return training_data, labels
+
+def time_calls(func, arg, repeat):
+    timings = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+def main(n_rows=5000, repeat=500):
+    training_data, labels = make_training_data(n_rows)
+
+    baseline = RiskAssessment(inference_engine="sklearn")
+    baseline.train_model(training_data, labels)
+    compiled = RiskAssessment(inference_engine="compiled")
+    compiled.model, compiled.scaler = baseline.model, baseline.scaler
+    compiled._compile()
+
+    # Parity against sklearn's predict_proba
+    features = extract_feature_matrix(training_data)
+    expected = baseline.model.predict_proba(baseline.scaler.transform(features))
+    actual = compiled.compiled_forest.predict_proba(features)
+    assert np.allclose(expected, actual, rtol=0, atol=1e-12), "compiled engine diverges from sklearn"
+    print(f"parity: {n_rows} rows, max abs diff {np.abs(expected - actual).max():.2e}")
+
+    quote = training_data[0]
+    for name, assessor in (("sklearn", baseline), ("compiled", compiled)):
+        timings = time_calls(assessor.analyze_user_risk, quote, repeat)
+        print(
+            f"{name:>8}: p50 {np.percentile(timings, 50):8.1f} us  "
+            f"p99 {np.percentile(timings, 99):8.1f} us"
+        )
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
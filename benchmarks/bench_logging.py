@@ -0,0 +1,73 @@
+"""
+Per-request logging overhead in the calling thread: synchronous handlers vs the queue pipeline.
+
+Each simulated request logs what /apply-insurance logs (two INFO records)
+plus one DEBUG record that is disabled. The synchronous setup is the one
+setup_logger used to build: a stdout handler and a RotatingFileHandler, with
+f-string messages. Output goes to a temporary directory and /dev/null. Run
+from the repository root:
+
+    python -m benchmarks.bench_logging
+"""
+import logging
+import os
+import tempfile
+import time
+import numpy as np
+from logging.handlers import RotatingFileHandler
+from src.logger import LogPipeline, TEXT_FORMAT, FILE_TEXT_FORMAT
+
+def synchronous_logger(log_dir, stream):
+    logger = logging.getLogger("bench.synchronous")
+    logger.setLevel(logging.INFO)
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    file_handler = RotatingFileHandler(os.path.join(log_dir, "synchronous.log"), maxBytes=10485760, backupCount=5)
+    file_handler.setFormatter(logging.Formatter(FILE_TEXT_FORMAT))
+    logger.addHandler(console_handler)
+    logger.addHandler(file_handler)
+    return logger
+
+def eager_request(logger, i):
+    wallet_address = f"0x{i:040x}"
+    logger.info(f"Processing insurance application for user: {wallet_address}")
+    logger.debug(f"Features for {wallet_address}: {[i, i + 1, i + 2]}")
+    logger.info(f"Successfully created policy policy-{i}")
+
+def lazy_request(logger, i):
+    wallet_address = f"0x{i:040x}"
+    logger.info("Processing insurance application for user: %s", wallet_address)
+    logger.debug("Features for %s: %s", wallet_address, [i, i + 1, i + 2])
+    logger.info("Successfully created policy %s", f"policy-{i}", extra={'policy_id': f"policy-{i}"})
+
+def time_requests(request, logger, n_requests):
+    timings = np.empty(n_requests)
+    for i in range(n_requests):
+        start = time.perf_counter()
+        request(logger, i)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+def report(name, timings):
+    print(
+        f"{name:>22}: mean {timings.mean():7.2f} us  p50 {np.percentile(timings, 50):7.2f} us  "
+        f"p99 {np.percentile(timings, 99):7.2f} us per request"
+    )
+
+def main(n_requests=20000):
+    log_dir = tempfile.mkdtemp()
+    with open(os.devnull, "w") as devnull:
+        logger = synchronous_logger(log_dir, devnull)
+        report("synchronous, f-string", time_requests(eager_request, logger, n_requests))
+
+        for name, log_format, rate in (("queue, text", "text", 0.0), ("queue, json", "json", 0.0),
+                                       ("queue, json, sampled", "json", 100.0)):
+            pipeline = LogPipeline(stream=devnull, log_dir=log_dir, log_format=log_format,
+                                   info_rate_limit=rate).start()
+            logger = pipeline.attach(logging.getLogger(f"bench.{name}"), level=logging.INFO)
+            report(name, time_requests(lazy_request, logger, n_requests))
+            # Drain before the next run so this listener doesn't compete with it
+            pipeline.stop()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Throughput and latency of concurrent scoring with and without micro-batching.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_micro_batcher
+"""
+import asyncio
+import time
+import numpy as np
+from src.risk_assessment import RiskAssessment
+from src.micro_batcher import RiskScoringBatcher
+from benchmarks.bench_inference import make_training_data
+
+async def run_unbatched(assessor, quotes):
+    loop = asyncio.get_running_loop()
+
+    async def score(quote):
+        start = time.perf_counter()
+        await loop.run_in_executor(None, assessor.analyze_user_risk, quote)
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(score(quote) for quote in quotes))
+
+async def run_batched(batcher, quotes):
+    async def score(quote):
+        start = time.perf_counter()
+        await batcher.score(quote)
+        return time.perf_counter() - start
+
+    latencies = await asyncio.gather(*(score(quote) for quote in quotes))
+    await batcher.close()
+    return latencies
+
+def report(name, latencies, elapsed):
+    latencies = np.asarray(latencies) * 1000
+    print(
+        f"{name:>10}: {len(latencies) / elapsed:9.0f} req/s  "
+        f"p50 {np.percentile(latencies, 50):7.1f} ms  p99 {np.percentile(latencies, 99):7.1f} ms"
+    )
+
+def main(concurrency=2000, window_ms=2.0, max_batch_size=256):
+    training_data, labels = make_training_data(5000)
+    assessor = RiskAssessment()
+    assessor.train_model(training_data, labels)
+    quotes = training_data[:concurrency]
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run_unbatched(assessor, quotes))
+    report("unbatched", latencies, time.perf_counter() - start)
+
+    batcher = RiskScoringBatcher(assessor, window_ms=window_ms, max_batch_size=max_batch_size)
+    start = time.perf_counter()
+    latencies = asyncio.run(run_batched(batcher, quotes))
+    report("batched", latencies, time.perf_counter() - start)
+    print(batcher.stats())
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
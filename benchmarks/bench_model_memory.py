@@ -0,0 +1,94 @@
+"""
+Per-worker memory of the risk model: private joblib copies vs one shared memory map.
+
+Starts N worker processes that each load the model the way an API worker does
+and score a batch, then reports memory while all of them hold it. RSS counts
+shared pages in every process; PSS splits them between the processes mapping
+them, so it is the real per-worker cost. Needs Linux for PSS. Run from the
+repository root:
+
+    python -m benchmarks.bench_model_memory --workers 8
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import numpy as np
+from src.risk_assessment import RiskAssessment
+from benchmarks.bench_inference import make_training_data
+
+def memory_kb():
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss': values['Rss'],
+        'pss': values['Pss'],
+        'private': values['Private_Clean'] + values['Private_Dirty']
+    }
+
+def worker(path, inference_engine, quotes, barrier, results):
+    before = memory_kb()
+    assessor = RiskAssessment(inference_engine=inference_engine)
+    assessor.load_model(path)
+    assessor.analyze_batch(quotes)
+    # Measure only once every worker holds the model, so shared pages are split N ways
+    barrier.wait()
+    after = memory_kb()
+    results.put({key: after[key] - before[key] for key in after})
+    barrier.wait()
+
+def run(path, inference_engine, n_workers, quotes):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(n_workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(path, inference_engine, quotes, barrier, results))
+        for _ in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    samples = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return {key: np.mean([sample[key] for sample in samples]) / 1024 for key in samples[0]}
+
+def report(name, n_workers, usage):
+    print(
+        f"{name:>16}: per worker RSS {usage['rss']:8.1f} MiB  PSS {usage['pss']:8.1f} MiB  "
+        f"private {usage['private']:8.1f} MiB  | {n_workers} workers PSS {usage['pss'] * n_workers:8.1f} MiB"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker risk model memory")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=20000, help="training rows; more rows grow deeper trees")
+    args = parser.parse_args()
+
+    training_data, labels = make_training_data(args.rows)
+    assessor = RiskAssessment()
+    assessor.train_model(training_data, labels)
+    quotes = training_data[:256]
+
+    artifact_dir = tempfile.mkdtemp()
+    joblib_path = os.path.join(artifact_dir, "risk_assessment_model.joblib")
+    compiled_path = os.path.join(artifact_dir, "risk_assessment_model.forest")
+    assessor.save_model(joblib_path, version="bench")
+    assessor.save_compiled(compiled_path, version="bench")
+    print(
+        f"artifacts: joblib {os.path.getsize(joblib_path) / 2**20:.1f} MiB, "
+        f"compiled {os.path.getsize(compiled_path) / 2**20:.1f} MiB"
+    )
+
+    for name, path, inference_engine in (
+        ("joblib sklearn", joblib_path, "sklearn"),
+        ("joblib compiled", joblib_path, "compiled"),
+        ("memory-mapped", compiled_path, "compiled")
+    ):
+        report(name, args.workers, run(path, inference_engine, args.workers, quotes))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+Response serialization cost per endpoint: FastAPI's generic encoder vs FastJSONResponse.
+
+For each endpoint's payload, as the managers build it (NumPy risk scores,
+enums, datetimes, raw transaction receipts), times producing the response
+body three ways:
+
+    jsonable_encoder   what the endpoints did before (no response model)
+    response_model     FastAPI's path with the declared response model:
+                       validate against the model, jsonable_encoder, render
+    FastJSONResponse   the returned response rendered in one orjson pass
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serialization
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from hexbytes import HexBytes
+from web3.datastructures import AttributeDict
+from src.api import app, insurance_manager
+from src.models import Policy, Claim, PolicyStatus, ClaimStatus
+from src.serialization import FastJSONResponse, orjson
+
+# Policy and claim payloads come from the managers' own formatters, so they keep every field the endpoints return
+
+def policy(i, risk_score=None):
+    return insurance_manager._format_policy_response(
+        Policy(
+            policy_id=f"policy-{i}",
+            chain_policy_id=str(i),
+            premium=150.0 + i % 100,
+            contract_address="0x" + "c" * 40,
+            status=PolicyStatus.ACTIVE,
+            tx_hash=f"0x{i:064x}"
+        ),
+        None if risk_score is None else {'risk_score': risk_score}
+    )
+
+def receipt(i):
+    # Shaped like web3's TxReceipt: AttributeDicts of HexBytes
+    return AttributeDict({
+        'transactionHash': HexBytes(i.to_bytes(32, "big")),
+        'blockHash': HexBytes(bytes(range(224, 256))),
+        'blockNumber': 1000 + i,
+        'from': "0x" + "a" * 40,
+        'to': "0x" + "c" * 40,
+        'gasUsed': 84000,
+        'cumulativeGasUsed': 168000,
+        'status': 1,
+        'logs': [
+            AttributeDict({
+                'address': "0x" + "c" * 40,
+                'topics': [HexBytes(bytes(range(200, 232))), HexBytes(i.to_bytes(32, "big"))],
+                'data': HexBytes(bytes(range(128, 192))),
+                'logIndex': j,
+                'transactionIndex': 0
+            })
+            for j in range(3)
+        ]
+    })
+
+def claim(i, result=None):
+    return insurance_manager._format_claim_response(
+        Claim(
+            claim_id=f"claim-{i}",
+            policy_id=i,
+            amount=500.0,
+            status=ClaimStatus.PROCESSING,
+            evidence_hash="Qm" + "b" * 44,
+            tx_hash=f"0x{i:064x}",
+            created_at=datetime(2024, 1, 1) + timedelta(seconds=i)
+        ),
+        result
+    )
+
+def risk_assessment(i):
+    return {
+        'risk_score': np.float64(0.1 + (i % 80) / 100),
+        'risk_factors': ['Age Risk', 'High Claim History'][:i % 3],
+        'model_version': "1.1.0"
+    }
+
+def payloads(list_size):
+    """
+    (label, method, route path, payload) for every endpoint with a declared response model
+    """
+    return [
+        ("apply_insurance", "POST", "/apply-insurance", policy(1, np.float64(0.42))),
+        ("get_policy", "GET", "/policy/{policy_id}", policy(1)),
+        (f"get_user_policies x{list_size}", "GET", "/user-policies/{user_address}",
+         [policy(i) for i in range(list_size)]),
+        ("get_user_policies_page x50", "GET", "/user-policies/{user_address}", {
+            'policies': [policy(i) for i in range(50)], 'next_after_id': 50
+        }),
+        ("submit_claim (receipt)", "POST", "/submit-claim", claim(1, receipt(1))),
+        ("get_claim_status", "GET", "/claim-status/{claim_id}", claim(1)),
+        ("get_user_portfolio", "GET", "/user-portfolio/{user_address}", {
+            'wallet_address': "0x" + "a" * 40, 'policy_count': 12, 'active_policy_count': 9,
+            'total_coverage': 90000.0, 'total_premium': 1350.0, 'open_claim_count': 2,
+            'updated_at': datetime(2024, 1, 1)
+        }),
+        ("assess_risk", "POST", "/risk-assessment", risk_assessment(1)),
+        (f"assess_risk_batch x{list_size}", "POST", "/risk-assessment/batch",
+         [risk_assessment(i) for i in range(list_size)]),
+    ]
+
+def response_fields():
+    return {
+        (method, route.path): route.response_field
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+
+async def time_path(render, payload, n_iterations):
+    timings = np.empty(n_iterations)
+    for i in range(n_iterations):
+        start = time.perf_counter()
+        await render(payload)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+async def run(n_iterations, list_size):
+    fields = response_fields()
+    for label, method, path, payload in payloads(list_size):
+        field = fields[(method, path)]
+        expected = json.loads(FastJSONResponse(payload).body)
+
+        async def generic(payload):
+            return JSONResponse(jsonable_encoder(payload)).body
+
+        async def declared(payload):
+            return JSONResponse(await serialize_response(field=field, response_content=payload)).body
+
+        async def fast(payload):
+            return FastJSONResponse(payload).body
+
+        print(f"{label}: {method} {path}")
+        baseline = None
+        for name, render in (("jsonable_encoder", generic), ("response_model", declared), ("FastJSONResponse", fast)):
+            try:
+                body = await render(payload)
+            except Exception as e:
+                # jsonable_encoder decodes bytes as UTF-8, so receipt hashes fail
+                print(f"  {name:>18}: fails with {type(e).__name__}")
+                continue
+            assert json.loads(body) == expected, f"{name} body differs for {label}"
+            timings = await time_path(render, payload, n_iterations)
+            mean = timings.mean()
+            baseline = baseline or mean
+            print(
+                f"  {name:>18}: mean {mean:9.1f} us  p50 {np.percentile(timings, 50):9.1f} us  "
+                f"p99 {np.percentile(timings, 99):9.1f} us  {baseline / mean:5.1f}x  {len(body)} bytes"
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-endpoint response serialization benchmark")
+    parser.add_argument("--iterations", type=int, default=2000, help="renders per endpoint and path")
+    parser.add_argument("--list-size", type=int, default=500, help="records in the full-list payloads")
+    args = parser.parse_args()
+    print(f"JSON backend: {'orjson ' + orjson.__version__ if orjson is not None else 'stdlib json'}")
+    asyncio.run(run(args.iterations, args.list_size))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Cold start time of the API worker and the command line tools.
+
+Each target runs in a fresh interpreter against a throwaway SQLite database,
+so the numbers include interpreter start-up and every import, as a new
+worker or cron job would see them. "api serving" is the time until the app
+answers /health; "api settled" waits until every /ready component has
+finished starting (the chain check fails fast when no node is running).
+Run from the repository root:
+
+    python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+API_STARTUP = """
+import asyncio, time
+import httpx
+started = time.perf_counter()
+from src.api import app
+
+async def main():
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            await client.get("/health")
+            print(f"serving {(time.perf_counter() - started) * 1000:.1f}")
+            while any(c['status'] == 'pending' for c in (await client.get("/ready")).json()['components'].values()):
+                await asyncio.sleep(0.01)
+            print(f"settled {(time.perf_counter() - started) * 1000:.1f}")
+
+asyncio.run(main())
+"""
+
+TARGETS = (
+    ("interpreter", ["-c", "pass"]),
+    ("import src.api", ["-c", "import src.api"]),
+    ("policy_expiration --help", ["-m", "src.policy_expiration", "--help"]),
+    ("portfolio_rerating --help", ["-m", "src.portfolio_rerating", "--help"]),
+    ("bulk_ingestion --help", ["-m", "src.bulk_ingestion", "--help"]),
+    ("blockchain_events --help", ["-m", "src.blockchain_events", "--help"]),
+    ("migrations", ["-m", "src.migrations"]),
+)
+
+def run(args, env):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr}")
+    return elapsed, result.stdout
+
+def main(repeat=5):
+    work_dir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{work_dir}/startup.db",
+        MODEL_PATH=f"{work_dir}/missing.joblib",
+        LOG_LEVEL="CRITICAL",  # keep log records out of the timings on stdout
+        LOG_TO_FILE="false"
+    )
+    for name, args in TARGETS:
+        timings = np.array([run(args, env)[0] for _ in range(repeat)])
+        print(f"{name:>28}: median {np.median(timings):7.1f} ms  min {timings.min():7.1f} ms")
+
+    phases = {'serving': [], 'settled': []}
+    for _ in range(repeat):
+        _, stdout = run(["-c", API_STARTUP], env)
+        for line in stdout.splitlines():
+            phase, _, value = line.partition(" ")
+            if phase in phases:
+                phases[phase].append(float(value))
+    for phase, timings in phases.items():
+        timings = np.array(timings)
+        print(f"{'api ' + phase:>28}: median {np.median(timings):7.1f} ms  min {timings.min():7.1f} ms  (after interpreter start)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,17 +1,170 @@
-from fastapi import FastAPI, HTTPException, Depends, Security
+import asyncio
+import hmac
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Optional, Union
+from fastapi import FastAPI, HTTPException, Depends, Security, Query, Request, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from .insurance_manager import InsuranceManager
+from .async_insurance_manager import AsyncInsuranceManager
 from .blockchain_events import BlockchainEventManager
+from .bulk_ingestion import BulkApplicationIngester
+from .policy_expiration import PolicyExpirationSweeper
+from .evidence_store import EvidenceStore
+from .idempotency import IdempotencyStore, fingerprint
+from .serialization import FastJSONResponse, dumps, to_jsonable
+from .micro_batcher import RiskScoringBatcher
+from .transaction_manager import ReceiptReconciler
+from .cache import query_cache
+from .database import pool_stats, check_connection, replica_router
+from .logger import request_id_var
+from .metrics import metrics
+from .readiness import Readiness
+from .config import settings
+from .models import PolicyStatus, ClaimStatus
+from .exceptions import IdempotencyError
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    """
+    Accept connections right away and bring the model, database and chain up in the background
+
+    Until they are up /ready answers 503; /health only says the process is alive.
+    """
+    for component in ("risk_model", "database", "blockchain"):
+        readiness.pending(component)
+    # Other workers' invalidations start arriving here, not when the module is imported
+    await asyncio.to_thread(query_cache.start)
+    tasks = [asyncio.create_task(_bring_up_components())]
+    if settings.EVENT_INGESTION_ENABLED:
+        event_manager = BlockchainEventManager(insurance_manager.smart_contract)
+        metrics.register_gauges("event_ingester", event_manager.progress)
+        tasks.append(asyncio.create_task(event_manager.monitor_events()))
+    if settings.EXPIRATION_SWEEP_ENABLED:
+        tasks.append(asyncio.create_task(PolicyExpirationSweeper().run()))
+    tasks.append(asyncio.create_task(idempotency_store.run_purge()))
+    model_registry.install_reload_signal(asyncio.get_running_loop())
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await risk_batcher.close()
+        async_manager.shutdown()
+        query_cache.close()
+
+async def _bring_up_components():
+    # Each component retries with backoff until it is up
+    await asyncio.gather(
+        readiness.bring_up(
+            "risk_model",
+            lambda: model_registry.preload()['version'] is not None,
+            f"no model artifact at {model_registry.model_path}"
+        ),
+        readiness.bring_up("database", check_connection),
+        _bring_up_chain()
+    )
+
+async def _bring_up_chain():
+    await readiness.bring_up(
+        "blockchain",
+        insurance_manager.smart_contract.is_connected,
+        f"node {settings.BLOCKCHAIN_NODE_URL} is unreachable"
+    )
+    if insurance_manager.transaction_manager is not None:
+        # Pending transactions live in the database; ones left by a stopped worker are leased once it lapses
+        await ReceiptReconciler(insurance_manager.transaction_manager).run()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+readiness = Readiness()
 insurance_manager = InsuranceManager(
-    contract_address="YOUR_CONTRACT_ADDRESS",
-    abi_path="path/to/contract_abi.json"
+    contract_address=settings.CONTRACT_ADDRESS,
+    abi_path=settings.CONTRACT_ABI_PATH
+)
+model_registry = insurance_manager.risk_assessor
+async_manager = AsyncInsuranceManager(insurance_manager)
+risk_batcher = RiskScoringBatcher(
+    insurance_manager.risk_assessor,
+    window_ms=settings.RISK_BATCH_WINDOW_MS,
+    max_batch_size=settings.RISK_BATCH_MAX_SIZE,
+    executor=async_manager.executor
 )
 
+evidence_store = EvidenceStore()
+idempotency_store = IdempotencyStore()
+
 security = HTTPBearer()
 
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose body is produced while the request body is still being read
+    
+    StreamingResponse listens on receive() for a client disconnect, which
+    swallows the request body chunks the generator is waiting for.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+metrics.register_gauges("db_pool", pool_stats)
+metrics.register_gauges("db_replicas", replica_router.stats)
+metrics.register_gauges("cache", query_cache.stats)
+metrics.register_gauges("risk_batcher", risk_batcher.stats)
+metrics.register_gauges("risk_model", model_registry.info)
+metrics.register_gauges("evidence", evidence_store.stats)
+metrics.register_gauges("fraud_screening", insurance_manager.fraud_screener.stats)
+metrics.register_gauges("idempotency", idempotency_store.stats)
+if insurance_manager.transaction_manager is not None:
+    metrics.register_gauges("transactions", lambda: {
+        'pending': insurance_manager.transaction_manager.pending_count()
+    })
+
+class RequestContextMiddleware:
+    """
+    Tag each request with an id for logging and time it into the request histogram
+    
+    A plain ASGI middleware rather than @app.middleware("http"): that wrapper
+    re-streams the response and listens for disconnects on receive(), which
+    swallows request body chunks the bulk endpoint reads while responding.
+    """
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Every log record written while serving the request carries its id
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status = 500
+        
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+            if settings.METRICS_ENABLED:
+                # Label by endpoint function rather than raw path so ids don't explode cardinality
+                endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+                metrics.request_seconds.labels(endpoint, scope["method"], str(status)).observe(
+                    time.perf_counter() - started
+                )
+
+app.add_middleware(RequestContextMiddleware)
+
 class UserData(BaseModel):
     wallet_address: str
     age: int
@@ -34,50 +187,268 @@ class RiskAssessmentRequest(BaseModel):
     user_data: UserData
     additional_documents: list[str] = []
 
-@app.post("/apply-insurance")
-async def apply_insurance(user_data: UserData):
+class BatchRiskAssessmentRequest(BaseModel):
+    users: list[UserData]
+
+class ModelSwapRequest(BaseModel):
+    artifact: Optional[str] = None  # file name inside MODEL_DIR; the configured MODEL_PATH when unset
+    version: Optional[str] = None
+
+# Response models document the payloads in OpenAPI. Hot endpoints return
+# FastJSONResponse directly with the manager's dict, which FastAPI passes
+# through without validating it against the model or re-encoding it;
+# tests/test_api_responses.py keeps the two in step.
+class PolicyResponse(BaseModel):
+    policy_id: Optional[str]
+    chain_policy_id: Optional[str]
+    risk_score: Optional[float]
+    premium: Optional[float]
+    contract_address: Optional[str]
+    status: PolicyStatus
+    tx_hash: Optional[str]
+
+class PolicyPage(BaseModel):
+    policies: list[PolicyResponse]
+    next_after_id: Optional[int]
+
+class ClaimResponse(BaseModel):
+    claim_id: str
+    policy_id: int
+    amount: float
+    status: ClaimStatus
+    evidence_hash: Optional[str]
+    tx_hash: Optional[str]
+    created_at: Optional[datetime]
+    result: Optional[dict[str, Any]]  # chain receipt, or the pending transaction hash
+
+class PortfolioResponse(BaseModel):
+    wallet_address: str
+    policy_count: int
+    active_policy_count: int
+    total_coverage: float
+    total_premium: float
+    open_claim_count: int
+    updated_at: Optional[datetime]
+
+class RiskAssessmentResponse(BaseModel):
+    risk_score: float
+    risk_factors: list[str]
+    model_version: Optional[str]
+
+class EvidenceRecord(BaseModel):
+    evidence_hash: str
+    sha256: str
+    size: Optional[int]
+    filename: Optional[str]
+    content_type: Optional[str]
+    created_at: Optional[datetime]
+
+class EvidenceUpload(EvidenceRecord):
+    deduplicated: bool
+
+def require_admin(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+    Admit only the configured ADMIN_API_TOKEN; without one the admin endpoints are disabled
+    """
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not hmac.compare_digest(credentials.credentials.encode(), settings.ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+async def _run_idempotent(key, payload, operation):
+    """
+    Run operation once per key and replay its response to retries; no key means no deduplication
+    """
+    async def encoded():
+        # Stored as JSON, so encode up front and replays match the first response exactly
+        return to_jsonable(await operation())
+
+    if key is None:
+        return FastJSONResponse(await operation())
+    response, replayed = await idempotency_store.run(key, fingerprint(payload), encoded)
+    if replayed:
+        return FastJSONResponse(response, headers={'Idempotent-Replayed': 'true'})
+    return FastJSONResponse(response)
+
+@app.post("/apply-insurance", response_model=PolicyResponse)
+async def apply_insurance(user_data: UserData, idempotency_key: Optional[str] = Header(None)):
+    async def apply():
+        risk_result = await risk_batcher.score(application)
+        return await async_manager.process_insurance_application(application, risk_result)
+
+    application = user_data.dict()
+    key = f"apply-insurance:{idempotency_key}" if idempotency_key else None
     try:
-        result = insurance_manager.process_insurance_application(user_data.dict())
-        return result
+        return await _run_idempotent(key, application, apply)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/submit-claim")
+@app.post("/apply-insurance/bulk")
+async def apply_insurance_bulk(
+    request: Request,
+    input_format: Optional[str] = Query(None, alias="format", pattern="^(csv|ndjson)$")
+):
+    """
+    Stream CSV or NDJSON applications in; stream one NDJSON result per row back, then a summary
+    """
+    if input_format is None:
+        input_format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    ingester = BulkApplicationIngester(insurance_manager)
+    results = ingester.ingest_async(_request_lines(request), input_format)
+    return DuplexStreamingResponse(_ndjson_lines(results), media_type="application/x-ndjson")
+
+async def _request_lines(request):
+    buffer = b""
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.decode("utf-8", errors="replace")
+
+@app.post("/submit-claim", response_model=ClaimResponse)
 async def submit_claim(claim_data: ClaimData):
+    claim = claim_data.dict()
+    # Always keyed by claim_id: another key for the same claim would let a retry reach the chain twice
+    key = f"submit-claim:{claim['claim_id']}"
+    try:
+        return await _run_idempotent(key, claim, lambda: async_manager.submit_claim(claim))
+    except IdempotencyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/evidence", response_model=EvidenceUpload)
+async def upload_evidence(request: Request, filename: Optional[str] = None):
+    """
+    Stream an evidence file (the raw request body) to IPFS; returns the evidence_hash for /submit-claim
+    
+    Send X-Content-SHA256 to skip the upload entirely when that content is already stored.
+    """
     try:
-        result = insurance_manager.submit_claim(claim_data.dict())
-        return result
+        return FastJSONResponse(await evidence_store.store(
+            request.stream(),
+            filename,
+            request.headers.get("content-type"),
+            request.headers.get("x-content-sha256")
+        ))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/policy/{policy_id}")
+@app.get("/evidence/{sha256}", response_model=EvidenceRecord)
+async def get_evidence(sha256: str):
+    record = await asyncio.to_thread(evidence_store.lookup, sha256.lower())
+    if record is None:
+        raise HTTPException(status_code=404, detail="Evidence not found")
+    return FastJSONResponse(record)
+
+@app.get("/policy/{policy_id}", response_model=PolicyResponse)
 async def get_policy(policy_id: str, credentials: HTTPAuthorizationCredentials = Security(security)):
     try:
-        policy = insurance_manager.get_policy_details(policy_id)
-        return policy
+        policy = await async_manager.get_policy_details(policy_id)
+        return FastJSONResponse(policy)
     except Exception as e:
         raise HTTPException(status_code=404, detail="Policy not found")
 
-@app.get("/user-policies/{user_address}")
-async def get_user_policies(user_address: str):
+@app.get("/user-policies/{user_address}", response_model=Union[PolicyPage, list[PolicyResponse]])
+async def get_user_policies(
+    user_address: str,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    status: Optional[PolicyStatus] = None,
+    start_from: Optional[datetime] = None,
+    start_to: Optional[datetime] = None,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")
+):
     try:
-        policies = insurance_manager.get_user_policies(user_address)
-        return policies
+        if response_format == "ndjson":
+            policies = async_manager.stream_user_policies(user_address, status, start_from, start_to)
+            return StreamingResponse(_ndjson_lines(policies), media_type="application/x-ndjson")
+        # Pagination or filters return a page with a keyset cursor; a bare call keeps the full list
+        if any(value is not None for value in (after_id, limit, status, start_from, start_to)):
+            return FastJSONResponse(await async_manager.get_user_policies_page(
+                user_address, after_id, limit, status, start_from, start_to
+            ))
+        policies = await async_manager.get_user_policies(user_address)
+        return FastJSONResponse(policies)
     except Exception as e:
         raise HTTPException(status_code=404, detail="No policies found")
 
-@app.post("/risk-assessment")
+@app.get("/user-portfolio/{user_address}", response_model=PortfolioResponse)
+async def get_user_portfolio(user_address: str):
+    """
+    Policy counts, active coverage and premium, and open claims for a wallet, from one summary row
+    """
+    try:
+        return FastJSONResponse(await async_manager.get_portfolio_summary(user_address))
+    except Exception as e:
+        raise HTTPException(status_code=404, detail="User not found")
+
+async def _ndjson_lines(records):
+    async for record in records:
+        yield dumps(record) + b"\n"
+
+@app.post("/risk-assessment", response_model=RiskAssessmentResponse)
 async def assess_risk(request: RiskAssessmentRequest):
     try:
-        risk_assessment = insurance_manager.risk_assessor.analyze_user_risk(request.user_data.dict())
-        return risk_assessment
+        risk_assessment = await risk_batcher.score(request.user_data.dict())
+        return FastJSONResponse(risk_assessment)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/risk-assessment/batch", response_model=list[RiskAssessmentResponse])
+async def assess_risk_batch(request: BatchRiskAssessmentRequest):
+    try:
+        risk_assessments = await async_manager.run_cpu_bound(
+            model_registry.analyze_batch,
+            [user_data.dict() for user_data in request.users]
+        )
+        return FastJSONResponse(risk_assessments)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/claim-status/{claim_id}")
+@app.get("/risk-assessment/batch-stats")
+async def get_risk_batch_stats():
+    return risk_batcher.stats()
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return query_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/model", dependencies=[Depends(require_admin)])
+async def get_model_info():
+    return model_registry.info()
+
+@app.post("/admin/model", dependencies=[Depends(require_admin)])
+async def swap_model(request: ModelSwapRequest):
+    """
+    Hot-swap this worker to a compiled artifact in MODEL_DIR; requests keep scoring while it loads
+    """
+    try:
+        return await asyncio.to_thread(model_registry.swap_artifact, request.artifact, request.version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/health")
+async def health():
+    return {'status': 'ok'}
+
+@app.get("/ready")
+async def ready():
+    report = readiness.report()
+    return FastJSONResponse(report, status_code=200 if report['ready'] else 503)
+
+@app.get("/claim-status/{claim_id}", response_model=ClaimResponse)
 async def get_claim_status(claim_id: str):
     try:
-        status = insurance_manager.get_claim_status(claim_id)
-        return status
+        status = await async_manager.get_claim_status(claim_id)
+        return FastJSONResponse(status)
     except Exception as e:
         raise HTTPException(status_code=404, detail="Claim not found") 
\ No newline at end of file
@@ -0,0 +1,274 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from .models import User, Policy, Claim, PolicyStatus, ClaimStatus
+from .database import get_async_db, get_async_read_db
+from .cache import policy_key, claim_key, user_policies_key, portfolio_key
+from .portfolio_summary import portfolio_query, format_portfolio
+from .metrics import stage_timer
+from .exceptions import PolicyError, ClaimError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("async_insurance_manager")
+
+class AsyncInsuranceManager:
+    """
+    Event-loop friendly execution path for InsuranceManager
+
+    Database access goes through async sessions, chain calls through the async
+    Web3 provider, and CPU-bound scoring through a bounded thread pool, so one
+    slow request no longer stalls the others in the worker.
+    """
+    def __init__(self, insurance_manager, max_workers=None):
+        self.manager = insurance_manager
+        self.risk_assessor = insurance_manager.risk_assessor
+        self.smart_contract = insurance_manager.smart_contract
+        self.transaction_manager = insurance_manager.transaction_manager
+        self.fraud_screener = insurance_manager.fraud_screener
+        self.cache = insurance_manager.cache
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or settings.RISK_SCORING_WORKERS,
+            thread_name_prefix="risk-scoring"
+        )
+
+    async def run_cpu_bound(self, func, *args):
+        """
+        Run CPU-bound work on the bounded scoring executor
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def process_insurance_application(self, user_data, risk_result=None):
+        try:
+            logger.info("Processing insurance application for user: %s", user_data['wallet_address'])
+
+            async with get_async_db() as db:
+                # Create or get user
+                with stage_timer("async_insurance_manager", "get_or_create_user"):
+                    user = await self._get_or_create_user(db, user_data)
+
+                # Perform risk assessment unless the caller already scored this user
+                if risk_result is None:
+                    with stage_timer("async_insurance_manager", "analyze_user_risk"):
+                        risk_result = await self.run_cpu_bound(self.risk_assessor.analyze_user_risk, user_data)
+
+                # Store risk assessment
+                premium, policy_details = self.manager._stage_risk_assessment(db, user, user_data, risk_result)
+
+                # Create blockchain contract
+                if self.transaction_manager is not None:
+                    # Return right away; the receipt reconciler activates the policy
+                    with stage_timer("async_insurance_manager", "submit_policy_transaction"):
+                        contract_result = await self._submit_policy_transaction(db, user_data, policy_details)
+                    status = PolicyStatus.PENDING
+                else:
+                    with stage_timer("async_insurance_manager", "create_insurance_contract"):
+                        receipt = await self.smart_contract.create_insurance_contract_async(
+                            user_data['wallet_address'],
+                            policy_details
+                        )
+                    contract_result = self.manager._policy_contract_result(receipt)
+                    status = PolicyStatus.ACTIVE
+
+                # Store policy
+                policy, changes = self.manager._stage_policy(db, user, contract_result, user_data, premium, status)
+                await db.run_sync(changes.apply)
+                with stage_timer("async_insurance_manager", "commit_policy"):
+                    await db.commit()
+                return self.manager._policy_created(policy, user_data, risk_result)
+
+        except Exception as e:
+            logger.error("Error processing insurance application: %s", e)
+            raise PolicyError(f"Failed to process insurance application: {str(e)}")
+
+    async def submit_claim(self, claim_data):
+        try:
+            logger.info(
+                "Processing claim for policy: %s", claim_data['policy_id'],
+                extra={'policy_id': claim_data['policy_id'], 'claim_id': claim_data['claim_id']}
+            )
+
+            async with get_async_db() as db:
+                # Validate policy
+                with stage_timer("async_insurance_manager", "validate_policy"):
+                    policy = await self._validate_policy_for_claim(db, claim_data)
+
+                # Screen against the claim aggregates before anything goes on-chain
+                with stage_timer("async_insurance_manager", "fraud_screening"):
+                    await self.fraud_screener.screen_async(db, policy, claim_data)
+
+                claim_result = {}
+                if self.transaction_manager is not None:
+                    with stage_timer("async_insurance_manager", "submit_claim_transaction"):
+                        claim_result = await self._submit_claim_transaction(db, claim_data)
+
+                # Store claim as pending
+                claim, changes = self.manager._stage_claim(db, policy, claim_data, claim_result)
+                stale_keys = await db.run_sync(changes.apply)
+                with stage_timer("async_insurance_manager", "commit_claim"):
+                    await db.commit()
+                self.cache.invalidate(claim_key(claim.claim_id), *stale_keys)
+
+                # Process claim on blockchain, after the commit released the aggregate rows screening locked
+                if self.transaction_manager is None:
+                    claim_result = await self._process_claim_on_chain(db, claim_data)
+
+                return self.manager._claim_submitted(claim, claim_data, claim_result)
+
+        except Exception as e:
+            logger.error("Error processing claim: %s", e)
+            raise ClaimError(f"Failed to process claim: {str(e)}")
+
+    async def get_policy_details(self, policy_id: str):
+        try:
+            return await self.cache.get_or_load_async(
+                policy_key(policy_id),
+                lambda: self._fetch_policy_details(policy_id)
+            )
+        except Exception as e:
+            logger.error("Error fetching policy details: %s", e)
+            raise PolicyError(f"Failed to fetch policy details: {str(e)}")
+
+    async def get_user_policies(self, wallet_address: str):
+        try:
+            return await self.cache.get_or_load_async(
+                user_policies_key(wallet_address),
+                lambda: self._fetch_user_policies(wallet_address)
+            )
+        except Exception as e:
+            logger.error("Error fetching user policies: %s", e)
+            raise PolicyError(f"Failed to fetch user policies: {str(e)}")
+
+    async def get_user_policies_page(self, wallet_address: str, after_id=None, limit=None,
+                                     status=None, start_from=None, start_to=None):
+        try:
+            async with self._read_db(user_policies_key(wallet_address)) as db:
+                policies = (await db.scalars(self.manager._user_policies_query(
+                    wallet_address, after_id, limit, status, start_from, start_to
+                ))).all()
+                return self.manager._format_policy_page(policies)
+        except Exception as e:
+            logger.error("Error fetching user policies page: %s", e)
+            raise PolicyError(f"Failed to fetch user policies: {str(e)}")
+
+    async def stream_user_policies(self, wallet_address: str, status=None, start_from=None, start_to=None):
+        """
+        Yield every matching policy page by page so memory stays flat for large portfolios
+        """
+        after_id = None
+        while True:
+            page = await self.get_user_policies_page(
+                wallet_address, after_id, settings.USER_POLICIES_MAX_PAGE_SIZE, status, start_from, start_to
+            )
+            for policy in page['policies']:
+                yield policy
+            after_id = page['next_after_id']
+            if after_id is None or len(page['policies']) < settings.USER_POLICIES_MAX_PAGE_SIZE:
+                return
+
+    async def get_claim_status(self, claim_id: str):
+        try:
+            return await self.cache.get_or_load_async(
+                claim_key(claim_id),
+                lambda: self._fetch_claim_status(claim_id)
+            )
+        except Exception as e:
+            logger.error("Error fetching claim status: %s", e)
+            raise ClaimError(f"Failed to fetch claim status: {str(e)}")
+
+    async def get_portfolio_summary(self, wallet_address: str):
+        try:
+            return await self.cache.get_or_load_async(
+                portfolio_key(wallet_address),
+                lambda: self._fetch_portfolio_summary(wallet_address)
+            )
+        except Exception as e:
+            logger.error("Error fetching portfolio summary: %s", e)
+            raise PolicyError(f"Failed to fetch portfolio summary: {str(e)}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+    # Helper methods
+    def _read_db(self, cache_key):
+        return get_async_read_db(prefer_primary=self.cache.written_recently(cache_key))
+
+    async def _fetch_policy_details(self, policy_id):
+        async with self._read_db(policy_key(policy_id)) as db:
+            policy = await db.scalar(select(Policy).filter_by(policy_id=policy_id))
+            if not policy:
+                raise PolicyError("Policy not found")
+            return self.manager._format_policy_response(policy)
+
+    async def _fetch_user_policies(self, wallet_address):
+        async with self._read_db(user_policies_key(wallet_address)) as db:
+            policies = await db.scalars(self.manager._user_policies_query(wallet_address, limit=0))
+            return [self.manager._format_policy_response(policy) for policy in policies]
+
+    async def _fetch_claim_status(self, claim_id):
+        async with self._read_db(claim_key(claim_id)) as db:
+            claim = await db.scalar(select(Claim).filter_by(claim_id=claim_id))
+            if not claim:
+                raise ClaimError("Claim not found")
+            return self.manager._format_claim_response(claim)
+
+    async def _fetch_portfolio_summary(self, wallet_address):
+        async with self._read_db(portfolio_key(wallet_address)) as db:
+            row = (await db.execute(portfolio_query(wallet_address))).first()
+            if row is None:
+                raise PolicyError("User not found")
+            return format_portfolio(row)
+
+    async def _get_or_create_user(self, db, user_data):
+        user = await db.scalar(select(User).filter_by(wallet_address=user_data['wallet_address']))
+        if not user:
+            user = self.manager._build_user(user_data)
+            db.add(user)
+        # Also ends the lookup's transaction, so scoring and the receipt wait don't hold a pooled connection
+        await db.commit()
+        return user
+
+    async def _validate_policy_for_claim(self, db, claim_data):
+        policy = await db.scalar(select(Policy).filter_by(policy_id=claim_data['policy_id']))
+        if not policy:
+            raise PolicyError("Policy not found")
+        self.manager._check_policy_claimable(policy)
+        if await db.scalar(select(Claim.id).filter_by(claim_id=claim_data['claim_id'])) is not None:
+            raise ClaimError(f"Claim {claim_data['claim_id']} was already submitted")
+        return policy
+
+    async def _submit_policy_transaction(self, db, user_data, policy_details):
+        policy_key = self.manager._placeholder_policy_id()
+        tx_hash = await self.transaction_manager.submit_policy_async(
+            db,
+            policy_key,
+            user_data['wallet_address'],
+            policy_details
+        )
+        return self.manager._pending_policy_result(policy_key, tx_hash)
+
+    async def _submit_claim_transaction(self, db, claim_data):
+        tx_hash = await self.transaction_manager.submit_claim_async(db, claim_data['claim_id'], claim_data)
+        return {'tx_hash': tx_hash}
+
+    async def _process_claim_on_chain(self, db, claim_data):
+        claim_id = claim_data['claim_id']
+        try:
+            with stage_timer("async_insurance_manager", "process_claim"):
+                claim_result = self.manager._check_receipt(
+                    await self.smart_contract.process_claim_async(claim_id, claim_data)
+                )
+        except Exception:
+            await self._commit_claim_changes(db, self.manager._withdraw_claim, claim_id)
+            raise
+        await self._commit_claim_changes(
+            db, self.manager._settle_claim, claim_id, ClaimStatus.PROCESSING,
+            self.manager._receipt_tx_hash(claim_result)
+        )
+        return claim_result
+
+    async def _commit_claim_changes(self, db, change, *args):
+        stale_keys = await db.run_sync(change, *args)
+        await db.commit()
+        self.cache.invalidate(*stale_keys)
@@ -1,36 +1,202 @@
-from web3 import Web3
+from .config import settings
+from .metrics import stage_timer
+import functools
 import json
+import threading
 
 class SmartContract:
-    def __init__(self, contract_address, abi_path):
-        self.w3 = Web3(Web3.HTTPProvider('http://localhost:8545'))
+    """
+    Insurance contract client; web3, the provider and the ABI are loaded on first use
+
+    Importing web3 takes about a second and the ABI file may not be deployed
+    yet, so neither happens until a transaction, event query or connect() needs them.
+    """
+    def __init__(self, contract_address, abi_path, node_url=None):
         self.contract_address = contract_address
-        with open(abi_path) as f:
-            self.contract_abi = json.load(f)
-        self.contract = self.w3.eth.contract(
-            address=self.contract_address,
-            abi=self.contract_abi
-        )
+        self.abi_path = abi_path
+        self.node_url = node_url or settings.BLOCKCHAIN_NODE_URL
+        self._w3 = None
+        self._contract = None
+        self._connect_lock = threading.Lock()
+        self.async_w3 = None
+        self.async_contract = None
+    
+    @property
+    def w3(self):
+        if self._w3 is None:
+            self.connect()
+        return self._w3
+    
+    @property
+    def contract(self):
+        if self._contract is None:
+            self.connect()
+        return self._contract
+    
+    @property
+    def contract_abi(self):
+        return self.contract.abi
+    
+    def connect(self):
+        """
+        Import web3, read the ABI and build the contract; the provider itself connects per call
+        """
+        with self._connect_lock:
+            if self._contract is None:
+                from web3 import Web3
+                w3 = Web3(Web3.HTTPProvider(self.node_url))
+                with open(self.abi_path) as f:
+                    contract_abi = json.load(f)
+                self._contract = w3.eth.contract(address=self.contract_address, abi=contract_abi)
+                self._w3 = w3
+        return self
+    
+    def is_connected(self):
+        return self.w3.is_connected()
     
     def create_insurance_contract(self, user_address, policy_details):
         """
         Create new insurance contract on blockchain
         """
-        tx_hash = self.contract.functions.createPolicy(
+        with stage_timer("smart_contract", "create_policy_transact"):
+            tx_hash = self.contract.functions.createPolicy(
+                user_address,
+                policy_details['coverage_amount'],
+                policy_details['premium'],
+                policy_details['duration']
+            ).transact()
+        with stage_timer("smart_contract", "create_policy_receipt_wait"):
+            return self.w3.eth.wait_for_transaction_receipt(tx_hash)
+    
+    def process_claim(self, claim_id, claim_data):
+        """
+        Process insurance claim through smart contract
+        """
+        with stage_timer("smart_contract", "process_claim_transact"):
+            tx_hash = self.contract.functions.processClaim(
+                claim_id,
+                claim_data['amount'],
+                claim_data['evidence_hash']
+            ).transact()
+        with stage_timer("smart_contract", "process_claim_receipt_wait"):
+            return self.w3.eth.wait_for_transaction_receipt(tx_hash)
+    
+    def create_insurance_contracts(self, applications):
+        """
+        Create many insurance contracts: broadcast back to back with consecutive
+        nonces, then collect the receipts. applications is a list of
+        (user_address, policy_details); the result holds a receipt or the
+        exception for each one, in order. Nonces come from the shared
+        allocator, so concurrent batches and submissions never reuse one.
+        """
+        from .transaction_manager import broadcast_in_order  # imports the models and database
+        tx_hashes = broadcast_in_order(self, [
+            functools.partial(self.send_create_policy, user_address, policy_details)
+            for user_address, policy_details in applications
+        ])
+
+        results = []
+        for tx_hash in tx_hashes:
+            if isinstance(tx_hash, Exception):
+                results.append(tx_hash)
+                continue
+            try:
+                results.append(self.w3.eth.wait_for_transaction_receipt(tx_hash))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def created_policy_id(self, receipt):
+        """
+        On-chain policy id from a createPolicy receipt, or None if it emitted no PolicyCreated event
+        """
+        from web3.logs import DISCARD
+        events = self.contract.events.PolicyCreated().process_receipt(receipt, errors=DISCARD)
+        if not events:
+            return None
+        return str(events[0].args.policyId)
+    
+    def send_create_policy(self, user_address, policy_details, nonce, gas_price):
+        """
+        Broadcast a policy creation transaction and return its hash without waiting
+        """
+        function = self.contract.functions.createPolicy(
             user_address,
             policy_details['coverage_amount'],
             policy_details['premium'],
             policy_details['duration']
-        ).transact()
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash)
+        )
+        with stage_timer("smart_contract", "create_policy_transact"):
+            return function.transact(self._tx_params(function, nonce, gas_price)).hex()
     
-    def process_claim(self, claim_id, claim_data):
+    def send_process_claim(self, claim_id, claim_data, nonce, gas_price):
         """
-        Process insurance claim through smart contract
+        Broadcast a claim processing transaction and return its hash without waiting
         """
-        tx_hash = self.contract.functions.processClaim(
+        function = self.contract.functions.processClaim(
             claim_id,
             claim_data['amount'],
             claim_data['evidence_hash']
-        ).transact()
-        return self.w3.eth.wait_for_transaction_receipt(tx_hash) 
\ No newline at end of file
+        )
+        with stage_timer("smart_contract", "process_claim_transact"):
+            return function.transact(self._tx_params(function, nonce, gas_price)).hex()
+    
+    def send_cancel(self, nonce, gas_price):
+        """
+        Broadcast a zero-value transfer from the sender to itself, replacing whatever is pending at nonce
+        """
+        sender = self.sender_address
+        with stage_timer("smart_contract", "cancel_transact"):
+            return self.w3.eth.send_transaction({
+                'from': sender, 'to': sender, 'value': 0, 'nonce': nonce, 'gasPrice': gas_price, 'gas': 21000
+            }).hex()
+    
+    @property
+    def sender_address(self):
+        return settings.TX_SENDER_ADDRESS or self.w3.eth.default_account or self.w3.eth.accounts[0]
+    
+    def _tx_params(self, function, nonce, gas_price):
+        # Estimate without the nonce: nodes may reject estimates for nonces still in flight
+        sender = self.sender_address
+        gas = function.estimate_gas({'from': sender})
+        return {'from': sender, 'nonce': nonce, 'gasPrice': gas_price, 'gas': gas}
+    
+    async def create_insurance_contract_async(self, user_address, policy_details):
+        """
+        Create new insurance contract without blocking the event loop
+        """
+        contract = self._get_async_contract()
+        with stage_timer("smart_contract", "create_policy_transact"):
+            tx_hash = await contract.functions.createPolicy(
+                user_address,
+                policy_details['coverage_amount'],
+                policy_details['premium'],
+                policy_details['duration']
+            ).transact()
+        with stage_timer("smart_contract", "create_policy_receipt_wait"):
+            return await self.async_w3.eth.wait_for_transaction_receipt(tx_hash)
+    
+    async def process_claim_async(self, claim_id, claim_data):
+        """
+        Process insurance claim without blocking the event loop
+        """
+        contract = self._get_async_contract()
+        with stage_timer("smart_contract", "process_claim_transact"):
+            tx_hash = await contract.functions.processClaim(
+                claim_id,
+                claim_data['amount'],
+                claim_data['evidence_hash']
+            ).transact()
+        with stage_timer("smart_contract", "process_claim_receipt_wait"):
+            return await self.async_w3.eth.wait_for_transaction_receipt(tx_hash)
+    
+    def _get_async_contract(self):
+        # Async provider talks to the same node as the sync one
+        if self.async_contract is None:
+            from web3 import AsyncWeb3
+            self.async_w3 = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(self.w3.provider.endpoint_uri))
+            self.async_contract = self.async_w3.eth.contract(
+                address=self.contract_address,
+                abi=self.contract_abi
+            )
+        return self.async_contract
\ No newline at end of file
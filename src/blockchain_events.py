@@ -1,52 +1,402 @@
-from web3 import Web3
+import argparse
 import asyncio
+import json
+import time
 from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.orm import selectinload
+from .models import User, Policy, Claim, PolicyStatus, ClaimStatus, EventCheckpoint, PendingTransaction
+from .database import get_db_session
+from .config import settings
+from .cache import query_cache, policy_key, claim_key, user_policies_key
+from .fraud_screening import record_external_claim, record_status_change
+from .portfolio_summary import PortfolioChanges
+from .metrics import stage_timer
+from .logger import setup_logger
+
+logger = setup_logger("blockchain_events")
+
+CHECKPOINT_NAME = "insurance_contract"
+
+# On-chain claim status codes, in contract enum order
+CLAIM_STATUS_CODES = [ClaimStatus.PENDING, ClaimStatus.APPROVED, ClaimStatus.REJECTED, ClaimStatus.PROCESSING]
 
 class BlockchainEventManager:
-    def __init__(self, smart_contract):
+    def __init__(self, smart_contract, start_block=None, confirmations=None,
+                 batch_blocks=None, max_batch_blocks=None):
         self.contract = smart_contract.contract
         self.w3 = smart_contract.w3
-        
-    async def monitor_events(self):
+        self.start_block = settings.EVENT_START_BLOCK if start_block is None else start_block
+        self.confirmations = settings.EVENT_CONFIRMATIONS if confirmations is None else confirmations
+        self.batch_blocks = batch_blocks or settings.EVENT_BATCH_BLOCKS
+        self.max_batch_blocks = max_batch_blocks or settings.EVENT_MAX_BATCH_BLOCKS
+        self.blocks_processed = 0
+        self.events_processed = 0
+        self.busy_seconds = 0.0
+        self.last_block = None
+
+    async def monitor_events(self, poll_interval=None):
         """
-        Monitor blockchain events
+        Ingest contract events from the persisted checkpoint onwards, forever
         """
-        policy_filter = self.contract.events.PolicyCreated.create_filter(fromBlock='latest')
-        claim_filter = self.contract.events.ClaimProcessed.create_filter(fromBlock='latest')
-        
+        poll_interval = poll_interval or settings.EVENT_POLL_SECONDS
         while True:
-            for event in policy_filter.get_new_entries():
-                await self._handle_policy_event(event)
-            
-            for event in claim_filter.get_new_entries():
-                await self._handle_claim_event(event)
-                
-            await asyncio.sleep(10)
-    
-    async def _handle_policy_event(self, event):
+            try:
+                caught_up = await asyncio.to_thread(self.ingest_next_range)
+            except Exception as e:
+                logger.error("Error ingesting blockchain events: %s", e)
+                caught_up = True
+            # Keep going without sleeping while there is a backlog to catch up on
+            if caught_up:
+                await asyncio.sleep(poll_interval)
+
+    def backfill(self, to_block=None):
+        """
+        Catch up to to_block (default: the confirmed head) as fast as possible
+        """
+        while not self.ingest_next_range(to_block):
+            pass
+        stats = self.stats()
+        logger.info(
+            "Backfill finished at block %s: %.0f blocks/sec, %.0f events/sec",
+            stats['last_block'], stats['blocks_per_second'], stats['events_per_second']
+        )
+        return stats
+
+    def ingest_next_range(self, to_block=None):
+        """
+        Ingest the next block range after the checkpoint; returns True once caught up
+        """
+        started = time.perf_counter()
+        safe_head = self.w3.eth.block_number - self.confirmations
+        target = safe_head if to_block is None else min(to_block, safe_head)
+
+        # Read the checkpoint and fetch the logs without holding a session or its lock
+        position = self._read_checkpoint()
+        last_block, last_block_hash = position
+        if last_block_hash and last_block >= 0 and self.w3.eth.get_block(last_block).hash.hex() != last_block_hash:
+            self._rewind(position)
+            return False
+        from_block = last_block + 1
+        if from_block > target:
+            return True
+
+        range_end = min(from_block + self.batch_blocks - 1, target)
+        try:
+            with stage_timer("event_ingester", "get_logs"):
+                policy_logs = self.contract.events.PolicyCreated.get_logs(fromBlock=from_block, toBlock=range_end)
+                claim_logs = self.contract.events.ClaimProcessed.get_logs(fromBlock=from_block, toBlock=range_end)
+        except Exception as e:
+            # Providers cap log responses; retry the same start with a smaller range
+            if self.batch_blocks == 1:
+                raise
+            self.batch_blocks = max(1, self.batch_blocks // 2)
+            logger.info("Shrinking event range to %d blocks after: %s", self.batch_blocks, e)
+            return False
+        range_end_hash = self.w3.eth.get_block(range_end).hash.hex()
+        policy_events = [self._handle_policy_event(event) for event in policy_logs]
+        claim_events = [self._handle_claim_event(event) for event in claim_logs]
+
+        with get_db_session() as db:
+            checkpoint = self._load_checkpoint(db)
+            if (checkpoint.last_block, checkpoint.last_block_hash) != position:
+                # Another ingester moved the checkpoint while the logs were fetched
+                return False
+            changes = PortfolioChanges()
+            stale_keys = self._upsert_policies(db, policy_events, changes)
+            # Sessions don't autoflush; claims in this range may reference these policies
+            db.flush()
+            stale_keys += self._upsert_claims(db, claim_events, changes)
+            stale_keys += changes.apply(db)
+
+            checkpoint.last_block = range_end
+            checkpoint.last_block_hash = range_end_hash
+            with stage_timer("event_ingester", "commit"):
+                db.commit()
+        query_cache.invalidate(*stale_keys)
+        self.last_block = range_end
+
+        self.batch_blocks = min(self.batch_blocks * 2, self.max_batch_blocks)
+        self.blocks_processed += range_end - from_block + 1
+        self.events_processed += len(policy_logs) + len(claim_logs)
+        self.busy_seconds += time.perf_counter() - started
+        return range_end >= target
+
+    def progress(self):
+        """
+        In-memory counters, cheap enough to read on every metrics scrape
+        """
+        return {
+            'last_block': self.last_block,
+            'blocks_processed': self.blocks_processed,
+            'events_processed': self.events_processed,
+            'busy_seconds': self.busy_seconds,
+            'batch_blocks': self.batch_blocks
+        }
+
+    def stats(self):
+        with get_db_session() as db:
+            checkpoint = db.get(EventCheckpoint, CHECKPOINT_NAME)
+        busy = self.busy_seconds or float('inf')
+        return {
+            'last_block': checkpoint.last_block if checkpoint else None,
+            'blocks_processed': self.blocks_processed,
+            'events_processed': self.events_processed,
+            'blocks_per_second': self.blocks_processed / busy,
+            'events_per_second': self.events_processed / busy,
+            'batch_blocks': self.batch_blocks
+        }
+
+    def _read_checkpoint(self):
+        """
+        (last_block, last_block_hash) of the checkpoint, read without locking it
+        """
+        with get_db_session() as db:
+            checkpoint = db.get(EventCheckpoint, CHECKPOINT_NAME)
+            if checkpoint is None:
+                return self.start_block - 1, None
+            return checkpoint.last_block, checkpoint.last_block_hash
+
+    def _load_checkpoint(self, db):
+        checkpoint = db.get(EventCheckpoint, CHECKPOINT_NAME, with_for_update=True)
+        if checkpoint is None:
+            checkpoint = EventCheckpoint(name=CHECKPOINT_NAME, last_block=self.start_block - 1)
+            db.add(checkpoint)
+        return checkpoint
+
+    def _rewind(self, position):
+        """
+        Step back past a reorg that went deeper than the confirmation depth
+
+        Rows written from events after the rewind point go back to pending and
+        lose their on-chain policy id; replaying the range confirms the ones
+        whose events are still on the canonical chain. The checkpoint keeps
+        the canonical hash of the rewind point, so the next cycle verifies it
+        too and keeps stepping back if the chain changes below it.
+        """
+        last_block = position[0]
+        rewind_to = max(self.start_block - 1, last_block - max(self.confirmations, 1))
+        rewind_to_hash = self.w3.eth.get_block(rewind_to).hash.hex() if rewind_to >= 0 else None
+        with get_db_session() as db:
+            checkpoint = self._load_checkpoint(db)
+            if (checkpoint.last_block, checkpoint.last_block_hash) != position:
+                return
+            logger.error("Reorg detected at block %d; rewinding to %d", last_block, rewind_to)
+            changes = PortfolioChanges()
+            stale_keys = self._unconfirm_policies(db, rewind_to, changes)
+            stale_keys += self._unconfirm_claims(db, rewind_to, changes)
+            stale_keys += changes.apply(db)
+            checkpoint.last_block = rewind_to
+            checkpoint.last_block_hash = rewind_to_hash
+            db.commit()
+        query_cache.invalidate(*stale_keys)
+        self.last_block = rewind_to
+
+    def _unconfirm_policies(self, db, after_block, changes):
+        policies = (
+            db.query(Policy).options(selectinload(Policy.user))
+            .filter(Policy.block_number > after_block).with_for_update(of=Policy).all()
+        )
+        stale_keys = []
+        for policy in policies:
+            old_status = policy.status
+            if policy.status == PolicyStatus.ACTIVE:
+                policy.status = PolicyStatus.PENDING
+            # The contract numbers policies in mining order, so the id may belong to another policy
+            # on the new chain; the replay matches this row by its transaction hash instead
+            policy.chain_policy_id = None
+            policy.block_number = None
+            changes.policy(policy, old_status)
+            stale_keys += [policy_key(policy.policy_id), user_policies_key(policy.user.wallet_address)]
+        return stale_keys
+
+    def _unconfirm_claims(self, db, after_block, changes):
+        claims = (
+            db.query(Claim).options(selectinload(Claim.policy))
+            .filter(Claim.block_number > after_block).with_for_update(of=Claim).all()
+        )
+        for claim in claims:
+            record_status_change(db, claim.policy_id, claim.amount or 0.0, claim.status, ClaimStatus.PENDING)
+            changes.claim(claim.policy, ClaimStatus.PENDING, old_status=claim.status)
+            claim.status = ClaimStatus.PENDING
+            claim.processed_at = None
+            claim.block_number = None
+        return [claim_key(claim.claim_id) for claim in claims]
+
+    def _upsert_policies(self, db, events, changes):
+        if not events:
+            return []
+        policy_ids = [event['policy_id'] for event in events]
+        tx_hashes = [event['transaction_hash'] for event in events]
+        addresses = {event['user_address'] for event in events}
+
+        existing = {
+            policy.chain_policy_id: policy
+            for policy in db.query(Policy).filter(Policy.chain_policy_id.in_(policy_ids))
+        }
+        # Policies submitted with CHAIN_SUBMISSION_MODE=fire_and_reconcile that were not reconciled yet
+        placeholders = {
+            policy.tx_hash: policy
+            for policy in db.query(Policy).filter(Policy.tx_hash.in_(tx_hashes), Policy.chain_policy_id.is_(None))
+        }
+        unmatched = [tx_hash for tx_hash in tx_hashes if tx_hash not in placeholders]
+        if unmatched:
+            placeholders.update(self._replaced_placeholders(db, unmatched))
+        users = {
+            user.wallet_address: user
+            for user in db.query(User).filter(User.wallet_address.in_(addresses))
+        }
+        taken = {row.policy_id for row in db.query(Policy.policy_id).filter(Policy.policy_id.in_(policy_ids))}
+        stale_keys = [policy_key(policy.policy_id) for policy in (*existing.values(), *placeholders.values())]
+        stale_keys += [user_policies_key(address) for address in addresses]
+
+        for event in events:
+            policy = existing.get(event['policy_id']) or placeholders.get(event['transaction_hash'])
+            old_status = None if policy is None else policy.status
+            if policy is None:
+                user = users.get(event['user_address'])
+                if user is None:
+                    user = users[event['user_address']] = User(wallet_address=event['user_address'])
+                    db.add(user)
+                policy = Policy(
+                    user=user,
+                    coverage_amount=event['coverage_amount'],
+                    start_date=event['timestamp'],
+                    contract_address=self.contract.address
+                )
+                db.add(policy)
+            # A placeholder id was already handed to the client, so only new rows take the on-chain id
+            if policy.policy_id is None:
+                # After a reorg the contract can reissue an id that a policy from an abandoned block still holds
+                policy.policy_id = event['policy_id']
+                if policy.policy_id in taken:
+                    policy.policy_id = f"{event['policy_id']}-{event['transaction_hash']}"
+                taken.add(policy.policy_id)
+                stale_keys.append(policy_key(policy.policy_id))
+            policy.chain_policy_id = event['policy_id']
+            policy.tx_hash = event['transaction_hash']
+            policy.block_number = event['block_number']
+            if policy.status in (None, PolicyStatus.PENDING):
+                policy.status = PolicyStatus.ACTIVE
+            changes.policy(policy, old_status)
+            existing[event['policy_id']] = policy
+        return stale_keys
+
+    def _replaced_placeholders(self, db, tx_hashes):
+        """
+        Pending policies whose mined transaction was a rebroadcast; Policy.tx_hash holds the first broadcast
+        """
+        rows = db.query(PendingTransaction.key, PendingTransaction.tx_hashes).filter(
+            PendingTransaction.kind == 'policy',
+            PendingTransaction.replacements > 0,
+            or_(*[PendingTransaction.tx_hashes.contains(tx_hash) for tx_hash in tx_hashes])
+        )
+        wanted = set(tx_hashes)
+        mined = {}
+        for key, broadcasts in rows:
+            for tx_hash in json.loads(broadcasts):
+                if tx_hash in wanted:
+                    mined[key] = tx_hash
+        if not mined:
+            return {}
+        return {
+            mined[policy.policy_id]: policy
+            for policy in db.query(Policy).filter(Policy.policy_id.in_(mined), Policy.chain_policy_id.is_(None))
+        }
+
+    def _upsert_claims(self, db, events, changes):
+        if not events:
+            return []
+        claim_ids = [event['claim_id'] for event in events]
+        policy_ids = {event['policy_id'] for event in events}
+
+        existing = {
+            claim.claim_id: claim
+            for claim in db.query(Claim).options(selectinload(Claim.policy)).filter(Claim.claim_id.in_(claim_ids))
+        }
+        # Whose portfolio each claim counts toward
+        owners = {claim_id: claim.policy for claim_id, claim in existing.items()}
+        policies = {
+            policy.chain_policy_id: policy
+            for policy in db.query(Policy.id, Policy.chain_policy_id, Policy.user_id).filter(
+                Policy.chain_policy_id.in_(policy_ids)
+            )
+        }
+
+        for event in events:
+            claim = existing.get(event['claim_id'])
+            if claim is None:
+                policy = policies.get(event['policy_id'])
+                if policy is None:
+                    logger.warning("Skipping claim %s for unknown policy %s", event['claim_id'], event['policy_id'])
+                    continue
+                claim = Claim(
+                    claim_id=event['claim_id'],
+                    policy_id=policy.id,
+                    amount=event['amount'],
+                    created_at=event['timestamp']
+                )
+                db.add(claim)
+                existing[event['claim_id']] = claim
+                owners[event['claim_id']] = policy
+                # Filed outside this service, so it never went through screening
+                record_external_claim(db, policy, event['amount'], event['timestamp'], event['status'])
+                changes.claim(policy, event['status'])
+            else:
+                record_status_change(db, claim.policy_id, claim.amount or 0.0, claim.status, event['status'])
+                changes.claim(owners[event['claim_id']], event['status'], old_status=claim.status)
+            claim.status = event['status']
+            claim.processed_at = event['timestamp']
+            claim.block_number = event['block_number']
+        return [claim_key(claim_id) for claim_id in claim_ids]
+
+    def _handle_policy_event(self, event):
         """
         Handle new policy creation events
         """
         event_data = {
-            'policy_id': event.args.policyId,
+            'policy_id': str(event.args.policyId),
             'user_address': event.args.userAddress,
             'coverage_amount': event.args.coverageAmount,
             'timestamp': datetime.fromtimestamp(event.args.timestamp),
-            'transaction_hash': event.transactionHash.hex()
+            'transaction_hash': event.transactionHash.hex(),
+            'block_number': event.blockNumber
         }
-        # Process event data (e.g., store in database)
         return event_data
-    
-    async def _handle_claim_event(self, event):
+
+    def _handle_claim_event(self, event):
         """
         Handle claim processing events
         """
         event_data = {
-            'claim_id': event.args.claimId,
-            'policy_id': event.args.policyId,
+            'claim_id': str(event.args.claimId),
+            'policy_id': str(event.args.policyId),
             'amount': event.args.amount,
-            'status': event.args.status,
-            'timestamp': datetime.fromtimestamp(event.args.timestamp)
+            'status': self._claim_status(event.args.status),
+            'timestamp': datetime.fromtimestamp(event.args.timestamp),
+            'block_number': event.blockNumber
         }
-        # Process event data (e.g., store in database)
-        return event_data 
\ No newline at end of file
+        return event_data
+
+    def _claim_status(self, status):
+        if isinstance(status, int):
+            return CLAIM_STATUS_CODES[status]
+        return ClaimStatus(status.lower())
+
+def main():
+    from .blockchain_contract import SmartContract
+
+    parser = argparse.ArgumentParser(description="Ingest insurance contract events")
+    parser.add_argument("--backfill", action="store_true", help="catch up to the confirmed head and exit")
+    parser.add_argument("--to-block", type=int, help="stop the backfill at this block")
+    args = parser.parse_args()
+
+    smart_contract = SmartContract(settings.CONTRACT_ADDRESS, settings.CONTRACT_ABI_PATH)
+    event_manager = BlockchainEventManager(smart_contract)
+    if args.backfill:
+        print(event_manager.backfill(args.to_block))
+    else:
+        asyncio.run(event_manager.monitor_events())
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,402 @@
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+from collections import deque
+from .models import User, PolicyStatus
+from .database import get_db_session
+from .cache import policy_key, user_policies_key
+from .portfolio_summary import PortfolioChanges
+from .serialization import dumps
+from .exceptions import ValidationError, BlockchainError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("bulk_ingestion")
+
+# Same fields and types as the /apply-insurance request body
+REQUIRED_FIELDS = {
+    'wallet_address': str,
+    'age': int,
+    'claim_history': int,
+    'risk_factors': float,
+    'requested_coverage': float,
+    'duration': int
+}
+OPTIONAL_FIELDS = {
+    'credit_score': int,
+    'occupation': str,
+    'income': float,
+    'occupation_risk': float,
+    'health_score': float
+}
+
+class _LineBuffer:
+    """
+    Iterator over the lines fed so far; unlike a generator it can be resumed after running dry
+    """
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+class RowParser:
+    """
+    Turn CSV or NDJSON lines into application dicts as the lines arrive
+
+    CSV lines go through one csv.reader over everything fed so far, so a
+    quoted field may contain newlines: a record is read only once its quotes
+    balance. record_line is the line number the last record started on.
+    """
+    def __init__(self, input_format):
+        if input_format not in ("csv", "ndjson"):
+            raise ValueError(f"Unknown input format: {input_format}")
+        self.input_format = input_format
+        self.header = None
+        self.line_number = 0
+        self.record_line = None
+        self._buffer = _LineBuffer()
+        self._reader = csv.reader(self._buffer)
+        self._in_quotes = False
+
+    def feed(self, line):
+        """
+        Take the next line; return the application it completes, None for blank, header or partial lines
+        """
+        self.line_number += 1
+        line = line.rstrip("\r\n")
+        if not self._in_quotes:
+            if not line.strip():
+                return None
+            self.record_line = self.line_number
+        if self.input_format == "ndjson":
+            return self._parse_json(line)
+
+        self._buffer.lines.append(line + "\n")
+        if line.count('"') % 2:
+            self._in_quotes = not self._in_quotes
+        if self._in_quotes:
+            return None
+        try:
+            values = next(self._reader)
+        except csv.Error as e:
+            raise ValidationError(f"Invalid CSV: {str(e)}")
+        return self._parse_csv(values)
+
+    def finish(self):
+        """
+        Raise if the input ended inside a quoted CSV field
+        """
+        if self._in_quotes:
+            self._in_quotes = False
+            self._buffer.lines.clear()
+            raise ValidationError("Unterminated quoted field")
+
+    def _parse_json(self, line):
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            raise ValidationError(f"Invalid JSON: {str(e)}")
+        if not isinstance(row, dict):
+            raise ValidationError("Expected a JSON object")
+        return validate_application(row)
+
+    def _parse_csv(self, values):
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            return None
+        if len(values) != len(self.header):
+            raise ValidationError(f"Expected {len(self.header)} columns, got {len(values)}")
+        # Empty CSV cells mean "not provided"
+        return validate_application({
+            name: value for name, value in zip(self.header, values) if value != ''
+        })
+
+def validate_application(row):
+    application = {}
+    for name, field_type in REQUIRED_FIELDS.items():
+        if row.get(name) is None:
+            raise ValidationError(f"Missing field: {name}")
+        application[name] = _coerce(name, row[name], field_type)
+    for name, field_type in OPTIONAL_FIELDS.items():
+        if row.get(name) is not None:
+            application[name] = _coerce(name, row[name], field_type)
+    return application
+
+def _coerce(name, value, field_type):
+    try:
+        return field_type(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"Invalid {name}: {value!r}")
+
+class BulkApplicationIngester:
+    """
+    Process insurance applications in chunks instead of one request per row
+
+    Each chunk is scored in one batch, its contracts are broadcast back to back,
+    and its users, risk assessments and policies are written in one transaction.
+    In fire-and-reconcile mode the chunk is written in smaller batches instead,
+    since every broadcast holds the sender's nonce row until its batch commits.
+    A bad row is reported in its result and never aborts the rest of the stream.
+    """
+    def __init__(self, insurance_manager, chunk_size=None, submit_batch_size=None):
+        self.manager = insurance_manager
+        self.risk_assessor = insurance_manager.risk_assessor
+        self.smart_contract = insurance_manager.smart_contract
+        self.transaction_manager = insurance_manager.transaction_manager
+        self.cache = insurance_manager.cache
+        self.chunk_size = chunk_size or settings.BULK_CHUNK_SIZE
+        self.submit_batch_size = submit_batch_size or settings.BULK_SUBMIT_BATCH_SIZE
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.started = None
+
+    def ingest(self, lines, input_format):
+        """
+        Yield one result per input row, then a summary
+        """
+        self.started = time.perf_counter()
+        chunk = []
+        for row_number, parsed in self._parse_lines(lines, input_format):
+            chunk.append((row_number, parsed))
+            if len(chunk) >= self.chunk_size:
+                yield from self.process_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield from self.process_chunk(chunk)
+        yield {'summary': self.stats()}
+
+    async def ingest_async(self, lines, input_format):
+        """
+        Async variant over an async line iterator; chunks run off the event loop
+        """
+        self.started = time.perf_counter()
+        parser = RowParser(input_format)
+        chunk = []
+        async for line in lines:
+            parsed = self._parse_line(parser, line)
+            if parsed is None:
+                continue
+            chunk.append((parser.record_line, parsed))
+            if len(chunk) >= self.chunk_size:
+                for result in await asyncio.to_thread(self.process_chunk, chunk):
+                    yield result
+                chunk = []
+        unterminated = self._finish(parser)
+        if unterminated is not None:
+            chunk.append(unterminated)
+        if chunk:
+            for result in await asyncio.to_thread(self.process_chunk, chunk):
+                yield result
+        yield {'summary': self.stats()}
+
+    def process_chunk(self, chunk):
+        """
+        Process (row_number, application or ValidationError) pairs; returns one result per row
+        """
+        results = {}
+        applications = []
+        for row_number, parsed in chunk:
+            if isinstance(parsed, Exception):
+                results[row_number] = self._failure(row_number, None, parsed)
+            else:
+                applications.append((row_number, parsed))
+
+        try:
+            if applications:
+                self._create_policies(applications, results)
+        except Exception as e:
+            logger.error("Error processing bulk chunk: %s", e)
+            for row_number, application in applications:
+                results.setdefault(row_number, self._failure(row_number, application, e))
+
+        ordered = [results[row_number] for row_number, _ in chunk]
+        self.rows += len(ordered)
+        self.created += sum(result['ok'] for result in ordered)
+        self.failed += sum(not result['ok'] for result in ordered)
+        return ordered
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'elapsed_seconds': elapsed,
+            'rows_per_second': self.rows / elapsed if elapsed else 0.0
+        }
+
+    def _create_policies(self, applications, results):
+        """
+        Score applications and write their policies, adding each row's result to results as its batch commits
+        """
+        risk_results = self.risk_assessor.analyze_batch([application for _, application in applications])
+        rows = [
+            (row_number, application, risk_result, self.manager._calculate_premium(risk_result['risk_score'], application))
+            for (row_number, application), risk_result in zip(applications, risk_results)
+        ]
+        batch_size = self.submit_batch_size if self.transaction_manager is not None else len(rows)
+        for start in range(0, len(rows), batch_size):
+            results.update(self._write_policies(rows[start:start + batch_size]))
+
+    def _write_policies(self, rows):
+        results = {}
+        status = PolicyStatus.PENDING if self.transaction_manager is not None else PolicyStatus.ACTIVE
+
+        # The session only checks out a connection once used, so waiting for receipts doesn't hold one
+        with get_db_session() as db:
+            contract_results = self._create_contracts(db, [
+                (application, self.manager._create_policy_details(application, premium))
+                for _, application, _, premium in rows
+            ])
+            accepted = []
+            for (row_number, application, risk_result, premium), contract_result in zip(rows, contract_results):
+                if isinstance(contract_result, Exception):
+                    results[row_number] = self._failure(row_number, application, contract_result)
+                else:
+                    accepted.append((row_number, application, risk_result, premium, contract_result))
+            if not accepted:
+                return results
+
+            # Contracts already exist on chain at this point; if the write below fails,
+            # event ingestion still records the policies from their PolicyCreated events
+            users = self._upsert_users(db, [application for _, application, _, _, _ in accepted])
+            policies = []
+            changes = PortfolioChanges()
+            for row_number, application, risk_result, premium, contract_result in accepted:
+                user = users[application['wallet_address']]
+                db.add(self.manager._build_risk_assessment(user, risk_result))
+                policy = self.manager._build_policy(user, contract_result, application, premium, status)
+                db.add(policy)
+                changes.policy(policy)
+                policies.append((row_number, application, risk_result, policy))
+            stale_keys = set(changes.apply(db))
+            db.commit()
+
+            for row_number, application, risk_result, policy in policies:
+                stale_keys.update((policy_key(policy.policy_id), user_policies_key(application['wallet_address'])))
+                results[row_number] = {
+                    'row': row_number,
+                    'wallet_address': application['wallet_address'],
+                    'ok': True,
+                    'policy': self.manager._format_policy_response(policy, risk_result)
+                }
+        self.cache.invalidate(*stale_keys)
+        return results
+
+    def _create_contracts(self, db, requests):
+        """
+        One contract result dict or exception per (application, policy_details)
+
+        Pending transactions are recorded in db, to commit with the policies they create.
+        """
+        if self.transaction_manager is not None:
+            # Fire-and-reconcile already pipelines submissions; the batch holds the nonce row until it commits
+            contract_results = []
+            for application, policy_details in requests:
+                try:
+                    contract_results.append(self.manager._submit_policy_transaction(db, application, policy_details))
+                except Exception as e:
+                    contract_results.append(e)
+            return contract_results
+
+        receipts = self.smart_contract.create_insurance_contracts([
+            (application['wallet_address'], policy_details) for application, policy_details in requests
+        ])
+        contract_results = []
+        for receipt in receipts:
+            if isinstance(receipt, Exception):
+                contract_results.append(receipt)
+                continue
+            try:
+                contract_results.append(self.manager._policy_contract_result(receipt))
+            except BlockchainError as e:
+                contract_results.append(e)
+        return contract_results
+
+    def _upsert_users(self, db, applications):
+        """
+        Fetch every user in the chunk in one query and flush the missing ones together
+        """
+        addresses = {application['wallet_address'] for application in applications}
+        users = {
+            user.wallet_address: user
+            for user in db.query(User).filter(User.wallet_address.in_(addresses))
+        }
+        for application in applications:
+            if application['wallet_address'] not in users:
+                user = users[application['wallet_address']] = self.manager._build_user(application)
+                db.add(user)
+        db.flush()
+        return users
+
+    def _parse_lines(self, lines, input_format):
+        parser = RowParser(input_format)
+        for line in lines:
+            parsed = self._parse_line(parser, line)
+            if parsed is not None:
+                yield parser.record_line, parsed
+        unterminated = self._finish(parser)
+        if unterminated is not None:
+            yield unterminated
+
+    def _parse_line(self, parser, line):
+        try:
+            return parser.feed(line)
+        except ValidationError as e:
+            return e
+
+    def _finish(self, parser):
+        try:
+            parser.finish()
+        except ValidationError as e:
+            return parser.record_line, e
+        return None
+
+    def _failure(self, row_number, application, error):
+        return {
+            'row': row_number,
+            'wallet_address': application['wallet_address'] if application else None,
+            'ok': False,
+            'error': str(error)
+        }
+
+def main():
+    from .insurance_manager import InsuranceManager
+
+    parser = argparse.ArgumentParser(description="Bulk-ingest insurance applications from CSV or NDJSON")
+    parser.add_argument("path", help="input file, or - for stdin")
+    parser.add_argument("--format", choices=("csv", "ndjson"), help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, help="rows per chunk")
+    parser.add_argument("--model", help="model artifact; defaults to MODEL_PATH")
+    parser.add_argument("--version", help="model version; defaults to the one saved in the artifact")
+    args = parser.parse_args()
+
+    input_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    insurance_manager = InsuranceManager(settings.CONTRACT_ADDRESS, settings.CONTRACT_ABI_PATH)
+    # Fails fast on a missing artifact rather than failing every row
+    insurance_manager.risk_assessor.swap(args.model, args.version)
+    ingester = BulkApplicationIngester(insurance_manager, args.chunk_size)
+
+    source = sys.stdin if args.path == "-" else open(args.path, newline='')
+    with source:
+        for result in ingester.ingest(source, input_format):
+            print(dumps(result).decode())
+
+    stats = ingester.stats()
+    logger.info(
+        "Ingested %d rows (%d created, %d failed) at %.0f rows/sec",
+        stats['rows'], stats['created'], stats['failed'], stats['rows_per_second']
+    )
+
+if __name__ == "__main__":
+    main()
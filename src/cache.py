@@ -0,0 +1,400 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from .config import settings
+from .logger import setup_logger
+from .serialization import dumps, loads, to_jsonable
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = setup_logger("cache")
+
+INVALIDATION_CHANNEL = "secur:cache:invalidate"
+# Outlives any load that could still be holding the generation it read
+GENERATION_TTL_SECONDS = 3600
+
+# Store the value only if no invalidation bumped the key's generation since the loader read it
+SET_IF_GENERATION = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+return 1
+"""
+
+class LRUTTLCache:
+    """
+    Bounded in-process cache with least-recently-used eviction and per-entry expiry
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class InMemorySharedBackend:
+    """
+    Process-local stand-in for a shared cache backend such as Redis
+
+    Values are stored JSON-encoded, as Redis stores them, and every key
+    carries a generation that delete() bumps.
+    """
+    def __init__(self):
+        self._values = LRUTTLCache(max_size=float('inf'), ttl=float('inf'))
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def get(self, key):
+        with self._lock:
+            hit, payload = self._values.get(key)
+            return hit, loads(payload) if hit else None, self._generations.get(key, 0)
+
+    def set(self, key, value, ttl, generation):
+        payload = dumps(value)
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return False
+            self._values.set(key, payload, ttl)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+            self._values.delete(*keys)
+
+    def publish(self, message):
+        payload = dumps(message)
+        for callback in list(self._subscribers):
+            callback(loads(payload))
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def close(self):
+        self._subscribers.clear()
+
+class RedisSharedBackend:
+    """
+    Redis-backed shared tier; invalidations fan out to every worker over pub/sub
+
+    Values and messages are JSON, so a worker never unpickles what another
+    client wrote. Each key has a generation counter beside it; delete() bumps
+    it and set() only stores a value loaded under the current generation.
+    """
+    def __init__(self, url):
+        if redis is None:
+            raise ImportError("redis package is required for CACHE_REDIS_URL")
+        self.client = redis.Redis.from_url(url)
+        self._set_if_generation = self.client.register_script(SET_IF_GENERATION)
+        self._listener = None
+
+    def get(self, key):
+        payload, generation = self.client.mget(key, _generation_key(key))
+        generation = int(generation or 0)
+        if payload is None:
+            return False, None, generation
+        return True, loads(payload), generation
+
+    def set(self, key, value, ttl, generation):
+        stored = self._set_if_generation(
+            keys=[key, _generation_key(key)], args=[generation, dumps(value), int(ttl * 1000)]
+        )
+        return bool(stored)
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.delete(*keys)
+            for key in keys:
+                pipe.incr(_generation_key(key))
+                pipe.expire(_generation_key(key), GENERATION_TTL_SECONDS)
+            pipe.execute()
+
+    def publish(self, message):
+        self.client.publish(INVALIDATION_CHANNEL, dumps(message))
+
+    def subscribe(self, callback):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{INVALIDATION_CHANNEL: lambda message: callback(loads(message['data']))})
+        self._listener = pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        self.client.close()
+
+def _generation_key(key):
+    return f"generation:{key}"
+
+class ReadThroughCache:
+    """
+    Two-tier read-through cache for policy and claim lookups
+
+    Reads check the local LRU, then the optional shared backend, then call the
+    loader. Writers invalidate keys explicitly; with a shared backend the
+    invalidation is broadcast so other workers drop their local copies too.
+    A value loaded while its key was invalidated is returned but not cached:
+    the loader may have read the database before the write committed.
+
+    With a shared backend, values are stored as JSON and every tier returns
+    them as plain JSON types. Call start() once the process is serving to
+    receive other workers' invalidations.
+    """
+    def __init__(self, max_size=None, ttl=None, shared=None):
+        self.ttl = settings.CACHE_TTL_SECONDS if ttl is None else ttl
+        self.local = LRUTTLCache(max_size or settings.CACHE_MAX_ENTRIES, self.ttl)
+        # Keys written within the replica lag bound; reads of them go to the primary
+        self.recent_writes = LRUTTLCache(settings.CACHE_MAX_ENTRIES, settings.REPLICA_MAX_LAG_SECONDS)
+        self.shared = shared
+        self.node_id = uuid.uuid4().hex
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_loads = 0
+        self.subscribed = False
+        # key -> [loads in flight, local generation]; only keys being loaded are tracked
+        self._loads = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Subscribe to invalidations from other workers; a no-op without a shared backend
+        """
+        if self.shared is None or self.subscribed:
+            return
+        try:
+            self.shared.subscribe(self._on_invalidation)
+        except Exception as e:
+            logger.error("Error subscribing to cache invalidations: %s", e)
+            return
+        self.subscribed = True
+
+    def close(self):
+        if self.shared is not None:
+            self.shared.close()
+        self.subscribed = False
+
+    def get_or_load(self, key, loader):
+        hit, value = self._lookup_local(key)
+        if hit:
+            return value
+        generation = self._begin_load(key)
+        try:
+            hit, value, shared_generation = self._lookup_shared(key)
+            if not hit:
+                value, current = self._share(key, loader(), shared_generation)
+                if not current:
+                    return value
+            self._keep(key, value, generation)
+            return value
+        finally:
+            self._end_load(key)
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Async variant; loader is a coroutine function and shared-tier calls run off the loop
+        """
+        hit, value = self._lookup_local(key)
+        if hit:
+            return value
+        generation = self._begin_load(key)
+        try:
+            if self.shared is None:
+                hit, value, shared_generation = self._lookup_shared(key)
+            else:
+                hit, value, shared_generation = await asyncio.to_thread(self._lookup_shared, key)
+            if not hit:
+                value = await loader()
+                if self.shared is None:
+                    value, current = self._share(key, value, shared_generation)
+                else:
+                    value, current = await asyncio.to_thread(self._share, key, value, shared_generation)
+                if not current:
+                    return value
+            self._keep(key, value, generation)
+            return value
+        finally:
+            self._end_load(key)
+
+    def invalidate(self, *keys):
+        if not keys:
+            return
+        self.invalidations += len(keys)
+        with self._lock:
+            self._bump(*keys)
+            self.local.delete(*keys)
+        self._mark_written(keys)
+        if self.shared is not None:
+            try:
+                self.shared.delete(*keys)
+                self.shared.publish({'node_id': self.node_id, 'keys': list(keys)})
+            except Exception as e:
+                logger.error("Error broadcasting cache invalidation: %s", e)
+
+    def written_recently(self, key):
+        """
+        Whether key was invalidated recently enough that a lagging replica may not have the write yet
+        """
+        return self.recent_writes.get(key)[0]
+
+    def stats(self):
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            'entries': len(self.local),
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+            'evictions': self.local.evictions,
+            'expirations': self.local.expirations,
+            'invalidations': self.invalidations,
+            'stale_loads': self.stale_loads
+        }
+
+    def _lookup_local(self, key):
+        hit, value = self.local.get(key)
+        if hit:
+            self.local_hits += 1
+        return hit, value
+
+    def _lookup_shared(self, key):
+        """
+        Look key up in the shared tier; also returns its generation there, None when there is no tier to ask
+        """
+        if self.shared is None:
+            self.misses += 1
+            return False, None, None
+        try:
+            hit, value, generation = self.shared.get(key)
+        except Exception as e:
+            logger.error("Error reading shared cache: %s", e)
+            hit, value, generation = False, None, None
+        if hit:
+            self.shared_hits += 1
+        else:
+            self.misses += 1
+        return hit, value, generation
+
+    def _share(self, key, value, shared_generation):
+        """
+        Store a loaded value in the shared tier; False alongside it if key was invalidated there since the lookup
+        """
+        if self.shared is None:
+            return value, True
+        value = to_jsonable(value)
+        if shared_generation is None:
+            return value, True
+        try:
+            current = self.shared.set(key, value, self.ttl, shared_generation)
+        except Exception as e:
+            logger.error("Error writing shared cache: %s", e)
+            return value, True
+        if not current:
+            self.stale_loads += 1
+        return value, current
+
+    def _keep(self, key, value, generation):
+        # Only if no invalidation of key reached this process since the load began
+        with self._lock:
+            if self._loads[key][1] != generation:
+                self.stale_loads += 1
+                return
+            self.local.set(key, value)
+
+    def _begin_load(self, key):
+        with self._lock:
+            load = self._loads.setdefault(key, [0, 0])
+            load[0] += 1
+            return load[1]
+
+    def _end_load(self, key):
+        with self._lock:
+            load = self._loads[key]
+            load[0] -= 1
+            if not load[0]:
+                del self._loads[key]
+
+    def _bump(self, *keys):
+        # Caller holds self._lock
+        for key in keys:
+            load = self._loads.get(key)
+            if load is not None:
+                load[1] += 1
+
+    def _on_invalidation(self, message):
+        if message['node_id'] != self.node_id:
+            with self._lock:
+                self._bump(*message['keys'])
+                self.local.delete(*message['keys'])
+            self._mark_written(message['keys'])
+
+    def _mark_written(self, keys):
+        for key in keys:
+            self.recent_writes.set(key, True)
+
+def policy_key(policy_id):
+    return f"policy:{policy_id}"
+
+def claim_key(claim_id):
+    return f"claim:{claim_id}"
+
+def user_policies_key(wallet_address):
+    return f"user_policies:{wallet_address}"
+
+def portfolio_key(wallet_address):
+    return f"portfolio:{wallet_address}"
+
+def _build_query_cache():
+    if not settings.CACHE_ENABLED:
+        return ReadThroughCache(max_size=1, ttl=0)
+    shared = RedisSharedBackend(settings.CACHE_REDIS_URL) if settings.CACHE_REDIS_URL else None
+    return ReadThroughCache(shared=shared)
+
+# Shared by the managers, the receipt reconciler and the event ingester in this process
+query_cache = _build_query_cache()
\ No newline at end of file
@@ -1,22 +1,313 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from contextlib import contextmanager, asynccontextmanager
 from .config import settings
 from .models import Base
+from .migrations import run_migrations
+from .logger import setup_logger
+import threading
+import time
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+logger = setup_logger("database")
+
+_engine = None
+_SessionLocal = None
+_engine_lock = threading.Lock()
+
+_ASYNC_DRIVERS = {
+    "postgresql://": "postgresql+asyncpg://",
+    "sqlite://": "sqlite+aiosqlite://"
+}
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+# Seconds the replica's replay is behind; 0 once it has replayed everything it received
+_LAG_QUERIES = {
+    "postgresql": (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    )
+}
+
+def _lag_query(dialect):
+    # Databases with no way to ask are treated as current; the query still proves the replica is up
+    return text(_LAG_QUERIES.get(dialect, "SELECT 0"))
+
+def _pool_options(url):
+    """
+    Pool sizing from settings; SQLite keeps SQLAlchemy's defaults
+    """
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT_SECONDS,
+        'pool_recycle': settings.DB_POOL_RECYCLE_SECONDS,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING
+    }
+
+def get_engine():
+    """
+    Create the engine on first use so importing this module opens nothing
+    """
+    global _engine, _SessionLocal
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(settings.DATABASE_URL, **_pool_options(settings.DATABASE_URL))
+                _SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                _engine = engine
+    return _engine
 
 def init_db():
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
 
 @contextmanager
 def get_db():
-    db = SessionLocal()
+    db = get_db_session()
     try:
         yield db
     finally:
         db.close()
 
 def get_db_session() -> Session:
-    return SessionLocal() 
\ No newline at end of file
+    get_engine()
+    return _SessionLocal()
+
+def load_locked_row(db, model, key, create):
+    """
+    Row for key, locked for the rest of the transaction; inserted from create() if missing
+    """
+    row = db.get(model, key, with_for_update=True)
+    if row is None:
+        # A missing row can't be locked, so two first writers may race to insert it
+        try:
+            with db.begin_nested():
+                db.add(create())
+        except IntegrityError:
+            pass
+        row = db.get(model, key, with_for_update=True)
+    return row
+
+async def load_locked_row_async(db, model, key, create):
+    row = await db.get(model, key, with_for_update=True)
+    if row is None:
+        try:
+            async with db.begin_nested():
+                db.add(create())
+        except IntegrityError:
+            pass
+        row = await db.get(model, key, with_for_update=True)
+    return row
+
+def check_connection():
+    """
+    Round-trip a trivial query; returns True or raises if the database is unreachable
+    """
+    with get_engine().connect() as conn:
+        conn.exec_driver_sql("SELECT 1")
+    return True
+
+def pool_stats():
+    """
+    Connection pool occupancy; pools without a fixed size (e.g. SQLite in-memory) report what they can
+    """
+    if _engine is None:
+        return {}
+    pool = _engine.pool
+    stats = {}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    return stats
+
+def _async_url(url):
+    for prefix, async_prefix in _ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+def _async_database_url():
+    return settings.ASYNC_DATABASE_URL or _async_url(settings.DATABASE_URL)
+
+def _async_sessionmaker(engine):
+    return sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def get_async_engine():
+    """
+    Create the async engine on first use so the async driver stays optional
+    """
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        url = _async_database_url()
+        _async_engine = create_async_engine(url, **_pool_options(url))
+        _AsyncSessionLocal = _async_sessionmaker(_async_engine)
+    return _async_engine
+
+@asynccontextmanager
+async def get_async_db():
+    get_async_engine()
+    async with _AsyncSessionLocal() as db:
+        yield db
+
+class Replica:
+    """
+    One read replica with lazily created sync and async engines and its last lag reading
+    """
+    def __init__(self, url):
+        self.url = url
+        self.lag = None  # seconds; None until measured, or after a failed check
+        self.checked_at = float('-inf')
+        self.checking = False
+        self._lock = threading.Lock()
+        self._sessionmaker = None
+        self._async_sessionmaker = None
+
+    @property
+    def sessionmaker(self):
+        with self._lock:
+            if self._sessionmaker is None:
+                engine = create_engine(self.url, **_pool_options(self.url))
+                self._sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        return self._sessionmaker
+
+    @property
+    def async_sessionmaker(self):
+        with self._lock:
+            if self._async_sessionmaker is None:
+                url = _async_url(self.url)
+                self._async_sessionmaker = _async_sessionmaker(create_async_engine(url, **_pool_options(url)))
+        return self._async_sessionmaker
+
+class ReplicaRouter:
+    """
+    Route read-only sessions to read replicas that are within max_lag of the primary
+
+    Each replica's replication lag is measured at most once per check_interval,
+    on the request that finds the reading stale; the others keep using the
+    last reading. Reads go round-robin over replicas within max_lag, and to
+    the primary when none is, when no replicas are configured, or when the
+    caller needs its own recent write.
+    """
+    def __init__(self, urls=None, max_lag=None, check_interval=None):
+        if urls is None:
+            urls = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = settings.REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+        self.check_interval = settings.REPLICA_LAG_CHECK_SECONDS if check_interval is None else check_interval
+        self._lock = threading.Lock()
+        self._next = 0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.fallbacks = 0
+
+    def read_session(self, prefer_primary=False) -> Session:
+        if not prefer_primary:
+            for replica in self._due_for_check():
+                self._check(replica)
+        replica = self._pick(prefer_primary)
+        if replica is None:
+            return get_db_session()
+        return replica.sessionmaker()
+
+    @asynccontextmanager
+    async def read_session_async(self, prefer_primary=False):
+        if not prefer_primary:
+            for replica in self._due_for_check():
+                await self._check_async(replica)
+        replica = self._pick(prefer_primary)
+        if replica is None:
+            async with get_async_db() as db:
+                yield db
+            return
+        async with replica.async_sessionmaker() as db:
+            yield db
+
+    def stats(self):
+        lags = [replica.lag for replica in self.replicas if replica.lag is not None]
+        return {
+            'replicas': len(self.replicas),
+            'replicas_in_rotation': sum(lag <= self.max_lag for lag in lags),
+            'max_lag_seconds': max(lags, default=0.0),
+            'replica_reads': self.replica_reads,
+            'primary_reads': self.primary_reads,
+            'fallbacks': self.fallbacks
+        }
+
+    def _pick(self, prefer_primary):
+        if self.replicas and not prefer_primary:
+            candidates = [
+                replica for replica in self.replicas
+                if replica.lag is not None and replica.lag <= self.max_lag
+            ]
+            if candidates:
+                with self._lock:
+                    self._next += 1
+                    self.replica_reads += 1
+                    return candidates[self._next % len(candidates)]
+            self.fallbacks += 1
+        self.primary_reads += 1
+        return None
+
+    def _due_for_check(self):
+        """
+        Replicas whose lag reading is stale, each handed to exactly one caller to measure
+        """
+        now = time.monotonic()
+        due = []
+        with self._lock:
+            for replica in self.replicas:
+                if not replica.checking and now - replica.checked_at >= self.check_interval:
+                    replica.checking = True
+                    due.append(replica)
+        return due
+
+    def _check(self, replica):
+        lag = None
+        try:
+            with replica.sessionmaker() as db:
+                lag = float(db.execute(_lag_query(db.get_bind().dialect.name)).scalar() or 0.0)
+        except Exception as e:
+            self._log_failure(replica, e)
+        finally:
+            self._record(replica, lag)
+
+    async def _check_async(self, replica):
+        lag = None
+        try:
+            async with replica.async_sessionmaker() as db:
+                lag = float((await db.execute(_lag_query(db.bind.dialect.name))).scalar() or 0.0)
+        except Exception as e:
+            self._log_failure(replica, e)
+        finally:
+            self._record(replica, lag)
+
+    def _record(self, replica, lag):
+        if lag is not None and lag > self.max_lag and (replica.lag is None or replica.lag <= self.max_lag):
+            logger.warning("Replica %s is %.1fs behind; reading from the primary", replica.url.split('@')[-1], lag)
+        replica.lag = lag
+        replica.checked_at = time.monotonic()
+        replica.checking = False
+
+    def _log_failure(self, replica, error):
+        # Once per outage rather than on every check
+        if replica.lag is not None or replica.checked_at == float('-inf'):
+            logger.error("Replica %s is unreachable: %s", replica.url.split('@')[-1], error)
+
+replica_router = ReplicaRouter()
+
+def get_read_session(prefer_primary=False) -> Session:
+    """
+    Session for read-only work: a replica within REPLICA_MAX_LAG_SECONDS, else the primary
+    """
+    return replica_router.read_session(prefer_primary)
+
+def get_async_read_db(prefer_primary=False):
+    return replica_router.read_session_async(prefer_primary)
\ No newline at end of file
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from urllib.parse import quote
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from .models import Evidence
+from .database import get_db_session
+from .cache import LRUTTLCache
+from .exceptions import EvidenceError, ValidationError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("evidence_store")
+
+class IPFSBackend:
+    """
+    Add files to an IPFS node through its HTTP API, streamed from disk in blocks
+    """
+    def __init__(self, host=None, port=None, block_size=None, timeout=None):
+        self.url = f"http://{host or settings.IPFS_HOST}:{port or settings.IPFS_PORT}/api/v0/add"
+        self.block_size = block_size or settings.EVIDENCE_BLOCK_SIZE
+        self.timeout = timeout or settings.IPFS_TIMEOUT_SECONDS
+
+    def add(self, path, filename, sha256):
+        import requests
+        boundary = uuid.uuid4().hex
+        response = requests.post(
+            self.url,
+            params={'pin': 'true'},
+            data=self._multipart_body(path, filename, sha256, boundary),
+            headers={'Content-Type': f"multipart/form-data; boundary={boundary}"},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()['Hash']
+
+    def _multipart_body(self, path, filename, sha256, boundary):
+        # A generator body goes out with chunked transfer encoding, one block at a time
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Disposition: {self._content_disposition(filename, sha256)}\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                yield block
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    def _content_disposition(self, filename, sha256):
+        # The client's filename never reaches the header raw: the plain parameter
+        # is the SHA-256 and the original name goes percent-encoded in filename*
+        disposition = f'form-data; name="file"; filename="{sha256}"'
+        if filename:
+            disposition += f"; filename*=UTF-8''{quote(filename, safe='')}"
+        return disposition
+
+class LocalBackend:
+    """
+    Content-addressed directory standing in for IPFS; the SHA-256 is the evidence hash
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or settings.EVIDENCE_LOCAL_DIR
+
+    def add(self, path, filename, sha256):
+        target_dir = os.path.join(self.directory, sha256[:2])
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.move(path, os.path.join(target_dir, sha256))
+        return sha256
+
+    def path(self, sha256):
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+def make_backend(name=None):
+    name = name or settings.EVIDENCE_BACKEND
+    if name == "ipfs":
+        return IPFSBackend()
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"Unknown evidence backend: {name}")
+
+class EvidenceStore:
+    """
+    Stream claim evidence into IPFS, uploading each distinct content only once
+
+    The body is hashed and spooled to a temporary file one block at a time,
+    so memory use is one block whatever the file size. Its SHA-256 is then
+    looked up in the evidence index, in process first and then the database,
+    and only unseen content is pushed to the backend. Concurrent uploads of
+    the same content share a single push. A client that already knows the
+    SHA-256 can send it up front and skip the upload when it is indexed.
+    """
+    def __init__(self, backend=None, spool_dir=None, block_size=None, max_bytes=None):
+        self._backend = backend
+        self.spool_dir = spool_dir or settings.EVIDENCE_SPOOL_DIR
+        self.block_size = block_size or settings.EVIDENCE_BLOCK_SIZE
+        self.max_bytes = max_bytes or settings.EVIDENCE_MAX_BYTES
+        # Content never changes under a hash, so entries only leave through LRU eviction
+        self.index = LRUTTLCache(settings.EVIDENCE_INDEX_SIZE, float('inf'))
+        self._in_flight = {}
+        self.uploads = 0
+        self.deduplicated = 0
+        self.bytes_received = 0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = make_backend()
+        return self._backend
+
+    def lookup(self, sha256):
+        """
+        Indexed evidence record for a SHA-256, or None if this content was never stored
+        """
+        hit, record = self.index.get(sha256)
+        if hit:
+            return record
+        with get_db_session() as db:
+            evidence = db.scalar(select(Evidence).where(Evidence.sha256 == sha256))
+            if evidence is None:
+                return None
+            record = self._format_record(evidence)
+        self.index.set(sha256, record)
+        return record
+
+    async def store(self, chunks, filename=None, content_type=None, expected_sha256=None):
+        """
+        Consume an async iterable of byte chunks and return the stored evidence record
+        """
+        if expected_sha256:
+            expected_sha256 = expected_sha256.lower()
+            record = await asyncio.to_thread(self.lookup, expected_sha256)
+            if record is not None:
+                self.deduplicated += 1
+                return {**record, 'deduplicated': True}
+
+        fd, path = tempfile.mkstemp(prefix="evidence-", dir=self.spool_dir)
+        try:
+            with os.fdopen(fd, "wb") as spool:
+                sha256, size = await self._spool(chunks, spool)
+            if expected_sha256 and expected_sha256 != sha256:
+                raise ValidationError(f"Evidence SHA-256 is {sha256}, not {expected_sha256}")
+            record, deduplicated = await self._publish(sha256, path, size, filename, content_type)
+            return {**record, 'deduplicated': deduplicated}
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def stats(self):
+        return {
+            'uploads': self.uploads,
+            'deduplicated': self.deduplicated,
+            'bytes_received': self.bytes_received,
+            'in_flight': len(self._in_flight)
+        }
+
+    async def _spool(self, chunks, spool):
+        hasher = hashlib.sha256()
+        size = 0
+        block = bytearray()
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ValidationError(f"Evidence exceeds the {self.max_bytes} byte limit")
+            block += chunk
+            if len(block) >= self.block_size:
+                data, block = block, bytearray()
+                await asyncio.to_thread(self._write_block, spool, hasher, data)
+        if block:
+            await asyncio.to_thread(self._write_block, spool, hasher, block)
+        self.bytes_received += size
+        return hasher.hexdigest(), size
+
+    def _write_block(self, spool, hasher, data):
+        # hashlib and file writes release the GIL for large buffers
+        hasher.update(data)
+        spool.write(data)
+
+    async def _publish(self, sha256, path, size, filename, content_type):
+        future = self._in_flight.get(sha256)
+        if future is not None:
+            self.deduplicated += 1
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[sha256] = future
+        try:
+            record = await asyncio.to_thread(self.lookup, sha256)
+            deduplicated = record is not None
+            if record is None:
+                record = await asyncio.to_thread(self._push, sha256, path, size, filename, content_type)
+            future.set_result(record)
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, so lone uploads don't log "never retrieved"
+            if isinstance(e, (EvidenceError, ValidationError)):
+                raise
+            raise EvidenceError(f"Failed to store evidence: {str(e)}")
+        finally:
+            del self._in_flight[sha256]
+        if deduplicated:
+            self.deduplicated += 1
+        return record, deduplicated
+
+    def _push(self, sha256, path, size, filename, content_type):
+        evidence_hash = self.backend.add(path, filename, sha256)
+        with get_db_session() as db:
+            evidence = Evidence(
+                sha256=sha256,
+                evidence_hash=evidence_hash,
+                size=size,
+                filename=filename,
+                content_type=content_type
+            )
+            db.add(evidence)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker indexed the same content first; IPFS holds one copy either way
+                db.rollback()
+                evidence = db.scalar(select(Evidence).where(Evidence.sha256 == sha256))
+            record = self._format_record(evidence)
+        self.index.set(sha256, record)
+        self.uploads += 1
+        logger.info("Stored evidence %s (%d bytes)", evidence_hash, size)
+        return record
+
+    def _format_record(self, evidence):
+        return {
+            'evidence_hash': evidence.evidence_hash,
+            'sha256': evidence.sha256,
+            'size': evidence.size,
+            'filename': evidence.filename,
+            'content_type': evidence.content_type,
+            'created_at': evidence.created_at
+        }
\ No newline at end of file
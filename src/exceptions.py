@@ -24,4 +24,16 @@ class ValidationError(InsuranceError):
 
 class DatabaseError(InsuranceError):
     """Raised when database operations fail"""
-    pass 
\ No newline at end of file
+    pass
+
+class FraudScreeningError(ClaimError):
+    """Raised when a claim fails fraud screening"""
+    pass
+
+class EvidenceError(InsuranceError):
+    """Raised when evidence upload or storage fails"""
+    pass 
+
+class IdempotencyError(InsuranceError):
+    """Raised when an idempotency key is reused for a different request or is still in flight"""
+    pass
@@ -0,0 +1,309 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, insert, func, case, literal, DateTime, Integer, Float
+from .models import Policy, Claim, ClaimStatus, PolicyClaimStats, UserClaimStats, ClaimEvidence
+from .database import get_db_session, get_engine, load_locked_row, load_locked_row_async
+from .exceptions import FraudScreeningError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("fraud_screening")
+
+def _empty_stats(model, **key):
+    return model(
+        **key,
+        claim_count=0,
+        claimed_total=0.0,
+        window_count=0,
+        window_amount=0.0,
+        previous_window_count=0,
+        previous_window_amount=0.0
+    )
+
+def _row_factories(policy, claim_data):
+    factories = [
+        (PolicyClaimStats, policy.id, lambda: _empty_stats(PolicyClaimStats, policy_id=policy.id)),
+        (UserClaimStats, policy.user_id, lambda: _empty_stats(UserClaimStats, user_id=policy.user_id))
+    ]
+    if claim_data.get('evidence_hash'):
+        factories.append((ClaimEvidence, claim_data['evidence_hash'], lambda: ClaimEvidence(
+            evidence_hash=claim_data['evidence_hash'], policy_id=policy.id, claim_count=0
+        )))
+    return factories
+
+def _roll_window(stats, now, window):
+    """
+    Move the window forward so that now falls in the current bucket
+    """
+    if stats.window_start is None:
+        stats.window_start = now
+        return
+    elapsed = (now - stats.window_start).total_seconds()
+    if elapsed < window:
+        return
+    if elapsed < 2 * window:
+        stats.previous_window_count = stats.window_count
+        stats.previous_window_amount = stats.window_amount
+    else:
+        stats.previous_window_count = 0
+        stats.previous_window_amount = 0.0
+    stats.window_count = 0
+    stats.window_amount = 0.0
+    stats.window_start += timedelta(seconds=window * (elapsed // window))
+
+def window_totals(stats, now, window):
+    """
+    Claim count and amount over the last `window` seconds
+
+    Sliding-window counter: the current bucket plus the previous one weighted
+    by how much of it still overlaps the window, assuming claims in it were
+    spread evenly.
+    """
+    _roll_window(stats, now, window)
+    overlap = max(0.0, 1 - (now - stats.window_start).total_seconds() / window)
+    return (
+        stats.window_count + stats.previous_window_count * overlap,
+        stats.window_amount + stats.previous_window_amount * overlap
+    )
+
+def record_claim(stats, amount, when, window, counts_toward_total=True):
+    _roll_window(stats, when, window)
+    stats.claim_count += 1
+    stats.window_count += 1
+    stats.window_amount += amount
+    if counts_toward_total:
+        stats.claimed_total += amount
+    if stats.last_claim_at is None or when > stats.last_claim_at:
+        stats.last_claim_at = when
+
+def unrecord_claim(stats, amount, when, window, counted_toward_total=True):
+    """
+    Take back a record_claim made at `when`; last_claim_at is left to the caller
+    """
+    stats.claim_count -= 1
+    if counted_toward_total:
+        stats.claimed_total -= amount
+    if stats.window_start is None:
+        return
+    if when >= stats.window_start:
+        stats.window_count = max(0, stats.window_count - 1)
+        stats.window_amount = max(0.0, stats.window_amount - amount)
+    elif when >= stats.window_start - timedelta(seconds=window):
+        stats.previous_window_count = max(0, stats.previous_window_count - 1)
+        stats.previous_window_amount = max(0.0, stats.previous_window_amount - amount)
+
+def adjust_claimed_total(db, policy_row_id, delta):
+    """
+    Move a claim's amount in or out of the claimed totals, e.g. when it is rejected after submission
+    """
+    if not delta or policy_row_id is None:
+        return
+    # Through the locked ORM rows rather than an UPDATE, so pending changes in the session aren't overwritten
+    policy = db.get(Policy, policy_row_id)
+    for model, key, create in _row_factories(policy, {}):
+        load_locked_row(db, model, key, create).claimed_total += delta
+
+def record_status_change(db, policy_row_id, amount, old_status, new_status):
+    """
+    Keep claimed totals in step with a claim status change; replaying the same change is a no-op
+    """
+    was_rejected = old_status == ClaimStatus.REJECTED
+    is_rejected = new_status == ClaimStatus.REJECTED
+    if was_rejected != is_rejected:
+        adjust_claimed_total(db, policy_row_id, -amount if is_rejected else amount)
+
+def forget_claim(db, claim, window=None):
+    """
+    Delete a claim that never reached the chain and take it back out of the aggregates
+    """
+    window = window or settings.FRAUD_WINDOW_SECONDS
+    policy = db.get(Policy, claim.policy_id)
+    rows = {model: load_locked_row(db, model, key, create)
+            for model, key, create in _row_factories(policy, {'evidence_hash': claim.evidence_hash})}
+    db.delete(claim)
+    db.flush()
+    for model, latest in (
+        (PolicyClaimStats, select(func.max(Claim.created_at)).where(Claim.policy_id == policy.id)),
+        (UserClaimStats, select(func.max(Claim.created_at)).join(Policy, Claim.policy_id == Policy.id)
+         .where(Policy.user_id == policy.user_id))
+    ):
+        unrecord_claim(rows[model], claim.amount or 0.0, claim.created_at, window,
+                       claim.status != ClaimStatus.REJECTED)
+        # The claim before it, so the minimum interval is measured from a claim that exists
+        rows[model].last_claim_at = db.scalar(latest)
+    if ClaimEvidence in rows:
+        rows[ClaimEvidence].claim_count -= 1
+
+def record_external_claim(db, policy, amount, when, status, window=None):
+    """
+    Count a claim that reached the database without going through screening (e.g. from chain events)
+    """
+    window = window or settings.FRAUD_WINDOW_SECONDS
+    counts_toward_total = status != ClaimStatus.REJECTED
+    for model, key, create in _row_factories(policy, {}):
+        record_claim(load_locked_row(db, model, key, create), amount, when, window, counts_toward_total)
+
+class FraudScreener:
+    """
+    Screen claims against per-policy and per-user aggregates kept up to date on every write
+
+    A check reads three rows by primary key (policy totals, user totals and the
+    evidence hash index) and updates them in the caller's transaction, so its
+    cost does not grow with the claims table. The aggregate rows are locked
+    for the rest of that transaction on databases that support it, which
+    serializes concurrent claims on the same policy or user.
+    """
+    def __init__(self, mode=None, window_seconds=None, max_policy_claims=None, max_user_claims=None,
+                 max_user_window_amount=None, min_interval_seconds=None):
+        # Explicit arguments win even when falsy: 0 claims allowed is a limit, not "use the default"
+        self.mode = settings.FRAUD_SCREENING_MODE if mode is None else mode
+        if self.mode not in ("reject", "flag", "off"):
+            raise ValueError(f"Unknown fraud screening mode: {self.mode}")
+        self.window = settings.FRAUD_WINDOW_SECONDS if window_seconds is None else window_seconds
+        if self.window <= 0:
+            raise ValueError(f"Fraud screening window must be positive: {self.window}")
+        self.max_policy_claims = (
+            settings.FRAUD_MAX_POLICY_CLAIMS_PER_WINDOW if max_policy_claims is None else max_policy_claims
+        )
+        self.max_user_claims = settings.FRAUD_MAX_USER_CLAIMS_PER_WINDOW if max_user_claims is None else max_user_claims
+        self.max_user_window_amount = (
+            settings.FRAUD_MAX_USER_WINDOW_AMOUNT if max_user_window_amount is None else max_user_window_amount
+        )
+        self.min_interval = (
+            settings.FRAUD_MIN_CLAIM_INTERVAL_SECONDS if min_interval_seconds is None else min_interval_seconds
+        )
+        self.screened = 0
+        self.flagged = 0
+        self.rejected = 0
+
+    def screen(self, db, policy, claim_data, now=None):
+        """
+        Check a claim and count it into the aggregates; returns the reasons it was flagged
+
+        Call inside the transaction that inserts the claim so both commit or roll back together.
+        """
+        if self.mode == "off":
+            return []
+        rows = [load_locked_row(db, *factory) for factory in _row_factories(policy, claim_data)]
+        return self._check_and_record(db, policy, claim_data, now, *rows)
+
+    async def screen_async(self, db, policy, claim_data, now=None):
+        if self.mode == "off":
+            return []
+        rows = [await load_locked_row_async(db, *factory) for factory in _row_factories(policy, claim_data)]
+        return self._check_and_record(db, policy, claim_data, now, *rows)
+
+    def evaluate(self, policy, claim_data, policy_stats, user_stats, evidence, now):
+        """
+        Reasons this claim looks fraudulent, from the aggregates alone
+        """
+        reasons = []
+        amount = claim_data['amount']
+        if policy.coverage_amount is not None and policy_stats.claimed_total + amount > policy.coverage_amount:
+            reasons.append(
+                f"claimed total {policy_stats.claimed_total + amount:.2f} exceeds coverage {policy.coverage_amount:.2f}"
+            )
+        policy_window_count, _ = window_totals(policy_stats, now, self.window)
+        if policy_window_count + 1 > self.max_policy_claims:
+            reasons.append(f"more than {self.max_policy_claims} claims on this policy within the window")
+        user_window_count, user_window_amount = window_totals(user_stats, now, self.window)
+        if user_window_count + 1 > self.max_user_claims:
+            reasons.append(f"more than {self.max_user_claims} claims by this user within the window")
+        if self.max_user_window_amount is not None and user_window_amount + amount > self.max_user_window_amount:
+            reasons.append(f"user claimed more than {self.max_user_window_amount:.2f} within the window")
+        last_claim_at = policy_stats.last_claim_at
+        if last_claim_at is not None and (now - last_claim_at).total_seconds() < self.min_interval:
+            reasons.append(f"previous claim on this policy was less than {self.min_interval:.0f}s ago")
+        if evidence is not None and evidence.claim_count and evidence.policy_id != policy.id:
+            reasons.append("evidence already used in a claim on another policy")
+        return reasons
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'screened': self.screened,
+            'flagged': self.flagged,
+            'rejected': self.rejected
+        }
+
+    def _check_and_record(self, db, policy, claim_data, now, policy_stats, user_stats, evidence=None):
+        now = now or datetime.utcnow()
+        reasons = self.evaluate(policy, claim_data, policy_stats, user_stats, evidence, now)
+        self.screened += 1
+        if reasons:
+            if self.mode == "reject":
+                self.rejected += 1
+                raise FraudScreeningError(f"Claim failed fraud screening: {'; '.join(reasons)}")
+            self.flagged += 1
+            logger.warning(
+                "Claim %s flagged by fraud screening: %s", claim_data['claim_id'], "; ".join(reasons),
+                extra={'policy_id': claim_data['policy_id'], 'claim_id': claim_data['claim_id']}
+            )
+
+        record_claim(policy_stats, claim_data['amount'], now, self.window)
+        record_claim(user_stats, claim_data['amount'], now, self.window)
+        if evidence is not None:
+            if not evidence.claim_count:
+                evidence.policy_id = policy.id
+            evidence.claim_count += 1
+        return reasons
+
+def rebuild_aggregates(conn, now=None, window=None):
+    """
+    Recompute every aggregate from the claims table in three set-based statements
+
+    Claims filed in the last window seed the previous bucket of a window that starts now.
+    """
+    now = now or datetime.utcnow()
+    window = window or settings.FRAUD_WINDOW_SECONDS
+    cutoff = now - timedelta(seconds=window)
+    recent = Claim.created_at >= cutoff
+    aggregate_columns = [
+        func.count(Claim.id),
+        func.coalesce(func.sum(case((Claim.status != ClaimStatus.REJECTED, Claim.amount), else_=0.0)), 0.0),
+        func.max(Claim.created_at),
+        literal(now, DateTime),
+        literal(0, Integer),
+        literal(0.0, Float),
+        func.coalesce(func.sum(case((recent, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((recent, Claim.amount), else_=0.0)), 0.0)
+    ]
+    target_columns = [
+        'claim_count', 'claimed_total', 'last_claim_at', 'window_start',
+        'window_count', 'window_amount', 'previous_window_count', 'previous_window_amount'
+    ]
+
+    for model in (PolicyClaimStats, UserClaimStats, ClaimEvidence):
+        conn.execute(delete(model))
+    conn.execute(insert(PolicyClaimStats).from_select(
+        ['policy_id', *target_columns],
+        select(Claim.policy_id, *aggregate_columns).where(Claim.policy_id.isnot(None)).group_by(Claim.policy_id)
+    ))
+    conn.execute(insert(UserClaimStats).from_select(
+        ['user_id', *target_columns],
+        select(Policy.user_id, *aggregate_columns)
+        .join(Policy, Claim.policy_id == Policy.id)
+        .where(Policy.user_id.isnot(None))
+        .group_by(Policy.user_id)
+    ))
+    conn.execute(insert(ClaimEvidence).from_select(
+        ['evidence_hash', 'policy_id', 'claim_count'],
+        select(Claim.evidence_hash, func.min(Claim.policy_id), func.count(Claim.id))
+        .where(Claim.evidence_hash.isnot(None))
+        .group_by(Claim.evidence_hash)
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the fraud screening aggregates from the claims table")
+    parser.parse_args()
+    started = time.perf_counter()
+    with get_engine().begin() as conn:
+        rebuild_aggregates(conn)
+    with get_db_session() as db:
+        counts = {model.__tablename__: db.scalar(select(func.count()).select_from(model))
+                  for model in (PolicyClaimStats, UserClaimStats, ClaimEvidence)}
+    logger.info("Rebuilt fraud screening aggregates in %.2fs: %s", time.perf_counter() - started, counts)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
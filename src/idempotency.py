@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from .models import IdempotencyKey
+from .database import get_db_session
+from .cache import LRUTTLCache
+from .exceptions import IdempotencyError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("idempotency")
+
+# Backoff for storing a completed response after the first attempt failed
+COMPLETE_RETRY_SECONDS = 0.5
+COMPLETE_MAX_RETRY_SECONDS = 30.0
+
+def fingerprint(payload):
+    """
+    Stable hash of a JSON-compatible request body
+    """
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+class IdempotencyStore:
+    """
+    Run each keyed operation at most once and replay its response to retries
+
+    A key is checked in process first (completed responses, then requests
+    still in flight in this worker, which later duplicates wait on), and
+    otherwise reserved by inserting its row before the operation runs, so a
+    duplicate arriving at another worker finds the reservation instead of
+    reaching the chain. The response is stored on the row when the operation
+    completes; if the operation fails the reservation is released and the
+    client may retry.
+
+    The worker renews its reservation while the operation runs and until the
+    response is stored, retrying that write in the background if it fails, so
+    a slow or completed operation is never mistaken for an abandoned one. A
+    reservation only lapses once its worker stopped renewing it.
+    """
+    def __init__(self, ttl=None, reservation_timeout=None, index_size=None):
+        self.ttl = ttl or settings.IDEMPOTENCY_TTL_SECONDS
+        self.reservation_timeout = reservation_timeout or settings.IDEMPOTENCY_RESERVATION_TIMEOUT_SECONDS
+        self.index = LRUTTLCache(index_size or settings.IDEMPOTENCY_INDEX_SIZE, self.ttl)
+        self._in_flight = {}
+        self._completing = set()
+        self.executed = 0
+        self.replayed = 0
+        self.coalesced = 0
+        self.conflicts = 0
+
+    async def run(self, key, request_fingerprint, operation):
+        """
+        Await operation() once per key; returns (response, replayed)
+
+        operation must return something json.dumps can store, so replays are identical to the original.
+        """
+        hit, entry = self.index.get(key)
+        if hit:
+            self._check_fingerprint(key, entry[0], request_fingerprint)
+            self.replayed += 1
+            return entry[1], True
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._check_fingerprint(key, in_flight[0], request_fingerprint)
+            self.coalesced += 1
+            return await asyncio.shield(in_flight[1]), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (request_fingerprint, future)
+        try:
+            stored = await asyncio.to_thread(self._reserve, key, request_fingerprint)
+            if stored is not None:
+                replayed = True
+                response = stored
+            else:
+                replayed = False
+                heartbeat = asyncio.create_task(self._keep_reserved(key))
+                try:
+                    response = await operation()
+                except BaseException:
+                    heartbeat.cancel()
+                    await asyncio.to_thread(self._release, key)
+                    raise
+                await self._store_response(key, request_fingerprint, response, heartbeat)
+            self.index.set(key, (request_fingerprint, response))
+            future.set_result(response)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved here, so keys nobody waited on don't log "never retrieved"
+            raise
+        finally:
+            del self._in_flight[key]
+        if replayed:
+            self.replayed += 1
+        else:
+            self.executed += 1
+        return response, replayed
+
+    def purge_expired(self, now=None):
+        """
+        Delete completed keys past their TTL and reservations abandoned past the timeout
+        """
+        now = now or datetime.utcnow()
+        with get_db_session() as db:
+            purged = db.execute(delete(IdempotencyKey).where(or_(
+                and_(IdempotencyKey.response.isnot(None),
+                     IdempotencyKey.completed_at < now - timedelta(seconds=self.ttl)),
+                and_(IdempotencyKey.response.is_(None),
+                     func.coalesce(IdempotencyKey.renewed_at, IdempotencyKey.created_at)
+                     < now - timedelta(seconds=self.reservation_timeout))
+            ))).rowcount
+            db.commit()
+        if purged:
+            logger.info("Purged %s expired idempotency keys", purged)
+        return purged
+
+    async def run_purge(self, interval=None):
+        interval = interval or settings.IDEMPOTENCY_PURGE_SECONDS
+        while True:
+            try:
+                await asyncio.to_thread(self.purge_expired)
+            except Exception as e:
+                logger.error("Error purging idempotency keys: %s", e)
+            await asyncio.sleep(interval)
+
+    def stats(self):
+        return {
+            'executed': self.executed,
+            'replayed': self.replayed,
+            'coalesced': self.coalesced,
+            'conflicts': self.conflicts,
+            'in_flight': len(self._in_flight),
+            'completing': len(self._completing)
+        }
+
+    async def _keep_reserved(self, key):
+        interval = self.reservation_timeout / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self._renew, key)
+            except Exception as e:
+                logger.error("Error renewing idempotency key %s: %s", key, e)
+
+    async def _store_response(self, key, request_fingerprint, response, heartbeat):
+        """
+        Store a completed operation's response; if that fails, keep retrying in the background
+
+        The operation already happened, so the key must not be released; the
+        client gets its response either way, and the heartbeat keeps other
+        workers from running the operation again until the write sticks.
+        """
+        try:
+            await asyncio.to_thread(self._complete, key, request_fingerprint, response)
+        except Exception as e:
+            logger.error("Error storing the response for idempotency key %s, retrying: %s", key, e)
+            task = asyncio.create_task(self._retry_store_response(key, request_fingerprint, response, heartbeat))
+            self._completing.add(task)
+            task.add_done_callback(self._completing.discard)
+            return
+        heartbeat.cancel()
+
+    async def _retry_store_response(self, key, request_fingerprint, response, heartbeat):
+        delay = COMPLETE_RETRY_SECONDS
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    await asyncio.to_thread(self._complete, key, request_fingerprint, response)
+                    return
+                except Exception as e:
+                    delay = min(delay * 2, COMPLETE_MAX_RETRY_SECONDS)
+                    logger.error("Error storing the response for idempotency key %s, retrying: %s", key, e)
+        finally:
+            heartbeat.cancel()
+
+    def _check_fingerprint(self, key, expected, actual):
+        if expected != actual:
+            self.conflicts += 1
+            raise IdempotencyError(f"Idempotency key {key} was already used for a different request")
+
+    def _reserve(self, key, request_fingerprint):
+        """
+        Claim the key in the database; returns the stored response if it already completed
+        """
+        now = datetime.utcnow()
+        with get_db_session() as db:
+            db.add(IdempotencyKey(key=key, fingerprint=request_fingerprint, created_at=now))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+
+            record = db.get(IdempotencyKey, key, with_for_update=True)
+            if record is None or self._expired(record, now):
+                # Gone or abandoned since the insert failed: take it over
+                if record is None:
+                    record = IdempotencyKey(key=key)
+                    db.add(record)
+                record.fingerprint = request_fingerprint
+                record.response = None
+                record.created_at = now
+                record.renewed_at = None
+                record.completed_at = None
+                try:
+                    db.commit()
+                except IntegrityError:
+                    self.conflicts += 1
+                    raise IdempotencyError(f"Request with idempotency key {key} is already in progress")
+                return None
+
+            self._check_fingerprint(key, record.fingerprint, request_fingerprint)
+            if record.response is None:
+                self.conflicts += 1
+                raise IdempotencyError(f"Request with idempotency key {key} is already in progress")
+            return json.loads(record.response)
+
+    def _expired(self, record, now):
+        if record.response is None:
+            return now - (record.renewed_at or record.created_at) > timedelta(seconds=self.reservation_timeout)
+        return now - record.completed_at > timedelta(seconds=self.ttl)
+
+    def _renew(self, key):
+        with get_db_session() as db:
+            db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key, IdempotencyKey.response.is_(None))
+                .values(renewed_at=datetime.utcnow())
+            )
+            db.commit()
+
+    def _complete(self, key, request_fingerprint, response):
+        with get_db_session() as db:
+            record = db.get(IdempotencyKey, key, with_for_update=True)
+            if record is None:
+                # Only a purge run on a lagging clock could have removed it; the operation still happened
+                record = IdempotencyKey(key=key, fingerprint=request_fingerprint, created_at=datetime.utcnow())
+                db.add(record)
+            record.response = json.dumps(response)
+            record.completed_at = datetime.utcnow()
+            db.commit()
+
+    def _release(self, key):
+        try:
+            with get_db_session() as db:
+                db.execute(delete(IdempotencyKey).where(
+                    IdempotencyKey.key == key, IdempotencyKey.response.is_(None)
+                ))
+                db.commit()
+        except Exception as e:
+            # The reservation then lapses after IDEMPOTENCY_RESERVATION_TIMEOUT_SECONDS
+            logger.error("Error releasing idempotency key %s: %s", key, e)
\ No newline at end of file
@@ -1,136 +1,270 @@
-from .risk_assessment import RiskAssessment
+from .model_registry import ModelRegistry
+from .risk_assessment import scored_features
 from .blockchain_contract import SmartContract
+from .transaction_manager import TransactionManager, settle_pending_claim
+from .fraud_screening import FraudScreener, forget_claim
+from .cache import query_cache, policy_key, claim_key, user_policies_key, portfolio_key
+from .portfolio_summary import PortfolioChanges, portfolio_query, format_portfolio
+from .metrics import stage_timer
 from .models import User, Policy, Claim, PolicyStatus, ClaimStatus, RiskAssessment as RiskAssessmentModel
-from .database import get_db_session
-from .exceptions import PolicyError, ClaimError, ValidationError
+from .database import get_db_session, get_read_session
+from .exceptions import PolicyError, ClaimError, ValidationError, BlockchainError
 from .logger import setup_logger
+from .config import settings
+from sqlalchemy import select
 from datetime import datetime, timedelta
 import json
+import uuid
 
 logger = setup_logger("insurance_manager")
 
+def calculate_premium(coverage_amount, risk_score):
+    """
+    Premium for a coverage amount and risk score; works element-wise on NumPy arrays
+    """
+    base_premium = coverage_amount * 0.01
+    risk_multiplier = 1 + risk_score
+    return base_premium * risk_multiplier
+
 class InsuranceManager:
-    def __init__(self, contract_address, abi_path):
-        self.risk_assessor = RiskAssessment()
-        self.smart_contract = SmartContract(contract_address, abi_path)
+    def __init__(self, contract_address, abi_path, smart_contract=None):
+        self.risk_assessor = ModelRegistry(inference_engine=settings.RISK_INFERENCE_ENGINE)
+        self.smart_contract = smart_contract or SmartContract(contract_address, abi_path)
+        self.cache = query_cache
+        self.fraud_screener = FraudScreener()
+        self.transaction_manager = None
+        if settings.CHAIN_SUBMISSION_MODE == "fire_and_reconcile":
+            self.transaction_manager = TransactionManager(self.smart_contract)
         
-    def process_insurance_application(self, user_data):
+    def process_insurance_application(self, user_data, risk_result=None):
         try:
-            logger.info(f"Processing insurance application for user: {user_data['wallet_address']}")
+            logger.info("Processing insurance application for user: %s", user_data['wallet_address'])
             
             with get_db_session() as db:
                 # Create or get user
-                user = self._get_or_create_user(db, user_data)
+                with stage_timer("insurance_manager", "get_or_create_user"):
+                    user = self._get_or_create_user(db, user_data)
                 
-                # Perform risk assessment
-                risk_result = self.risk_assessor.analyze_user_risk(user_data)
-                premium = self._calculate_premium(risk_result['risk_score'], user_data)
+                # Perform risk assessment unless the caller already scored this user
+                if risk_result is None:
+                    with stage_timer("insurance_manager", "analyze_user_risk"):
+                        risk_result = self.risk_assessor.analyze_user_risk(user_data)
                 
                 # Store risk assessment
-                risk_assessment = RiskAssessmentModel(
-                    user_id=user.id,
-                    risk_score=risk_result['risk_score'],
-                    risk_factors=json.dumps(risk_result['risk_factors'])
-                )
-                db.add(risk_assessment)
+                premium, policy_details = self._stage_risk_assessment(db, user, user_data, risk_result)
                 
                 # Create blockchain contract
-                policy_details = self._create_policy_details(user_data, premium)
-                contract_result = self.smart_contract.create_insurance_contract(
-                    user_data['wallet_address'],
-                    policy_details
-                )
+                if self.transaction_manager is not None:
+                    # Return right away; the receipt reconciler activates the policy
+                    with stage_timer("insurance_manager", "submit_policy_transaction"):
+                        contract_result = self._submit_policy_transaction(db, user_data, policy_details)
+                    status = PolicyStatus.PENDING
+                else:
+                    with stage_timer("insurance_manager", "create_insurance_contract"):
+                        receipt = self.smart_contract.create_insurance_contract(
+                            user_data['wallet_address'],
+                            policy_details
+                        )
+                    contract_result = self._policy_contract_result(receipt)
+                    status = PolicyStatus.ACTIVE
                 
                 # Store policy
-                policy = self._create_policy(db, user, contract_result, user_data, premium)
-                
-                logger.info(f"Successfully created policy {policy.policy_id}")
-                return self._format_policy_response(policy, risk_result)
+                policy, changes = self._stage_policy(db, user, contract_result, user_data, premium, status)
+                changes.apply(db)
+                with stage_timer("insurance_manager", "commit_policy"):
+                    db.commit()
+                return self._policy_created(policy, user_data, risk_result)
                 
         except Exception as e:
-            logger.error(f"Error processing insurance application: {str(e)}")
+            logger.error("Error processing insurance application: %s", e)
             raise PolicyError(f"Failed to process insurance application: {str(e)}")
     
     def submit_claim(self, claim_data):
         try:
-            logger.info(f"Processing claim for policy: {claim_data['policy_id']}")
+            logger.info(
+                "Processing claim for policy: %s", claim_data['policy_id'],
+                extra={'policy_id': claim_data['policy_id'], 'claim_id': claim_data['claim_id']}
+            )
             
             with get_db_session() as db:
                 # Validate policy
-                policy = self._validate_policy_for_claim(db, claim_data)
+                with stage_timer("insurance_manager", "validate_policy"):
+                    policy = self._validate_policy_for_claim(db, claim_data)
                 
-                # Process claim on blockchain
-                claim_result = self.smart_contract.process_claim(
-                    claim_data['claim_id'],
-                    claim_data
-                )
+                # Screen against the claim aggregates before anything goes on-chain
+                with stage_timer("insurance_manager", "fraud_screening"):
+                    self.fraud_screener.screen(db, policy, claim_data)
                 
-                # Store claim
-                claim = Claim(
-                    claim_id=claim_data['claim_id'],
-                    policy_id=policy.id,
-                    amount=claim_data['amount'],
-                    status=ClaimStatus.PROCESSING,
-                    evidence_hash=claim_data['evidence_hash'],
-                    created_at=datetime.utcnow()
-                )
-                db.add(claim)
-                db.commit()
+                claim_result = {}
+                if self.transaction_manager is not None:
+                    with stage_timer("insurance_manager", "submit_claim_transaction"):
+                        claim_result = self._submit_claim_transaction(db, claim_data)
                 
-                logger.info(f"Successfully submitted claim {claim.claim_id}")
-                return self._format_claim_response(claim, claim_result)
+                # Store claim as pending
+                claim, changes = self._stage_claim(db, policy, claim_data, claim_result)
+                stale_keys = changes.apply(db)
+                with stage_timer("insurance_manager", "commit_claim"):
+                    db.commit()
+                self.cache.invalidate(claim_key(claim.claim_id), *stale_keys)
+                
+                # Process claim on blockchain, after the commit released the aggregate rows screening locked
+                if self.transaction_manager is None:
+                    claim_result = self._process_claim_on_chain(db, claim_data)
+                
+                return self._claim_submitted(claim, claim_data, claim_result)
                 
         except Exception as e:
-            logger.error(f"Error processing claim: {str(e)}")
+            logger.error("Error processing claim: %s", e)
             raise ClaimError(f"Failed to process claim: {str(e)}")
     
     def get_policy_details(self, policy_id: str):
         try:
-            with get_db_session() as db:
-                policy = db.query(Policy).filter_by(policy_id=policy_id).first()
-                if not policy:
-                    raise PolicyError("Policy not found")
-                return self._format_policy_response(policy)
+            return self.cache.get_or_load(
+                policy_key(policy_id),
+                lambda: self._fetch_policy_details(policy_id)
+            )
         except Exception as e:
-            logger.error(f"Error fetching policy details: {str(e)}")
+            logger.error("Error fetching policy details: %s", e)
             raise PolicyError(f"Failed to fetch policy details: {str(e)}")
     
     def get_user_policies(self, wallet_address: str):
         try:
-            with get_db_session() as db:
-                user = db.query(User).filter_by(wallet_address=wallet_address).first()
-                if not user:
-                    return []
-                return [self._format_policy_response(policy) for policy in user.policies]
+            return self.cache.get_or_load(
+                user_policies_key(wallet_address),
+                lambda: self._fetch_user_policies(wallet_address)
+            )
         except Exception as e:
-            logger.error(f"Error fetching user policies: {str(e)}")
+            logger.error("Error fetching user policies: %s", e)
+            raise PolicyError(f"Failed to fetch user policies: {str(e)}")
+    
+    def get_user_policies_page(self, wallet_address: str, after_id=None, limit=None,
+                               status=None, start_from=None, start_to=None):
+        try:
+            with self._read_session(user_policies_key(wallet_address)) as db:
+                policies = db.scalars(self._user_policies_query(
+                    wallet_address, after_id, limit, status, start_from, start_to
+                )).all()
+                return self._format_policy_page(policies)
+        except Exception as e:
+            logger.error("Error fetching user policies page: %s", e)
             raise PolicyError(f"Failed to fetch user policies: {str(e)}")
     
     def get_claim_status(self, claim_id: str):
         try:
-            with get_db_session() as db:
-                claim = db.query(Claim).filter_by(claim_id=claim_id).first()
-                if not claim:
-                    raise ClaimError("Claim not found")
-                return self._format_claim_response(claim)
+            return self.cache.get_or_load(
+                claim_key(claim_id),
+                lambda: self._fetch_claim_status(claim_id)
+            )
         except Exception as e:
-            logger.error(f"Error fetching claim status: {str(e)}")
+            logger.error("Error fetching claim status: %s", e)
             raise ClaimError(f"Failed to fetch claim status: {str(e)}")
     
+    def get_portfolio_summary(self, wallet_address: str):
+        try:
+            return self.cache.get_or_load(
+                portfolio_key(wallet_address),
+                lambda: self._fetch_portfolio_summary(wallet_address)
+            )
+        except Exception as e:
+            logger.error("Error fetching portfolio summary: %s", e)
+            raise PolicyError(f"Failed to fetch portfolio summary: {str(e)}")
+    
     # Helper methods
+    def _read_session(self, cache_key):
+        # A key written within the replica lag bound may not have reached the replicas yet
+        return get_read_session(prefer_primary=self.cache.written_recently(cache_key))
+    
+    def _fetch_policy_details(self, policy_id):
+        with self._read_session(policy_key(policy_id)) as db:
+            policy = db.query(Policy).filter_by(policy_id=policy_id).first()
+            if not policy:
+                raise PolicyError("Policy not found")
+            return self._format_policy_response(policy)
+    
+    def _fetch_user_policies(self, wallet_address):
+        with self._read_session(user_policies_key(wallet_address)) as db:
+            policies = db.scalars(self._user_policies_query(wallet_address, limit=0))
+            return [self._format_policy_response(policy) for policy in policies]
+    
+    def _user_policies_query(self, wallet_address, after_id=None, limit=None,
+                             status=None, start_from=None, start_to=None):
+        """
+        Keyset-paginated policies for a wallet in one joined query; limit=0 means no limit
+        """
+        query = (
+            select(Policy)
+            .join(User, Policy.user_id == User.id)
+            .where(User.wallet_address == wallet_address)
+            .order_by(Policy.id)
+        )
+        if after_id is not None:
+            query = query.where(Policy.id > after_id)
+        if status is not None:
+            query = query.where(Policy.status == status)
+        if start_from is not None:
+            query = query.where(Policy.start_date >= start_from)
+        if start_to is not None:
+            query = query.where(Policy.start_date < start_to)
+        if limit != 0:
+            limit = min(limit or settings.USER_POLICIES_PAGE_SIZE, settings.USER_POLICIES_MAX_PAGE_SIZE)
+            query = query.limit(limit)
+        return query
+    
+    def _format_policy_page(self, policies):
+        return {
+            'policies': [self._format_policy_response(policy) for policy in policies],
+            'next_after_id': policies[-1].id if policies else None
+        }
+    
+    def _fetch_claim_status(self, claim_id):
+        with self._read_session(claim_key(claim_id)) as db:
+            claim = db.query(Claim).filter_by(claim_id=claim_id).first()
+            if not claim:
+                raise ClaimError("Claim not found")
+            return self._format_claim_response(claim)
+    
+    def _fetch_portfolio_summary(self, wallet_address):
+        with self._read_session(portfolio_key(wallet_address)) as db:
+            row = db.execute(portfolio_query(wallet_address)).first()
+            if row is None:
+                raise PolicyError("User not found")
+            return format_portfolio(row)
+    
     def _get_or_create_user(self, db, user_data):
         user = db.query(User).filter_by(wallet_address=user_data['wallet_address']).first()
         if not user:
-            user = User(
-                wallet_address=user_data['wallet_address'],
-                age=user_data['age'],
-                credit_score=user_data.get('credit_score'),
-                occupation=user_data.get('occupation')
-            )
+            user = self._build_user(user_data)
             db.add(user)
             db.commit()
         return user
     
+    def _build_user(self, user_data):
+        return User(
+            wallet_address=user_data['wallet_address'],
+            age=user_data['age'],
+            credit_score=user_data.get('credit_score'),
+            occupation=user_data.get('occupation')
+        )
+    
+    def _build_risk_assessment(self, user, risk_result):
+        return RiskAssessmentModel(
+            user_id=user.id,
+            risk_score=risk_result['risk_score'],
+            risk_factors=json.dumps(risk_result['risk_factors']),
+            model_version=risk_result.get('model_version')
+        )
+    
+    def _stage_risk_assessment(self, db, user, user_data, risk_result):
+        """
+        Add the risk assessment to db's transaction and price the policy; returns (premium, policy_details)
+
+        Shared by the sync and async managers, as are the other _stage_ steps:
+        they only add rows, so either kind of session can run them.
+        """
+        db.add(self._build_risk_assessment(user, risk_result))
+        premium = self._calculate_premium(risk_result['risk_score'], user_data)
+        return premium, self._create_policy_details(user_data, premium)
+    
     def _create_policy_details(self, user_data, premium):
         return {
             'coverage_amount': user_data['requested_coverage'],
@@ -138,50 +272,209 @@ class InsuranceManager:
             'duration': user_data['duration']
         }
     
-    def _create_policy(self, db, user, contract_result, user_data, premium):
-        policy = Policy(
+    def _submit_policy_transaction(self, db, user_data, policy_details):
+        """
+        Broadcast without waiting; the pending transaction commits with db's transaction
+        """
+        policy_key = self._placeholder_policy_id()
+        tx_hash = self.transaction_manager.submit_policy(
+            db,
+            policy_key,
+            user_data['wallet_address'],
+            policy_details
+        )
+        return self._pending_policy_result(policy_key, tx_hash)
+    
+    def _submit_claim_transaction(self, db, claim_data):
+        tx_hash = self.transaction_manager.submit_claim(db, claim_data['claim_id'], claim_data)
+        return {'tx_hash': tx_hash}
+    
+    def _process_claim_on_chain(self, db, claim_data):
+        """
+        Wait for the chain to process a stored pending claim
+
+        On success the claim moves to processing; on failure it is withdrawn,
+        so the client can retry the same claim_id as if it had never been sent.
+        """
+        claim_id = claim_data['claim_id']
+        try:
+            with stage_timer("insurance_manager", "process_claim"):
+                claim_result = self._check_receipt(self.smart_contract.process_claim(claim_id, claim_data))
+        except Exception:
+            self._commit_claim_changes(db, self._withdraw_claim(db, claim_id))
+            raise
+        self._commit_claim_changes(
+            db, self._settle_claim(db, claim_id, ClaimStatus.PROCESSING, self._receipt_tx_hash(claim_result))
+        )
+        return claim_result
+    
+    def _commit_claim_changes(self, db, stale_keys):
+        db.commit()
+        self.cache.invalidate(*stale_keys)
+    
+    def _settle_claim(self, db, claim_id, status, tx_hash=None):
+        """
+        Settle a pending claim in the caller's transaction; returns the cache keys to invalidate after commit
+        """
+        changes = PortfolioChanges()
+        settle_pending_claim(db, claim_id, status, changes, tx_hash)
+        return [claim_key(claim_id), *changes.apply(db)]
+    
+    def _withdraw_claim(self, db, claim_id):
+        """
+        Delete a pending claim whose chain call failed, with its screening counts and open-claim count
+        """
+        claim = db.query(Claim).filter_by(claim_id=claim_id).with_for_update().populate_existing().first()
+        if claim is None or claim.status != ClaimStatus.PENDING:
+            # A ClaimProcessed event says the chain has it after all
+            return [claim_key(claim_id)]
+        changes = PortfolioChanges()
+        changes.claim(claim.policy, None, old_status=claim.status)
+        forget_claim(db, claim)
+        return [claim_key(claim_id), *changes.apply(db)]
+    
+    def _receipt_tx_hash(self, receipt):
+        return receipt['transactionHash'].hex()
+    
+    def _check_receipt(self, receipt):
+        if receipt['status'] != 1:
+            raise BlockchainError(f"Transaction reverted: {self._receipt_tx_hash(receipt)}")
+        return receipt
+    
+    def _policy_contract_result(self, receipt):
+        """
+        The policy_id, contract_address and tx_hash _build_policy takes, from a mined createPolicy receipt
+        """
+        self._check_receipt(receipt)
+        policy_id = self.smart_contract.created_policy_id(receipt)
+        if policy_id is None:
+            raise BlockchainError(f"No PolicyCreated event in {self._receipt_tx_hash(receipt)}")
+        return {
+            'policy_id': policy_id,
+            'contract_address': self.smart_contract.contract_address,
+            'tx_hash': self._receipt_tx_hash(receipt)
+        }
+    
+    def _placeholder_policy_id(self):
+        # The on-chain policy id is only known once mined, so start with a placeholder
+        return f"pending-{uuid.uuid4().hex}"
+    
+    def _pending_policy_result(self, policy_key, tx_hash):
+        return {
+            'policy_id': policy_key,
+            'contract_address': self.smart_contract.contract_address,
+            'tx_hash': tx_hash
+        }
+    
+    def _stage_policy(self, db, user, contract_result, user_data, premium, status=PolicyStatus.ACTIVE):
+        """
+        Add the policy to db's transaction; returns it with the portfolio deltas to apply before commit
+        """
+        policy = self._build_policy(user, contract_result, user_data, premium, status)
+        db.add(policy)
+        changes = PortfolioChanges()
+        changes.policy(policy)
+        return policy, changes
+    
+    def _policy_created(self, policy, user_data, risk_result):
+        """
+        Once the policy is committed: drop its stale cache entries and build the response
+        """
+        self.cache.invalidate(
+            policy_key(policy.policy_id),
+            user_policies_key(user_data['wallet_address']),
+            portfolio_key(user_data['wallet_address'])
+        )
+        logger.info("Successfully created policy %s", policy.policy_id, extra={'policy_id': policy.policy_id})
+        return self._format_policy_response(policy, risk_result)
+    
+    def _build_policy(self, user, contract_result, user_data, premium, status=PolicyStatus.ACTIVE):
+        # A pending policy keeps its placeholder id; the reconciler records the on-chain id beside it
+        chain_policy_id = None if status == PolicyStatus.PENDING else contract_result['policy_id']
+        return Policy(
             policy_id=contract_result['policy_id'],
+            chain_policy_id=chain_policy_id,
             user_id=user.id,
             coverage_amount=user_data['requested_coverage'],
             premium=premium,
-            status=PolicyStatus.ACTIVE,
+            status=status,
             start_date=datetime.utcnow(),
             end_date=datetime.utcnow() + timedelta(days=user_data['duration']),
-            contract_address=contract_result['contract_address']
+            contract_address=contract_result['contract_address'],
+            tx_hash=contract_result.get('tx_hash'),
+            risk_features=json.dumps(scored_features(user_data))
+        )
+    
+    def _stage_claim(self, db, policy, claim_data, claim_result):
+        """
+        Add the claim to db's transaction as pending; returns it with the portfolio deltas to apply before commit
+        """
+        claim = self._build_claim(policy, claim_data, ClaimStatus.PENDING, claim_result.get('tx_hash'))
+        db.add(claim)
+        changes = PortfolioChanges()
+        changes.claim(policy, claim.status)
+        return claim, changes
+    
+    def _claim_submitted(self, claim, claim_data, claim_result):
+        logger.info(
+            "Successfully submitted claim %s", claim.claim_id,
+            extra={'policy_id': claim_data['policy_id'], 'claim_id': claim.claim_id}
+        )
+        return self._format_claim_response(claim, claim_result)
+    
+    def _build_claim(self, policy, claim_data, status=ClaimStatus.PROCESSING, tx_hash=None):
+        return Claim(
+            claim_id=claim_data['claim_id'],
+            policy_id=policy.id,
+            amount=claim_data['amount'],
+            status=status,
+            evidence_hash=claim_data['evidence_hash'],
+            tx_hash=tx_hash,
+            created_at=datetime.utcnow()
         )
-        db.add(policy)
-        db.commit()
-        return policy
     
     def _calculate_premium(self, risk_score, user_data):
         """
         Calculate insurance premium based on risk score and coverage
         """
-        base_premium = user_data['requested_coverage'] * 0.01
-        risk_multiplier = 1 + risk_score
-        return base_premium * risk_multiplier
+        return calculate_premium(user_data['requested_coverage'], risk_score)
     
     def _validate_policy_for_claim(self, db, claim_data):
         policy = db.query(Policy).filter_by(policy_id=claim_data['policy_id']).first()
         if not policy:
             raise PolicyError("Policy not found")
+        self._check_policy_claimable(policy)
+        # Caught here rather than by the unique constraint at commit, which comes after the chain call
+        if db.query(Claim.id).filter_by(claim_id=claim_data['claim_id']).first() is not None:
+            raise ClaimError(f"Claim {claim_data['claim_id']} was already submitted")
         return policy
     
-    def _format_policy_response(self, policy, risk_result):
+    def _check_policy_claimable(self, policy):
+        # The expiration sweeper runs periodically, so a policy can be past its end date and still ACTIVE
+        if policy.status in (PolicyStatus.EXPIRED, PolicyStatus.CANCELLED):
+            raise PolicyError(f"Policy is {policy.status.value}")
+        if policy.end_date is not None and policy.end_date < datetime.utcnow():
+            raise PolicyError("Policy is expired")
+    
+    def _format_policy_response(self, policy, risk_result=None):
         return {
             'policy_id': policy.policy_id,
-            'risk_score': risk_result['risk_score'],
+            'chain_policy_id': policy.chain_policy_id,
+            'risk_score': risk_result['risk_score'] if risk_result else None,
             'premium': policy.premium,
-            'contract_address': policy.contract_address
+            'contract_address': policy.contract_address,
+            'status': policy.status,
+            'tx_hash': policy.tx_hash
         }
     
-    def _format_claim_response(self, claim, claim_result):
+    def _format_claim_response(self, claim, claim_result=None):
         return {
             'claim_id': claim.claim_id,
             'policy_id': claim.policy_id,
             'amount': claim.amount,
             'status': claim.status,
             'evidence_hash': claim.evidence_hash,
+            'tx_hash': claim.tx_hash,
             'created_at': claim.created_at,
             'result': claim_result
         } 
\ No newline at end of file
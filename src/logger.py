@@ -1,37 +1,176 @@
+import atexit
+import json
 import logging
+import queue
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from .config import settings
 
-# Create logs directory if it doesn't exist
-log_dir = Path("logs")
-log_dir.mkdir(exist_ok=True)
+# Id of the API request being served; the API middleware sets it per request
+request_id_var = ContextVar("request_id", default=None)
+
+CONTEXT_FIELDS = ('request_id', 'policy_id', 'claim_id')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+FILE_TEXT_FORMAT = TEXT_FORMAT + ' - [%(filename)s:%(lineno)d]'
+
+class ContextFilter(logging.Filter):
+    """
+    Stamp the current request id on each record; policy and claim ids come in through extra=
+    """
+    def filter(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+class InfoSampler(logging.Filter):
+    """
+    Let at most `rate` INFO-and-below records per second through for each message template
+
+    Warnings and errors always pass. Templates are the unformatted message, so
+    this only groups calls that pass their values as logging arguments. The next
+    record let through for a template reports how many were dropped before it.
+    """
+    MAX_TEMPLATES = 10000
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(rate, 1.0)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.MAX_TEMPLATES and key not in self._buckets:
+                self._buckets.clear()
+            tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        record.suppressed = suppressed
+        return True
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        if getattr(record, 'suppressed', 0):
+            message += f" [{record.suppressed} similar suppressed]"
+        return message
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record, with the request, policy and claim ids when known
+    """
+    def format(self, record):
+        entry = {
+            'timestamp': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'source': f"{record.filename}:{record.lineno}"
+        }
+        for field in CONTEXT_FIELDS + ('suppressed',):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        return json.dumps(entry, default=str)
+
+class PerLoggerFileHandler(logging.Handler):
+    """
+    Write each logger's records to <log_dir>/<name>.log, opening the file on first use
+    """
+    def __init__(self, log_dir, formatter):
+        super().__init__()
+        self.log_dir = Path(log_dir)
+        self.setFormatter(formatter)
+        self._handlers = {}
+
+    def emit(self, record):
+        handler = self._handlers.get(record.name)
+        if handler is None:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                self.log_dir / f"{record.name}.log",
+                maxBytes=10485760,  # 10MB
+                backupCount=5
+            )
+            handler.setFormatter(self.formatter)
+            self._handlers[record.name] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        super().close()
+
+class LogPipeline:
+    """
+    Queue-backed logging: callers only enqueue, one listener thread does all the I/O
+
+    Records are filtered (context ids, INFO sampling) and their message
+    formatted in the calling thread, and only when the level is enabled;
+    writing to stdout and the log files happens on the listener thread.
+    """
+    def __init__(self, stream=None, log_dir=None, log_format=None, to_file=None, info_rate_limit=None):
+        log_format = log_format or settings.LOG_FORMAT
+        to_file = settings.LOG_TO_FILE if to_file is None else to_file
+        info_rate_limit = settings.LOG_INFO_RATE_LIMIT if info_rate_limit is None else info_rate_limit
+
+        json_output = log_format == "json"
+        console_handler = logging.StreamHandler(stream or sys.stdout)
+        console_handler.setFormatter(JsonFormatter() if json_output else TextFormatter(TEXT_FORMAT))
+        handlers = [console_handler]
+        if to_file:
+            file_formatter = JsonFormatter() if json_output else TextFormatter(FILE_TEXT_FORMAT)
+            handlers.append(PerLoggerFileHandler(log_dir or settings.LOG_DIR, file_formatter))
+
+        self.queue = queue.SimpleQueue()
+        self.handler = QueueHandler(self.queue)
+        self.handler.addFilter(ContextFilter())
+        if info_rate_limit > 0:
+            self.handler.addFilter(InfoSampler(info_rate_limit))
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.handlers = handlers
+
+    def start(self):
+        self.listener.start()
+        return self
+
+    def stop(self):
+        """
+        Drain the queue and close the files
+        """
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def attach(self, logger, level=None):
+        # Installed once per logger, however many times setup_logger is called for it
+        if not any(isinstance(handler, QueueHandler) for handler in logger.handlers):
+            logger.setLevel(level or settings.LOG_LEVEL)
+            logger.addHandler(self.handler)
+        return logger
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline():
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = LogPipeline().start()
+            atexit.register(_pipeline.stop)
+        return _pipeline
 
-# Configure logging
 def setup_logger(name):
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(console_format)
-    
-    # File handler
-    file_handler = RotatingFileHandler(
-        log_dir / f"{name}.log",
-        maxBytes=10485760,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.INFO)
-    file_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s - [%(filename)s:%(lineno)d]'
-    )
-    file_handler.setFormatter(file_format)
-    
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-    
-    return logger 
\ No newline at end of file
+    return get_pipeline().attach(logging.getLogger(name))
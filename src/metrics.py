@@ -0,0 +1,140 @@
+import bisect
+import threading
+import time
+from .config import settings
+
+# Upper bounds in seconds; covers cache hits through multi-block receipt waits
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram; observe() is a bisect and three additions under a lock
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class HistogramFamily:
+    """
+    Histograms of one metric keyed by label values, created on first use
+    """
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for values, histogram in sorted(self.children.items()):
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, values))
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Latency histograms plus gauges read from component stats() at scrape time
+    """
+    def __init__(self):
+        self.stage_seconds = HistogramFamily(
+            "secur_stage_duration_seconds",
+            "Time spent in each stage of request handling",
+            ("component", "stage")
+        )
+        self.request_seconds = HistogramFamily(
+            "secur_http_request_duration_seconds",
+            "HTTP request latency by endpoint",
+            ("endpoint", "method", "status")
+        )
+        self._gauge_sources = {}
+
+    def register_gauges(self, prefix, source):
+        """
+        Export every numeric value of source() as a gauge named secur_<prefix>_<key>
+        """
+        self._gauge_sources[prefix] = source
+
+    def render(self):
+        """
+        Everything in the Prometheus text exposition format
+        """
+        lines = self.stage_seconds.render() + self.request_seconds.render()
+        for prefix, source in sorted(self._gauge_sources.items()):
+            try:
+                values = source()
+            except Exception as e:
+                lines.append(f"# {prefix} unavailable: {str(e)}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"secur_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+metrics = MetricsRegistry()
+
+def stage_timer(component, stage):
+    """
+    Context manager recording how long one stage of a component took
+    """
+    if not settings.METRICS_ENABLED:
+        return _NULL_TIMER
+    return metrics.stage_seconds.labels(component, stage).time()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import asyncio
+from .exceptions import RiskAssessmentError
+from .logger import setup_logger
+
+logger = setup_logger("micro_batcher")
+
+class RiskScoringBatcher:
+    """
+    Coalesce concurrent risk scoring requests into one model call
+    """
+    def __init__(self, risk_assessor, window_ms=2.0, max_batch_size=64, executor=None):
+        self.risk_assessor = risk_assessor
+        self.executor = executor
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._loop = None
+        self._worker = None
+        self._in_flight = []
+        self._batches = 0
+        self._requests = 0
+        self._max_seen = 0
+        self._size_counts = {}
+
+    async def score(self, user_data):
+        """
+        Queue one scoring request and wait for its own result
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user_data, future))
+        return await future
+
+    def stats(self):
+        """
+        Report batch-size statistics
+        """
+        return {
+            'batches': self._batches,
+            'requests': self._requests,
+            'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+            'max_batch_size': self._max_seen,
+            'batch_size_counts': dict(sorted(self._size_counts.items())),
+            'window_ms': self.window * 1000,
+            'max_batch_limit': self.max_batch_size
+        }
+
+    async def close(self):
+        """
+        Stop the worker and fail every request it hasn't answered, in flight or still queued
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        pending, self._in_flight = self._in_flight, []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RiskAssessmentError("Risk scoring batcher closed"))
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        # A restarted worker drains the same queue, so requests already waiting are still served;
+        # only a new event loop, whose callers can't be waiting on the old one, gets a new queue
+        if self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # Requests taken off the queue are only reachable from here until they are answered
+            self._in_flight = batch
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._score_batch(loop, batch)
+            except Exception as e:
+                logger.error("Error handling batch of %d: %s", len(batch), e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self._in_flight = []
+
+    async def _score_batch(self, loop, batch):
+        # Callers that gave up while queued don't need a row in the batch
+        batch = [(user_data, future) for user_data, future in batch if not future.done()]
+        if not batch:
+            return
+
+        self._record(len(batch))
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.risk_assessor.analyze_batch, [user_data for user_data, _ in batch]
+            )
+        except Exception as e:
+            logger.error("Error scoring batch of %d: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size):
+        self._batches += 1
+        self._requests += size
+        self._max_seen = max(self._max_seen, size)
+        self._size_counts[size] = self._size_counts.get(size, 0) + 1
\ No newline at end of file
@@ -0,0 +1,157 @@
+from sqlalchemy import inspect, text
+from datetime import datetime
+from .logger import setup_logger
+
+logger = setup_logger("migrations")
+
+def _add_transaction_tracking(conn):
+    """
+    tx_hash columns and the PENDING policy status used by fire-and-reconcile submission
+    """
+    inspector = inspect(conn)
+    for table in ('policies', 'claims'):
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'tx_hash' not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN tx_hash VARCHAR(66)"))
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text("ALTER TYPE policystatus ADD VALUE IF NOT EXISTS 'PENDING'"))
+
+def _add_hot_path_indexes(conn):
+    """
+    Indexes on the columns InsuranceManager and the background jobs filter and join on
+    """
+    indexes = [
+        ('ix_policies_user_id_id', 'policies', 'user_id, id'),
+        ('ix_policies_status_end_date', 'policies', 'status, end_date'),
+        ('ix_policies_end_date', 'policies', 'end_date'),
+        ('ix_policies_tx_hash', 'policies', 'tx_hash'),
+        ('ix_claims_policy_id', 'claims', 'policy_id'),
+        ('ix_claims_status', 'claims', 'status'),
+        ('ix_claims_tx_hash', 'claims', 'tx_hash'),
+        ('ix_risk_assessments_user_id', 'risk_assessments', 'user_id'),
+    ]
+    for name, table, columns in indexes:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+def _add_model_version(conn):
+    """
+    Model version that produced each risk assessment
+    """
+    columns = {column['name'] for column in inspect(conn).get_columns('risk_assessments')}
+    if 'model_version' not in columns:
+        conn.execute(text("ALTER TABLE risk_assessments ADD COLUMN model_version VARCHAR(50)"))
+
+def _backfill_claim_aggregates(conn):
+    """
+    Fraud screening aggregates for claims filed before they were maintained on write
+    """
+    from .fraud_screening import rebuild_aggregates
+    rebuild_aggregates(conn)
+
+def _backfill_portfolio_summaries(conn):
+    """
+    Wallet portfolio summaries for policies and claims written before they were maintained on write
+    """
+    from .portfolio_summary import rebuild_portfolio_summaries
+    rebuild_portfolio_summaries(conn)
+
+def _add_chain_policy_id(conn):
+    """
+    On-chain policy id kept beside the public one, so a placeholder handed to a client stays valid
+    """
+    columns = {column['name'] for column in inspect(conn).get_columns('policies')}
+    if 'chain_policy_id' not in columns:
+        conn.execute(text("ALTER TABLE policies ADD COLUMN chain_policy_id VARCHAR(100)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_policies_chain_policy_id ON policies (chain_policy_id)"))
+    conn.execute(text(
+        "UPDATE policies SET chain_policy_id = policy_id "
+        "WHERE chain_policy_id IS NULL AND policy_id NOT LIKE 'pending-%'"
+    ))
+
+def _backfill_pending_transactions(conn):
+    """
+    Pending transactions of PENDING policies and claims, tracked in memory before they were kept in the database
+    """
+    for kind, table, key in (('policy', 'policies', 'policy_id'), ('claim', 'claims', 'claim_id')):
+        # No nonce or payload: the reconciler can only detect whether these were mined or dropped
+        conn.execute(text(
+            f"INSERT INTO pending_transactions (kind, key, tx_hashes, replacements, submitted_at) "
+            f"SELECT :kind, {key}, '[\"' || tx_hash || '\"]', 0, :now FROM {table} "
+            f"WHERE status = 'PENDING' AND tx_hash IS NOT NULL AND NOT EXISTS ("
+            f"SELECT 1 FROM pending_transactions p WHERE p.kind = :kind AND p.key = {table}.{key})"
+        ), {'kind': kind, 'now': datetime.utcnow()})
+
+def _add_event_block_numbers(conn):
+    """
+    Block of the chain event each policy and claim was last written from, so a reorg rewind can find them
+    """
+    inspector = inspect(conn)
+    for table in ('policies', 'claims'):
+        columns = {column['name'] for column in inspector.get_columns(table)}
+        if 'block_number' not in columns:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN block_number INTEGER"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_block_number ON {table} (block_number)"))
+
+def _add_idempotency_heartbeat(conn):
+    """
+    Heartbeat column, so a reservation only lapses once the worker running the request is gone
+    """
+    columns = {column['name'] for column in inspect(conn).get_columns('idempotency_keys')}
+    if 'renewed_at' not in columns:
+        conn.execute(text("ALTER TABLE idempotency_keys ADD COLUMN renewed_at TIMESTAMP"))
+
+def _add_policy_risk_features(conn):
+    """
+    Features each policy's premium was scored on, so re-rating and training see what serving saw
+    """
+    columns = {column['name'] for column in inspect(conn).get_columns('policies')}
+    if 'risk_features' not in columns:
+        conn.execute(text("ALTER TABLE policies ADD COLUMN risk_features TEXT"))
+
+# Ordered, append-only. Each step must be idempotent because create_all already
+# builds the current schema on a fresh database before migrations run.
+MIGRATIONS = [
+    (1, "Transaction tracking columns", _add_transaction_tracking),
+    (2, "Hot path indexes", _add_hot_path_indexes),
+    (3, "Risk assessment model version", _add_model_version),
+    (4, "Claim aggregates backfill", _backfill_claim_aggregates),
+    (5, "Portfolio summaries backfill", _backfill_portfolio_summaries),
+    (6, "On-chain policy id column", _add_chain_policy_id),
+    (7, "Pending transactions backfill", _backfill_pending_transactions),
+    (8, "Chain event block numbers", _add_event_block_numbers),
+    (9, "Idempotency reservation heartbeat", _add_idempotency_heartbeat),
+    (10, "Policy risk features", _add_policy_risk_features),
+]
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+def run_migrations(engine):
+    """
+    Apply every migration newer than the database's recorded schema version
+    """
+    done = applied_versions(engine)
+    for version, description, upgrade in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        logger.info("Applied migration %s: %s", version, description)
+
+if __name__ == "__main__":
+    from .database import init_db
+    init_db()
\ No newline at end of file
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from .risk_assessment import RiskAssessment
+from .exceptions import RiskAssessmentError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("model_registry")
+
+class ModelRegistry:
+    """
+    Serve risk scoring from the active model version and hot-swap new ones in
+
+    A new artifact is loaded and warmed up beside the active model while it
+    keeps serving. Activation is a single reference assignment, so calls that
+    already started finish on the model they began with.
+    """
+    def __init__(self, inference_engine=None, model_path=None, model_version=None, model_dir=None):
+        self.inference_engine = inference_engine or settings.RISK_INFERENCE_ENGINE
+        self.model_path = model_path or settings.MODEL_PATH
+        self.model_dir = model_dir or settings.MODEL_DIR
+        self.model_version = model_version or settings.MODEL_VERSION
+        self.current = RiskAssessment(inference_engine=self.inference_engine)
+        self.loaded_path = None
+        self.loaded_at = None
+        self.load_ms = None
+        self.warmup_ms = None
+        self.swaps = 0
+        self._swap_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def analyze_user_risk(self, user_data):
+        return self.current.analyze_user_risk(user_data)
+
+    def analyze_batch(self, users_data):
+        return self.current.analyze_batch(users_data)
+
+    def preload(self):
+        """
+        Load the configured artifact at startup; without one the unfitted model stays in place
+        """
+        if not os.path.exists(self.model_path):
+            logger.error("Model artifact %s not found; risk scoring is unavailable", self.model_path)
+            return self.info()
+        return self.swap()
+
+    def swap(self, path=None, version=None, compiled_only=False):
+        """
+        Load, warm up and activate a model artifact (default: the configured one)
+
+        The version comes from the argument, then the artifact itself, then
+        MODEL_VERSION for the configured path. A failed load or warm-up raises
+        and leaves the active model untouched. path must be trusted: only
+        compiled artifacts are safe to load from anywhere else.
+        """
+        fallback_version = self.model_version if path is None else None
+        path = path or self.model_path
+        with self._swap_lock:
+            assessor = RiskAssessment(inference_engine=self.inference_engine)
+            started = time.perf_counter()
+            try:
+                assessor.load_model(path, version, compiled_only=compiled_only)
+            except Exception as e:
+                raise RiskAssessmentError(f"Failed to load model from {path}: {str(e)}")
+            assessor.version = assessor.version or fallback_version or os.path.basename(path)
+            loaded = time.perf_counter()
+            self._warm_up(assessor)
+            self.load_ms = (loaded - started) * 1000
+            self.warmup_ms = (time.perf_counter() - loaded) * 1000
+            self.loaded_path = path
+            self.activate(assessor)
+        return self.info()
+
+    def swap_artifact(self, name=None, version=None):
+        """
+        Hot-swap requested over the API: the configured artifact, or one named inside MODEL_DIR
+
+        Only compiled artifacts are accepted; they are memory-mapped arrays,
+        whereas loading a pickle would run whatever code it contains.
+        """
+        path = None if name is None else self.resolve_artifact(name)
+        return self.swap(path, version, compiled_only=True)
+
+    def resolve_artifact(self, name):
+        """
+        Path of the artifact called name directly inside MODEL_DIR; other names are refused
+        """
+        model_dir = os.path.realpath(self.model_dir)
+        path = os.path.realpath(os.path.join(model_dir, name))
+        if os.path.dirname(path) != model_dir:
+            raise RiskAssessmentError(f"Model artifact {name} is not in {self.model_dir}")
+        return path
+
+    def activate(self, assessor):
+        """
+        Make an already fitted RiskAssessment the one every new call uses
+        """
+        previous = self.current.version
+        self.current = assessor
+        self.loaded_at = datetime.utcnow()
+        self.swaps += 1
+        logger.info("Activated risk model %s (previous: %s)", assessor.version, previous)
+
+    def install_reload_signal(self, loop, signum=None):
+        """
+        Swap to the configured artifact whenever the process receives SIGHUP
+        """
+        signum = signum or getattr(signal, 'SIGHUP', None)
+        if signum is None:
+            return False
+        try:
+            loop.add_signal_handler(signum, lambda: loop.create_task(self._reload_on_signal()))
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops and non-main threads can't install signal handlers
+            return False
+        return True
+
+    def info(self):
+        return {
+            'version': self.version,
+            'path': self.loaded_path,
+            'inference_engine': self.current.inference_engine,
+            'loaded_at': self.loaded_at,
+            'load_ms': self.load_ms,
+            'warmup_ms': self.warmup_ms,
+            'swaps': self.swaps
+        }
+
+    async def _reload_on_signal(self):
+        try:
+            await asyncio.to_thread(self.swap)
+        except Exception as e:
+            logger.error("Error reloading risk model: %s", e)
+
+    def _warm_up(self, assessor):
+        # One prediction touches every tree before real traffic does and proves the artifact scores
+        try:
+            risk_score = assessor.analyze_batch([{}])[0]['risk_score']
+        except Exception as e:
+            raise RiskAssessmentError(f"Model {assessor.version} failed warm-up: {str(e)}")
+        if not 0.0 <= risk_score <= 1.0:
+            raise RiskAssessmentError(f"Model {assessor.version} failed warm-up: risk score {risk_score}")
\ No newline at end of file
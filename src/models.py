@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, DateTime, ForeignKey, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -7,6 +7,7 @@ import enum
 Base = declarative_base()
 
 class PolicyStatus(enum.Enum):
+    PENDING = "pending"
     ACTIVE = "active"
     EXPIRED = "expired"
     CANCELLED = "cancelled"
@@ -32,9 +33,18 @@ class User(Base):
 
 class Policy(Base):
     __tablename__ = 'policies'
+    __table_args__ = (
+        Index('ix_policies_user_id_id', 'user_id', 'id'),  # wallet listings, keyset-paginated by id
+        Index('ix_policies_status_end_date', 'status', 'end_date'),
+        Index('ix_policies_end_date', 'end_date'),
+        Index('ix_policies_tx_hash', 'tx_hash'),
+        Index('ix_policies_chain_policy_id', 'chain_policy_id'),
+        Index('ix_policies_block_number', 'block_number'),
+    )
     
     id = Column(Integer, primary_key=True)
-    policy_id = Column(String(100), unique=True)
+    policy_id = Column(String(100), unique=True)  # returned to clients; never changes once issued
+    chain_policy_id = Column(String(100))  # the contract's id, known once the creation is mined
     user_id = Column(Integer, ForeignKey('users.id'))
     coverage_amount = Column(Float)
     premium = Column(Float)
@@ -42,12 +52,21 @@ class Policy(Base):
     start_date = Column(DateTime)
     end_date = Column(DateTime)
     contract_address = Column(String(42))
+    tx_hash = Column(String(66))
+    block_number = Column(Integer)  # block of the last chain event applied; NULL until one is
+    risk_features = Column(Text)  # JSON features the premium was scored on; NULL for chain-ingested policies
     
     user = relationship("User", back_populates="policies")
     claims = relationship("Claim", back_populates="policy")
 
 class Claim(Base):
     __tablename__ = 'claims'
+    __table_args__ = (
+        Index('ix_claims_policy_id', 'policy_id'),
+        Index('ix_claims_status', 'status'),
+        Index('ix_claims_tx_hash', 'tx_hash'),
+        Index('ix_claims_block_number', 'block_number'),
+    )
     
     id = Column(Integer, primary_key=True)
     claim_id = Column(String(100), unique=True)
@@ -55,18 +74,126 @@ class Claim(Base):
     amount = Column(Float)
     status = Column(Enum(ClaimStatus))
     evidence_hash = Column(String(66))  # IPFS hash
+    tx_hash = Column(String(66))
     created_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime)
+    block_number = Column(Integer)  # block of the last chain event applied; NULL until one is
     
     policy = relationship("Policy", back_populates="claims")
 
 class RiskAssessment(Base):
     __tablename__ = 'risk_assessments'
+    __table_args__ = (
+        Index('ix_risk_assessments_user_id', 'user_id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     risk_score = Column(Float)
     risk_factors = Column(String(500))  # JSON string
+    model_version = Column(String(50))
     assessment_date = Column(DateTime, default=datetime.utcnow)
     
-    user = relationship("User", back_populates="risk_assessments") 
\ No newline at end of file
+    user = relationship("User", back_populates="risk_assessments") 
+
+class EventCheckpoint(Base):
+    __tablename__ = 'event_checkpoints'
+    
+    name = Column(String(100), primary_key=True)
+    last_block = Column(Integer, nullable=False)
+    last_block_hash = Column(String(66))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Evidence(Base):
+    __tablename__ = 'evidence'
+    
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), unique=True, nullable=False)  # content-hash index for dedup
+    evidence_hash = Column(String(66), nullable=False)  # IPFS hash, as stored on claims
+    size = Column(BigInteger)
+    filename = Column(String(255))
+    content_type = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ClaimAggregateColumns:
+    """
+    Running claim totals plus a two-bucket sliding window, maintained as claims are written
+    """
+    claim_count = Column(Integer, nullable=False, default=0)
+    claimed_total = Column(Float, nullable=False, default=0.0)  # claims not rejected
+    last_claim_at = Column(DateTime)
+    window_start = Column(DateTime)
+    window_count = Column(Integer, nullable=False, default=0)
+    window_amount = Column(Float, nullable=False, default=0.0)
+    previous_window_count = Column(Integer, nullable=False, default=0)
+    previous_window_amount = Column(Float, nullable=False, default=0.0)
+
+class PolicyClaimStats(ClaimAggregateColumns, Base):
+    __tablename__ = 'policy_claim_stats'
+    
+    policy_id = Column(Integer, ForeignKey('policies.id'), primary_key=True)
+
+class UserClaimStats(ClaimAggregateColumns, Base):
+    __tablename__ = 'user_claim_stats'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+
+class ClaimEvidence(Base):
+    __tablename__ = 'claim_evidence'
+    
+    evidence_hash = Column(String(66), primary_key=True)
+    policy_id = Column(Integer, ForeignKey('policies.id'))  # first policy that claimed with it
+    claim_count = Column(Integer, nullable=False, default=0)
+
+class UserPortfolioSummary(Base):
+    """
+    Per-wallet totals, adjusted by every write to one of the user's policies or claims
+    """
+    __tablename__ = 'user_portfolio_summaries'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    policy_count = Column(Integer, nullable=False, default=0)
+    active_policy_count = Column(Integer, nullable=False, default=0)
+    total_coverage = Column(Float, nullable=False, default=0.0)  # active policies
+    total_premium = Column(Float, nullable=False, default=0.0)  # active policies
+    open_claim_count = Column(Integer, nullable=False, default=0)  # pending or processing
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_keys'
+    
+    key = Column(String(255), primary_key=True)  # "<operation>:<claim_id or client key>"
+    fingerprint = Column(String(64), nullable=False)  # SHA-256 of the request body
+    response = Column(Text)  # JSON; NULL while the first request is still in flight
+    created_at = Column(DateTime, default=datetime.utcnow)
+    renewed_at = Column(DateTime)  # last heartbeat of the worker running the request
+    completed_at = Column(DateTime)
+
+class TransactionNonce(Base):
+    """
+    Next nonce for a sender, shared by every worker; its row lock serializes submissions
+    """
+    __tablename__ = 'transaction_nonces'
+    
+    sender_address = Column(String(42), primary_key=True)
+    next_nonce = Column(Integer)  # NULL: re-read the node's pending count on the next allocation
+
+class PendingTransaction(Base):
+    """
+    A submitted transaction awaiting its receipt, leased to one worker's reconciler at a time
+    """
+    __tablename__ = 'pending_transactions'
+    __table_args__ = (
+        Index('ix_pending_transactions_lease_until', 'lease_until'),
+    )
+    
+    kind = Column(String(10), primary_key=True)  # "policy" or "claim"
+    key = Column(String(100), primary_key=True)  # policy or claim id
+    tx_hashes = Column(Text, nullable=False)  # JSON list of every broadcast of this nonce, oldest first
+    nonce = Column(Integer)
+    gas_price = Column(BigInteger)
+    replacements = Column(Integer, nullable=False, default=0)
+    payload = Column(Text)  # JSON arguments to rebroadcast with; NULL for rows recovered by migration
+    owner = Column(String(100))  # worker holding the lease
+    lease_until = Column(DateTime)
+    submitted_at = Column(DateTime, default=datetime.utcnow)  # last broadcast
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from sqlalchemy import select, update
+from .models import User, Policy, PolicyStatus
+from .database import get_db_session
+from .cache import query_cache, policy_key, user_policies_key
+from .portfolio_summary import PortfolioChanges
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("policy_expiration")
+
+class PolicyExpirationSweeper:
+    """
+    Mark active policies past their end date as expired, in bounded set-based batches
+
+    Each batch is one UPDATE over at most batch_size ids picked through the
+    (status, end_date) index and committed on its own, so row locks are held
+    briefly. On PostgreSQL the candidates are locked with SKIP LOCKED, letting
+    several workers sweep at once without waiting on each other or on live
+    writes. Expired policy ids go to on_expired after every batch.
+    """
+    def __init__(self, batch_size=None, pause=None, on_expired=None, cache=None):
+        self.batch_size = batch_size or settings.EXPIRATION_BATCH_SIZE
+        self.pause = settings.EXPIRATION_BATCH_PAUSE_SECONDS if pause is None else pause
+        self.on_expired = on_expired
+        self.cache = cache or query_cache
+        self.expired = 0
+
+    def sweep(self, now=None):
+        """
+        Expire everything due as of now; returns how many policies were expired
+        """
+        now = now or datetime.utcnow()
+        expired = 0
+        while True:
+            policy_ids = self.expire_batch(now)
+            expired += len(policy_ids)
+            if len(policy_ids) < self.batch_size:
+                break
+            # Let live traffic at the rows between batches
+            time.sleep(self.pause)
+        if expired:
+            logger.info("Expired %s policies ending before %s", expired, now.isoformat())
+        return expired
+
+    def expire_batch(self, now):
+        """
+        Expire one batch in its own transaction and return the policy ids it changed
+        """
+        with get_db_session() as db:
+            expired = db.execute(
+                update(Policy)
+                .where(Policy.id.in_(self._candidates(now).scalar_subquery()), Policy.status == PolicyStatus.ACTIVE)
+                .values(status=PolicyStatus.EXPIRED)
+                .returning(Policy.policy_id, Policy.user_id, Policy.status, Policy.coverage_amount, Policy.premium),
+                execution_options={'synchronize_session': False}
+            ).all()
+            if not expired:
+                return []
+            wallet_addresses = db.scalars(
+                select(User.wallet_address).where(User.id.in_({row.user_id for row in expired}))
+            ).all()
+            changes = PortfolioChanges()
+            for row in expired:
+                changes.policy(row, old_status=PolicyStatus.ACTIVE)
+            portfolio_keys = changes.apply(db)
+            db.commit()
+
+        policy_ids = [row.policy_id for row in expired]
+        self.expired += len(policy_ids)
+        self.cache.invalidate(
+            *[policy_key(policy_id) for policy_id in policy_ids],
+            *[user_policies_key(wallet_address) for wallet_address in wallet_addresses],
+            *portfolio_keys
+        )
+        if self.on_expired is not None:
+            try:
+                self.on_expired(policy_ids)
+            except Exception as e:
+                logger.error("Error notifying expired policies: %s", e)
+        return policy_ids
+
+    async def run(self, interval=None):
+        interval = interval or settings.EXPIRATION_SWEEP_SECONDS
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error("Error sweeping expired policies: %s", e)
+            await asyncio.sleep(interval)
+
+    def _candidates(self, now):
+        return (
+            select(Policy.id)
+            .where(Policy.status == PolicyStatus.ACTIVE, Policy.end_date < now)
+            .order_by(Policy.end_date)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Expire active policies past their end date")
+    parser.add_argument("--batch-size", type=int, help="policies per UPDATE")
+    parser.add_argument("--print-ids", action="store_true", help="print each expired policy id")
+    args = parser.parse_args()
+
+    on_expired = None
+    if args.print_ids:
+        on_expired = lambda policy_ids: print("\n".join(policy_ids))
+    sweeper = PolicyExpirationSweeper(batch_size=args.batch_size, on_expired=on_expired)
+    started = time.perf_counter()
+    expired = sweeper.sweep()
+    logger.info("Expired %s policies in %.2fs", expired, time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,202 @@
+import argparse
+import json
+import time
+import numpy as np
+from sqlalchemy import select, update, func, bindparam
+from .insurance_manager import calculate_premium
+from .risk_assessment import extract_feature_matrix
+from .models import User, Policy, Claim, PolicyStatus
+from .database import get_db_session
+from .cache import query_cache, policy_key, user_policies_key
+from .portfolio_summary import PortfolioChanges
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("portfolio_rerating")
+
+# Relative premium change, in percent, for the delta distribution
+DELTA_BUCKETS = (-50, -25, -10, -5, -1, 1, 5, 10, 25, 50)
+
+class PortfolioRerater:
+    """
+    Re-price every active policy with one model version
+
+    Active policies are walked in keyset-paged chunks by id. Each chunk is
+    scored as one feature matrix, repriced with array arithmetic and written
+    back with a single executemany UPDATE, so memory stays flat however large
+    the book is. Only the stored premium changes; on-chain terms are untouched.
+
+    Each policy is scored on the features stored when it was priced, so an
+    unchanged model leaves its premium unchanged. Policies without them, such
+    as ones recorded from chain events, are rebuilt from the holder's profile.
+    """
+    def __init__(self, risk_assessor, chunk_size=None, cache=None):
+        self.risk_assessor = risk_assessor
+        self.chunk_size = chunk_size or settings.RERATING_CHUNK_SIZE
+        self.cache = cache or query_cache
+        self.policies = 0
+        self.updated = 0
+        self.premium_before = 0.0
+        self.premium_after = 0.0
+        self.increased = 0
+        self.decreased = 0
+        self.bucket_counts = np.zeros(len(DELTA_BUCKETS) + 1, dtype=np.int64)
+        self.started = None
+
+    def run(self, dry_run=False):
+        """
+        Re-rate the whole active book; with dry_run nothing is written
+        """
+        self.started = time.perf_counter()
+        after_id = 0
+        while True:
+            with get_db_session() as db:
+                rows = db.execute(self._page_query(after_id, lock=not dry_run)).all()
+                if not rows:
+                    break
+                stale_keys = self._rerate_chunk(db, rows, dry_run)
+            after_id = rows[-1].id
+            self.cache.invalidate(*stale_keys)
+        stats = self.stats()
+        logger.info(
+            "Re-rated %s active policies with model %s at %.0f policies/sec (dry run: %s)",
+            stats["policies"], stats["model_version"], stats["policies_per_second"], dry_run,
+        )
+        return stats
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        labels = [f"< {DELTA_BUCKETS[0]}%"]
+        labels += [f"{low}% to {high}%" for low, high in zip(DELTA_BUCKETS, DELTA_BUCKETS[1:])]
+        labels += [f">= {DELTA_BUCKETS[-1]}%"]
+        return {
+            'model_version': self.risk_assessor.version,
+            'policies': self.policies,
+            'updated': self.updated,
+            'premium_before': self.premium_before,
+            'premium_after': self.premium_after,
+            'increased': self.increased,
+            'decreased': self.decreased,
+            'delta_distribution': dict(zip(labels, self.bucket_counts.tolist())),
+            'elapsed_seconds': elapsed,
+            'policies_per_second': self.policies / elapsed if elapsed else 0.0
+        }
+
+    def _page_query(self, after_id, lock=False):
+        query = (
+            select(
+                Policy.id, Policy.policy_id, Policy.user_id, Policy.coverage_amount, Policy.premium,
+                Policy.risk_features, User.wallet_address, User.age, User.credit_score
+            )
+            .join(User, Policy.user_id == User.id)
+            .where(Policy.status == PolicyStatus.ACTIVE, Policy.id > after_id)
+            .order_by(Policy.id)
+            .limit(self.chunk_size)
+        )
+        # Locked until the chunk commits, so every policy repriced is still active
+        return query.with_for_update(of=Policy) if lock else query
+
+    def _rerate_chunk(self, db, rows, dry_run):
+        """
+        Score and reprice one page of policies; returns the cache keys it made stale
+        """
+        ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+        coverage = np.fromiter((row.coverage_amount or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+        old_premiums = np.fromiter((row.premium or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+
+        features = extract_feature_matrix(self._applications(db, rows))
+
+        new_premiums = calculate_premium(coverage, self.risk_assessor.score_matrix(features))
+        self._record(old_premiums, new_premiums)
+        if dry_run:
+            return []
+
+        changed = np.flatnonzero(~np.isclose(new_premiums, old_premiums))
+        stale_keys = set()
+        if changed.size:
+            db.execute(
+                update(Policy.__table__)
+                .where(Policy.id == bindparam('b_id'), Policy.status == PolicyStatus.ACTIVE)
+                .values(premium=bindparam('b_premium')),
+                [{'b_id': int(ids[i]), 'b_premium': float(new_premiums[i])} for i in changed]
+            )
+            changes = PortfolioChanges()
+            for i in changed:
+                changes.premium(rows[i], float(new_premiums[i] - old_premiums[i]))
+            stale_keys.update(changes.apply(db))
+            db.commit()
+        self.updated += int(changed.size)
+        stale_keys.update(policy_key(rows[i].policy_id) for i in changed)
+        stale_keys.update(user_policies_key(rows[i].wallet_address) for i in changed)
+        return stale_keys
+
+    def _applications(self, db, rows):
+        """
+        The features each policy was scored on, so a delta reflects the model, not the inputs
+        """
+        unscored = {row.user_id for row in rows if row.risk_features is None}
+        claim_counts = self._claim_counts(db, unscored) if unscored else {}
+        return [
+            json.loads(row.risk_features) if row.risk_features is not None
+            else self._application(row, claim_counts.get(row.user_id, 0))
+            for row in rows
+        ]
+
+    def _application(self, row, claim_history):
+        """
+        A policy without stored features as application fields from the holder's profile; unknown ones are left out
+        """
+        fields = {
+            'age': row.age,
+            'credit_score': row.credit_score,
+            'claim_history': claim_history,
+            'requested_coverage': row.coverage_amount
+        }
+        return {key: value for key, value in fields.items() if value is not None}
+
+    def _claim_counts(self, db, user_ids):
+        # Claims filed on all of each holder's policies, one grouped query per chunk
+        return dict(db.execute(
+            select(Policy.user_id, func.count(Claim.id))
+            .join(Claim, Claim.policy_id == Policy.id)
+            .where(Policy.user_id.in_(user_ids))
+            .group_by(Policy.user_id)
+        ).all())
+
+    def _record(self, old_premiums, new_premiums):
+        self.policies += len(old_premiums)
+        self.premium_before += float(old_premiums.sum())
+        self.premium_after += float(new_premiums.sum())
+        deltas = new_premiums - old_premiums
+        self.increased += int((deltas > 0).sum())
+        self.decreased += int((deltas < 0).sum())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change_percent = np.where(old_premiums > 0, deltas / old_premiums * 100, 0.0)
+        self.bucket_counts += np.bincount(
+            np.digitize(change_percent, DELTA_BUCKETS), minlength=len(self.bucket_counts)
+        )
+
+def main():
+    from .model_registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Re-price active policies with the current risk model")
+    parser.add_argument("--model", help="model artifact; defaults to MODEL_PATH")
+    parser.add_argument("--version", help="model version; defaults to the one saved in the artifact")
+    parser.add_argument("--chunk-size", type=int, help="policies per page and UPDATE")
+    parser.add_argument("--dry-run", action="store_true", help="report the premium changes without writing them")
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    registry.swap(args.model, args.version)
+    rerater = PortfolioRerater(registry.current, args.chunk_size)
+    stats = rerater.run(dry_run=args.dry_run)
+
+    print(f"model {stats['model_version']}: {stats['policies']} policies, {stats['updated']} updated")
+    print(f"total premium {stats['premium_before']:.2f} -> {stats['premium_after']:.2f} "
+          f"({stats['increased']} up, {stats['decreased']} down)")
+    for bucket, count in stats['delta_distribution'].items():
+        print(f"{bucket:>14}: {count}")
+    print(f"{stats['policies_per_second']:.0f} policies/sec")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
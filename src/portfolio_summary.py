@@ -0,0 +1,184 @@
+import argparse
+import time
+from datetime import datetime
+from sqlalchemy import select, delete, insert, func, case, literal, DateTime
+from .models import User, Policy, Claim, PolicyStatus, ClaimStatus, UserPortfolioSummary
+from .database import get_db_session, get_engine, load_locked_row
+from .cache import portfolio_key
+from .logger import setup_logger
+
+logger = setup_logger("portfolio_summary")
+
+OPEN_CLAIM_STATUSES = (ClaimStatus.PENDING, ClaimStatus.PROCESSING)
+
+SUMMARY_COLUMNS = [
+    'user_id', 'policy_count', 'active_policy_count', 'total_coverage',
+    'total_premium', 'open_claim_count', 'updated_at'
+]
+
+def _summary_select(now=None):
+    """
+    One summary row per user, computed from policies and claims
+    """
+    active = Policy.status == PolicyStatus.ACTIVE
+    policy_totals = select(
+        Policy.user_id.label('user_id'),
+        func.count(Policy.id).label('policy_count'),
+        func.sum(case((active, 1), else_=0)).label('active_policy_count'),
+        func.sum(case((active, Policy.coverage_amount), else_=0.0)).label('total_coverage'),
+        func.sum(case((active, Policy.premium), else_=0.0)).label('total_premium')
+    ).group_by(Policy.user_id)
+    open_claims = select(
+        Policy.user_id.label('user_id'),
+        func.count(Claim.id).label('open_claim_count')
+    ).join(Claim, Claim.policy_id == Policy.id).where(Claim.status.in_(OPEN_CLAIM_STATUSES)).group_by(Policy.user_id)
+    policy_totals = policy_totals.subquery()
+    open_claims = open_claims.subquery()
+    users = select(User.id).subquery()
+
+    return (
+        select(
+            users.c.id,
+            func.coalesce(policy_totals.c.policy_count, 0),
+            func.coalesce(policy_totals.c.active_policy_count, 0),
+            func.coalesce(policy_totals.c.total_coverage, 0.0),
+            func.coalesce(policy_totals.c.total_premium, 0.0),
+            func.coalesce(open_claims.c.open_claim_count, 0),
+            literal(now or datetime.utcnow(), DateTime)
+        )
+        .outerjoin(policy_totals, policy_totals.c.user_id == users.c.id)
+        .outerjoin(open_claims, open_claims.c.user_id == users.c.id)
+    )
+
+def _active_totals(status, coverage_amount, premium):
+    if status != PolicyStatus.ACTIVE:
+        return 0, 0.0, 0.0
+    return 1, coverage_amount or 0.0, premium or 0.0
+
+def _empty_summary(user_id):
+    return UserPortfolioSummary(
+        user_id=user_id, policy_count=0, active_policy_count=0, total_coverage=0.0, total_premium=0.0,
+        open_claim_count=0
+    )
+
+class PortfolioChanges:
+    """
+    Summary deltas collected while policies and claims are written in one transaction
+
+    Each change moves its owner's counts and active totals by what it adds or
+    removes, so apply() touches one locked summary row per user rather than
+    recomputing from every policy and claim they have.
+    """
+    def __init__(self):
+        # (owner, policy_count, active_policy_count, total_coverage, total_premium, open_claim_count)
+        self._changes = []
+
+    def policy(self, policy, old_status=None, old_premium=None):
+        """
+        Count a policy after its status or premium was set; old_status is None for a new policy
+        """
+        active, coverage, premium = _active_totals(policy.status, policy.coverage_amount, policy.premium)
+        was_active, was_coverage, was_premium = _active_totals(
+            old_status, policy.coverage_amount, policy.premium if old_premium is None else old_premium
+        )
+        self._changes.append((
+            policy, int(old_status is None), active - was_active, coverage - was_coverage, premium - was_premium, 0
+        ))
+
+    def premium(self, policy, delta):
+        """
+        Count a change of delta to an active policy's premium
+        """
+        self._changes.append((policy, 0, 0, 0.0, delta, 0))
+
+    def claim(self, policy, status, old_status=None):
+        """
+        Count a claim on policy moving from old_status (None for a new claim) to status
+        """
+        opened = int(status in OPEN_CLAIM_STATUSES) - int(old_status in OPEN_CLAIM_STATUSES)
+        if opened and policy is not None:
+            self._changes.append((policy, 0, 0, 0.0, 0.0, opened))
+
+    def apply(self, db):
+        """
+        Add the deltas to each owner's summary inside the caller's transaction; returns the cache keys to invalidate
+
+        Call after the policy and claim changes are made and before commit.
+        Summary rows are locked in user order, so concurrent writers for the
+        same user apply their deltas one after the other.
+        """
+        if not self._changes:
+            return []
+        # Owners created in this transaction get their ids here
+        db.flush()
+        deltas = {}
+        for owner, *delta in self._changes:
+            totals = deltas.setdefault(owner.user_id, [0, 0, 0.0, 0.0, 0])
+            for i, value in enumerate(delta):
+                totals[i] += value
+        self._changes = []
+        user_ids = sorted(user_id for user_id, delta in deltas.items() if user_id is not None and any(delta))
+        if not user_ids:
+            return []
+        now = datetime.utcnow()
+        for user_id in user_ids:
+            policies, active, coverage, premium, open_claims = deltas[user_id]
+            summary = load_locked_row(db, UserPortfolioSummary, user_id, lambda: _empty_summary(user_id))
+            summary.policy_count += policies
+            summary.active_policy_count += active
+            summary.total_coverage += coverage
+            summary.total_premium += premium
+            summary.open_claim_count += open_claims
+            summary.updated_at = now
+        wallet_addresses = db.scalars(select(User.wallet_address).where(User.id.in_(user_ids))).all()
+        return [portfolio_key(wallet_address) for wallet_address in wallet_addresses]
+
+def rebuild_portfolio_summaries(conn):
+    """
+    Recompute every user's summary in two set-based statements
+
+    For the migration 5 backfill and for repairing drift; writes keep the
+    summaries current through PortfolioChanges.
+    """
+    conn.execute(delete(UserPortfolioSummary))
+    conn.execute(insert(UserPortfolioSummary).from_select(SUMMARY_COLUMNS, _summary_select()))
+
+def portfolio_query(wallet_address):
+    """
+    A wallet's summary as a single row: the user by its unique wallet index, the summary by primary key
+    """
+    return (
+        select(User.wallet_address, UserPortfolioSummary)
+        .outerjoin(UserPortfolioSummary, UserPortfolioSummary.user_id == User.id)
+        .where(User.wallet_address == wallet_address)
+    )
+
+def format_portfolio(row):
+    wallet_address, summary = row
+    if summary is None:
+        # A user with no policies yet
+        summary = UserPortfolioSummary(
+            policy_count=0, active_policy_count=0, total_coverage=0.0, total_premium=0.0, open_claim_count=0
+        )
+    return {
+        'wallet_address': wallet_address,
+        'policy_count': summary.policy_count,
+        'active_policy_count': summary.active_policy_count,
+        'total_coverage': summary.total_coverage,
+        'total_premium': summary.total_premium,
+        'open_claim_count': summary.open_claim_count,
+        'updated_at': summary.updated_at
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild every wallet's portfolio summary from policies and claims")
+    parser.parse_args()
+    started = time.perf_counter()
+    with get_engine().begin() as conn:
+        rebuild_portfolio_summaries(conn)
+    with get_db_session() as db:
+        count = db.scalar(select(func.count()).select_from(UserPortfolioSummary))
+    logger.info("Rebuilt %s portfolio summaries in %.2fs", count, time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
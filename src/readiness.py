@@ -0,0 +1,67 @@
+import asyncio
+import time
+from datetime import datetime
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("readiness")
+
+class Readiness:
+    """
+    Startup state of each heavyweight component, reported separately from liveness
+
+    Components come up in the background after the server starts accepting
+    connections; each one is pending until its check returns truthy, then
+    ready, or failed with the error. The worker is ready once all of them are.
+    bring_up() keeps re-checking a failed component, so a database or node
+    that is briefly unavailable at boot doesn't keep the worker out for good.
+    """
+    def __init__(self, retry_seconds=None, max_retry_seconds=None):
+        self.components = {}
+        self.retry_seconds = retry_seconds or settings.READINESS_RETRY_SECONDS
+        self.max_retry_seconds = max_retry_seconds or settings.READINESS_MAX_RETRY_SECONDS
+
+    def pending(self, name):
+        self.components[name] = {
+            'status': 'pending', 'error': None, 'startup_ms': None, 'checked_at': None, 'attempts': 0
+        }
+
+    async def bring_up(self, name, func, failure="check returned false"):
+        """
+        Check until the component is ready, backing off exponentially between failed attempts
+        """
+        delay = self.retry_seconds
+        while not await self.check(name, func, failure):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_seconds)
+        return True
+
+    async def check(self, name, func, failure="check returned false"):
+        """
+        Run a blocking check off the event loop and record its outcome
+        """
+        if name not in self.components:
+            self.pending(name)
+        attempts = self.components[name]['attempts'] + 1
+        started = time.perf_counter()
+        try:
+            ok = await asyncio.to_thread(func)
+            error = None if ok else failure
+        except Exception as e:
+            error = str(e)
+        self.components[name] = {
+            'status': 'failed' if error else 'ready',
+            'error': error,
+            'startup_ms': (time.perf_counter() - started) * 1000,
+            'checked_at': datetime.utcnow(),
+            'attempts': attempts
+        }
+        if error:
+            logger.error("%s is not ready (attempt %s): %s", name, attempts, error)
+        return error is None
+
+    def is_ready(self):
+        return all(component['status'] == 'ready' for component in self.components.values())
+
+    def report(self):
+        return {'ready': self.is_ready(), 'components': self.components}
\ No newline at end of file
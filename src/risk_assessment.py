@@ -1,49 +1,151 @@
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
 import numpy as np
-import joblib
+from .tree_inference import CompiledForest
+from .exceptions import RiskAssessmentError
+
+FEATURE_KEYS = (
+    'age',
+    'claim_history',
+    'risk_factors',
+    'coverage_amount',
+    'income',
+    'credit_score',
+    'occupation_risk',
+    'health_score'
+)
+
+# Application fields a feature is read from when the feature's own key is missing:
+# applications ask for requested_coverage, stored policies hold coverage_amount.
+# A field sent as None counts as missing, and whatever is still missing is 0,
+# as NULL columns are in the training data.
+FEATURE_ALIASES = {
+    'coverage_amount': 'requested_coverage'
+}
+
+def extract_feature_matrix(users_data):
+    """
+    Features for many users as one matrix in FEATURE_KEYS order, built one column at a time
+    """
+    features = np.empty((len(users_data), len(FEATURE_KEYS)), dtype=np.float64)
+    for column, key in enumerate(FEATURE_KEYS):
+        features[:, column] = _feature_column(users_data, key)
+    return features
+
+def scored_features(user_data):
+    """
+    The features an application is scored on, by name; stored with its policy so it can be scored again as it was
+    """
+    return dict(zip(FEATURE_KEYS, extract_feature_matrix([user_data])[0].tolist()))
+
+def _feature_value(user_data, key):
+    value = user_data.get(key)
+    if value is None and key in FEATURE_ALIASES:
+        value = user_data.get(FEATURE_ALIASES[key])
+    return 0 if value is None else value
+
+def _feature_column(users_data, key):
+    # None becomes NaN in a float array, so missing values are filled with whole-column masks
+    values = np.array([user_data.get(key) for user_data in users_data], dtype=np.float64)
+    if key in FEATURE_ALIASES:
+        missing = np.isnan(values)
+        if missing.any():
+            aliased = np.array([user_data.get(FEATURE_ALIASES[key]) for user_data in users_data], dtype=np.float64)
+            values[missing] = aliased[missing]
+    values[np.isnan(values)] = 0
+    return values
 
 class RiskAssessment:
-    def __init__(self):
-        self.model = RandomForestClassifier()
-        self.scaler = StandardScaler()
+    """
+    Risk scoring model; sklearn and joblib are imported only to train or unpickle one
+
+    Serving a compiled artifact never imports them at all.
+    """
+    def __init__(self, inference_engine="sklearn"):
+        if inference_engine not in ("sklearn", "compiled"):
+            raise ValueError(f"Unknown inference engine: {inference_engine}")
+        self.model = None
+        self.scaler = None
+        self.inference_engine = inference_engine
+        self.compiled_forest = None
+        self.version = None
         
     def train_model(self, training_data, labels):
         """
         Train the risk assessment model
         """
+        from sklearn.ensemble import RandomForestClassifier
+        from sklearn.preprocessing import StandardScaler
+        self.model = RandomForestClassifier()
+        self.scaler = StandardScaler()
         features = np.array([self._extract_features(data) for data in training_data])
         features_scaled = self.scaler.fit_transform(features)
         self.model.fit(features_scaled, labels)
+        self._compile()
         
     def analyze_user_risk(self, user_data):
         """
         Analyze user risk based on provided data
         """
         features = self._extract_features(user_data)
-        features_scaled = self.scaler.transform([features])
-        risk_score = self.model.predict_proba(features_scaled)[0][1]
+        risk_score = self._predict_proba([features])[0][1]
         
         risk_factors = self._analyze_risk_factors(user_data)
         return {
             'risk_score': risk_score,
-            'risk_factors': risk_factors
+            'risk_factors': risk_factors,
+            'model_version': self.version
         }
     
+    def analyze_batch(self, users_data):
+        """
+        Analyze risk for many users with one scaler and model call
+        """
+        if not users_data:
+            return []
+        
+        features = extract_feature_matrix(users_data)
+        risk_scores = self._predict_proba(features)[:, 1]
+        
+        risk_factors = self._analyze_risk_factors_batch(features)
+        return [
+            {
+                'risk_score': risk_score,
+                'risk_factors': factors,
+                'model_version': self.version
+            }
+            for risk_score, factors in zip(risk_scores, risk_factors)
+        ]
+    
+    def score_matrix(self, features):
+        """
+        Risk scores for a raw feature matrix with columns in FEATURE_KEYS order
+        """
+        return self._predict_proba(features)[:, 1]
+    
+    def _predict_proba(self, features):
+        """
+        Predict class probabilities for raw feature rows with the selected engine
+        """
+        if self.compiled_forest is not None:
+            return self.compiled_forest.predict_proba(features)
+        if self.model is None:
+            raise RiskAssessmentError("Risk model is not trained or loaded")
+        features_scaled = self.scaler.transform(features)
+        return self.model.predict_proba(features_scaled)
+    
+    def _compile(self):
+        """
+        Flatten the fitted model for the compiled inference engine
+        """
+        if self.inference_engine == "compiled":
+            self.compiled_forest = CompiledForest.from_sklearn(self.model, self.scaler)
+        else:
+            self.compiled_forest = None
+    
     def _extract_features(self, user_data):
         """
         Extract relevant features from user data
         """
-        features = [
-            user_data.get('age', 0),
-            user_data.get('claim_history', 0),
-            user_data.get('risk_factors', 0),
-            user_data.get('coverage_amount', 0),
-            user_data.get('income', 0),
-            user_data.get('credit_score', 0),
-            user_data.get('occupation_risk', 0),
-            user_data.get('health_score', 0)
-        ]
+        features = [_feature_value(user_data, key) for key in FEATURE_KEYS]
         return features
         
     def _analyze_risk_factors(self, user_data):
@@ -52,28 +154,66 @@ class RiskAssessment:
         """
         risk_factors = []
         
-        if user_data.get('age', 0) > 60:
+        if _feature_value(user_data, 'age') > 60:
             risk_factors.append('Age Risk')
-        if user_data.get('claim_history', 0) > 2:
+        if _feature_value(user_data, 'claim_history') > 2:
             risk_factors.append('High Claim History')
-        if user_data.get('credit_score', 0) < 650:
+        if _feature_value(user_data, 'credit_score') < 650:
             risk_factors.append('Low Credit Score')
             
         return risk_factors
+    
+    def _analyze_risk_factors_batch(self, features):
+        """
+        Analyze risk factors for a feature matrix using column masks
+        """
+        labels = ('Age Risk', 'High Claim History', 'Low Credit Score')
+        flags = np.column_stack([
+            features[:, FEATURE_KEYS.index('age')] > 60,
+            features[:, FEATURE_KEYS.index('claim_history')] > 2,
+            features[:, FEATURE_KEYS.index('credit_score')] < 650
+        ])
+        return [[labels[i] for i in np.flatnonzero(row)] for row in flags]
         
-    def save_model(self, path):
+    def save_model(self, path, version=None):
         """
-        Save trained model to file
+        Save trained model to file, tagged with its version
         """
+        import joblib
         joblib.dump({
             'model': self.model,
-            'scaler': self.scaler
+            'scaler': self.scaler,
+            'version': version or self.version
         }, path)
         
-    def load_model(self, path):
+    def save_compiled(self, path, version=None):
         """
-        Load trained model from file
+        Save the flattened forest as a read-only, memory-mappable artifact
+        """
+        forest = self.compiled_forest or CompiledForest.from_sklearn(self.model, self.scaler)
+        forest.save(path, version or self.version)
+        
+    def load_model(self, path, version=None, compiled_only=False):
+        """
+        Load trained model from file; an explicit version overrides the saved one
+        
+        Compiled artifacts are memory-mapped instead of unpickled, so every
+        worker process that loads the same file shares one copy of the trees.
+        Anything else is unpickled, which runs code from the file, so
+        compiled_only refuses it for paths that are not fully trusted.
         """
+        if CompiledForest.is_artifact(path):
+            self.compiled_forest = CompiledForest.load(path)
+            self.model = None
+            self.scaler = None
+            self.inference_engine = "compiled"
+            self.version = version or self.compiled_forest.version
+            return
+        if compiled_only:
+            raise RiskAssessmentError(f"{path} is not a compiled model artifact")
+        import joblib
         saved_model = joblib.load(path)
         self.model = saved_model['model']
-        self.scaler = saved_model['scaler'] 
\ No newline at end of file
+        self.scaler = saved_model['scaler']
+        self.version = version or saved_model.get('version')
+        self._compile() 
\ No newline at end of file
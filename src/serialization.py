@@ -0,0 +1,65 @@
+import enum
+import json
+from collections.abc import Mapping
+from datetime import date, datetime, time
+from decimal import Decimal
+from fastapi.responses import JSONResponse
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    """
+    Encode what the backend can't natively: receipts (Mappings, HexBytes), NumPy values and, for stdlib json, enums and dates
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (bytes, bytearray)):
+        # Transaction and block hashes in raw receipts
+        return "0x" + bytes(obj).hex()
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    loads = json.loads
+
+def to_jsonable(obj):
+    """
+    Plain JSON types for obj, as a client would decode them; for storing a response to replay later
+    """
+    return loads(dumps(obj))
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered in one pass by orjson (stdlib json without it)
+
+    Endpoints return this directly with the manager's dict so FastAPI skips
+    jsonable_encoder; NumPy scalars, enums, datetimes and raw transaction
+    receipts are encoded natively or by _default instead.
+    """
+    def render(self, content):
+        return dumps(content)
\ No newline at end of file
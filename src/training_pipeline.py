@@ -0,0 +1,207 @@
+import argparse
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from sqlalchemy import select, func, case
+from .risk_assessment import RiskAssessment, FEATURE_KEYS, extract_feature_matrix
+from .models import User, Policy, Claim, PolicyStatus, ClaimStatus
+from .database import get_db_session
+from .exceptions import ValidationError
+from .logger import setup_logger
+from .config import settings
+
+logger = setup_logger("training_pipeline")
+
+# Features the database stores as columns, in training query order, for policies
+# without a scored feature vector (those ingested from the chain); the others are
+# not persisted and stay 0, as they do for applications that leave them out.
+# coverage_amount is the policy's coverage, which scoring reads from an
+# application's requested_coverage (see FEATURE_ALIASES)
+DATABASE_FEATURES = ('age', 'claim_history', 'coverage_amount', 'credit_score')
+DATABASE_COLUMNS = [FEATURE_KEYS.index(key) for key in DATABASE_FEATURES]
+
+class TrainingPipeline:
+    """
+    Train the risk model on historical policies without materializing them as Python objects
+
+    One row per non-pending policy streams through a server-side cursor into a
+    preallocated matrix: the features the policy's premium was scored on
+    (Policy.risk_features), so training sees exactly what serving saw, and a
+    label for whether a claim on this policy went anywhere other than rejected.
+    Policies without a scored vector fall back to the holder's age and credit
+    score, the claims filed on their other policies and the coverage. The forest
+    is then fitted on n_jobs cores.
+    """
+    def __init__(self, chunk_size=None, n_jobs=None, n_estimators=None,
+                 max_depth=None, max_samples=None, limit=None):
+        self.chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+        self.n_jobs = n_jobs or settings.TRAINING_N_JOBS
+        self.n_estimators = n_estimators or settings.TRAINING_N_ESTIMATORS
+        self.max_depth = max_depth or settings.TRAINING_MAX_DEPTH
+        self.max_samples = max_samples or settings.TRAINING_MAX_SAMPLES
+        self.limit = limit
+        self.rows = 0
+        self.timings = {}
+
+    def run(self, version=None):
+        """
+        Extract, scale and fit; returns a fitted RiskAssessment tagged with version
+        """
+        with self._stage("count"):
+            n_rows = self._count_rows()
+        with self._stage("extract"):
+            features, labels = self.load_training_matrix(n_rows)
+        if len(np.unique(labels)) < 2:
+            raise ValidationError("Training data needs both claimed and unclaimed policies")
+        with self._stage("scale"):
+            scaler, features = self._scale(features)
+        with self._stage("fit"):
+            model = RandomForestClassifier(
+                n_estimators=self.n_estimators,
+                max_depth=self.max_depth,
+                max_samples=self.max_samples,
+                n_jobs=self.n_jobs
+            )
+            model.fit(features, labels)
+
+        assessor = RiskAssessment(inference_engine=settings.RISK_INFERENCE_ENGINE)
+        assessor.model = model
+        assessor.scaler = scaler
+        assessor.version = version
+        with self._stage("compile"):
+            assessor._compile()
+        return assessor
+
+    def load_training_matrix(self, n_rows):
+        """
+        Stream the training query chunk by chunk into preallocated feature and label arrays
+
+        Scored policies overwrite their row with the stored feature vector.
+        """
+        features = np.zeros((n_rows, len(FEATURE_KEYS)), dtype=np.float64)
+        labels = np.empty(n_rows, dtype=np.int8)
+        filled = 0
+        with get_db_session() as db:
+            result = db.execute(self._training_query().execution_options(yield_per=self.chunk_size))
+            for rows in result.partitions():
+                # Rows inserted since the count don't fit and aren't needed
+                rows = rows[:n_rows - filled]
+                chunk = np.asarray([row[:-1] for row in rows], dtype=np.float64)
+                end = filled + len(chunk)
+                features[filled:end, DATABASE_COLUMNS] = chunk[:, :-1]
+                labels[filled:end] = chunk[:, -1]
+                scored = [i for i, row in enumerate(rows) if row[-1] is not None]
+                if scored:
+                    features[filled + np.array(scored)] = extract_feature_matrix(
+                        [json.loads(rows[i][-1]) for i in scored]
+                    )
+                filled = end
+                if filled == n_rows:
+                    break
+        self.rows = filled
+        return features[:filled], labels[:filled]
+
+    def stats(self):
+        extract = self.timings.get('extract')
+        return {
+            'rows': self.rows,
+            'timings': dict(self.timings),
+            'extract_rows_per_second': self.rows / extract if extract else 0.0
+        }
+
+    def _count_rows(self):
+        with get_db_session() as db:
+            count = db.scalar(select(func.count()).select_from(Policy).where(Policy.status != PolicyStatus.PENDING))
+        return count if self.limit is None else min(count, self.limit)
+
+    def _training_query(self):
+        policy_claims = (
+            select(
+                Claim.policy_id,
+                func.count(Claim.id).label('claims'),
+                func.sum(case((Claim.status != ClaimStatus.REJECTED, 1), else_=0)).label('paid_claims')
+            )
+            .group_by(Claim.policy_id)
+            .subquery()
+        )
+        user_claims = (
+            select(Policy.user_id, func.sum(policy_claims.c.claims).label('claims'))
+            .join(policy_claims, policy_claims.c.policy_id == Policy.id)
+            .group_by(Policy.user_id)
+            .subquery()
+        )
+        own_claims = func.coalesce(policy_claims.c.claims, 0)
+        query = (
+            select(
+                func.coalesce(User.age, 0),
+                func.coalesce(user_claims.c.claims, 0) - own_claims,
+                func.coalesce(Policy.coverage_amount, 0),
+                func.coalesce(User.credit_score, 0),
+                case((func.coalesce(policy_claims.c.paid_claims, 0) > 0, 1), else_=0),
+                Policy.risk_features
+            )
+            .select_from(Policy)
+            .join(User, Policy.user_id == User.id)
+            .outerjoin(policy_claims, policy_claims.c.policy_id == Policy.id)
+            .outerjoin(user_claims, user_claims.c.user_id == Policy.user_id)
+            .where(Policy.status != PolicyStatus.PENDING)
+            .order_by(Policy.id)
+        )
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        return query
+
+    def _scale(self, features):
+        """
+        Fit the scaler, then transform chunk by chunk into the float32 matrix the trees train on
+        """
+        scaler = StandardScaler().fit(features)
+        scaled = np.empty(features.shape, dtype=np.float32)
+        for start in range(0, len(features), self.chunk_size):
+            scaled[start:start + self.chunk_size] = scaler.transform(features[start:start + self.chunk_size])
+        return scaler, scaled
+
+    @contextmanager
+    def _stage(self, name):
+        started = time.perf_counter()
+        yield
+        self.timings[name] = time.perf_counter() - started
+        logger.info("Training stage %s took %.2fs", name, self.timings[name])
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the risk model from historical policies and claims")
+    parser.add_argument("--output", default=settings.MODEL_PATH, help="joblib artifact to write")
+    parser.add_argument("--compiled-output", help="also write a memory-mappable compiled artifact")
+    parser.add_argument("--version", default=settings.MODEL_VERSION)
+    parser.add_argument("--chunk-size", type=int, help="rows fetched per server-side cursor batch")
+    parser.add_argument("--n-jobs", type=int, help="cores used to fit the forest; -1 for all")
+    parser.add_argument("--n-estimators", type=int)
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--max-samples", type=float, help="fraction of rows bootstrapped per tree")
+    parser.add_argument("--limit", type=int, help="train on at most this many policies")
+    args = parser.parse_args()
+
+    pipeline = TrainingPipeline(
+        chunk_size=args.chunk_size,
+        n_jobs=args.n_jobs,
+        n_estimators=args.n_estimators,
+        max_depth=args.max_depth,
+        max_samples=args.max_samples,
+        limit=args.limit
+    )
+    assessor = pipeline.run(args.version)
+    with pipeline._stage("save"):
+        assessor.save_model(args.output)
+        if args.compiled_output:
+            assessor.save_compiled(args.compiled_output)
+
+    stats = pipeline.stats()
+    for name, seconds in stats['timings'].items():
+        print(f"{name:>8}: {seconds:8.2f} s")
+    print(f"Trained {args.version} on {stats['rows']} policies ({stats['extract_rows_per_second']:.0f} rows/sec extracted)")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,438 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, or_
+from .models import Policy, Claim, PolicyStatus, ClaimStatus, TransactionNonce, PendingTransaction
+from .database import get_db_session, load_locked_row, load_locked_row_async
+from .config import settings
+from .cache import query_cache, policy_key, claim_key, user_policies_key
+from .fraud_screening import record_status_change
+from .portfolio_summary import PortfolioChanges
+from .logger import setup_logger
+
+logger = setup_logger("transaction_manager")
+
+def settle_pending_claim(db, claim_id, status, changes, tx_hash=None):
+    """
+    Move a PENDING claim to status once its chain call is known and count it into changes
+
+    Returns False, changing nothing, if the claim is gone or chain events settled it already.
+    """
+    claim = db.query(Claim).filter_by(claim_id=claim_id).with_for_update().populate_existing().first()
+    if claim is None or claim.status != ClaimStatus.PENDING:
+        return False
+    if tx_hash is not None:
+        claim.tx_hash = tx_hash
+    claim.status = status
+    if status == ClaimStatus.REJECTED:
+        claim.processed_at = datetime.utcnow()
+        record_status_change(db, claim.policy_id, claim.amount or 0.0, ClaimStatus.PENDING, status)
+    changes.claim(claim.policy, status, old_status=ClaimStatus.PENDING)
+    return True
+
+def lock_next_nonce(db, w3, sender, resync=False):
+    """
+    The sender's nonce row, locked for the rest of db's transaction, with next_nonce read from the node if unknown
+
+    Every broadcast that picks its own nonce allocates it here, so concurrent
+    submitters never share one.
+    """
+    nonce_row = load_locked_row(db, TransactionNonce, sender, lambda: TransactionNonce(sender_address=sender))
+    if nonce_row.next_nonce is None or resync:
+        nonce_row.next_nonce = w3.eth.get_transaction_count(sender, 'pending')
+    return nonce_row
+
+def broadcast_in_order(smart_contract, sends):
+    """
+    Call each send(nonce, gas_price) with consecutive allocated nonces; returns its tx hash or exception, in order
+
+    The nonce row is locked in a session of its own and only while broadcasting,
+    so waiting for the receipts afterwards holds no lock or connection.
+    """
+    w3 = smart_contract.w3
+    with get_db_session() as db:
+        nonce_row = lock_next_nonce(db, w3, smart_contract.sender_address)
+        gas_price = w3.eth.gas_price
+        results = []
+        failed = False
+        for send in sends:
+            try:
+                results.append(send(nonce_row.next_nonce, gas_price))
+            except Exception as e:
+                results.append(e)
+                failed = True
+                continue
+            nonce_row.next_nonce += 1
+        if failed:
+            # The node may have taken a nonce whose broadcast raised, so the next allocation re-reads its count
+            nonce_row.next_nonce = None
+        db.commit()
+    return results
+
+class LeasedTransaction:
+    """
+    Snapshot of a pending_transactions row this worker holds the lease on
+    """
+    def __init__(self, row):
+        self.kind = row.kind
+        self.key = row.key
+        self.tx_hashes = json.loads(row.tx_hashes)
+        self.nonce = row.nonce
+        self.gas_price = row.gas_price
+        self.replacements = row.replacements or 0
+        self.payload = json.loads(row.payload) if row.payload else None
+        self.submitted_at = row.submitted_at or datetime.utcnow()
+
+class TransactionOutcome:
+    def __init__(self, kind, key, tx_hash, receipt, succeeded, tx_hashes=None):
+        self.kind = kind
+        self.key = key
+        self.tx_hash = tx_hash
+        self.receipt = receipt
+        self.succeeded = succeeded
+        self.tx_hashes = tx_hashes or [tx_hash]
+
+class TransactionManager:
+    """
+    Submit contract transactions without waiting for receipts
+
+    Each transaction is keyed by the policy or claim id it belongs to and
+    recorded in pending_transactions inside the caller's database transaction,
+    together with the sender's next nonce. The nonce row stays locked until
+    that transaction commits, so workers never broadcast the same nonce.
+
+    poll() leases pending rows to this worker (FOR UPDATE SKIP LOCKED; rows of
+    a worker that stops renewing are taken over once its lease lapses), checks
+    receipts for every hash broadcast for them, rebroadcasts stuck transactions
+    with the same nonce and a higher gas price, and reports every transaction
+    that reached a final state. A transaction only counts as dropped once its
+    nonce was used by another one; after max_replacements the nonce is taken
+    back with a self-transfer instead of being given up on.
+    """
+    def __init__(self, smart_contract, replace_after=None, max_replacements=None, lease_seconds=None,
+                 batch_size=None, worker_id=None):
+        self.smart_contract = smart_contract
+        self.replace_after = replace_after if replace_after is not None else settings.TX_REPLACE_AFTER_SECONDS
+        self.max_replacements = (
+            max_replacements if max_replacements is not None else settings.TX_MAX_REPLACEMENTS
+        )
+        self.lease_seconds = lease_seconds if lease_seconds is not None else settings.TX_LEASE_SECONDS
+        self.batch_size = batch_size or settings.TX_RECONCILE_BATCH_SIZE
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leased = 0
+        self._resync = False
+
+    @property
+    def w3(self):
+        return self.smart_contract.w3
+
+    def submit_policy(self, db, policy_key, user_address, policy_details):
+        return self._submit(db, 'policy', policy_key, {'user_address': user_address, 'policy_details': policy_details})
+
+    def submit_claim(self, db, claim_id, claim_data):
+        return self._submit(db, 'claim', claim_id, {'claim_data': claim_data})
+
+    async def submit_policy_async(self, db, policy_key, user_address, policy_details):
+        return await self._submit_async(
+            db, 'policy', policy_key, {'user_address': user_address, 'policy_details': policy_details}
+        )
+
+    async def submit_claim_async(self, db, claim_id, claim_data):
+        return await self._submit_async(db, 'claim', claim_id, {'claim_data': claim_data})
+
+    def pending_count(self):
+        """
+        Transactions this worker held the lease on at its last poll
+        """
+        return self.leased
+
+    def poll(self):
+        """
+        Check the transactions leased to this worker and return the ones that reached a final state
+        """
+        outcomes = []
+        for pending in self._lease():
+            outcome = self._check(pending)
+            if outcome is not None:
+                outcomes.append(outcome)
+        return outcomes
+
+    def settle(self, db, outcome):
+        """
+        Delete the outcome's pending row in db's transaction; False if it is no longer this worker's to apply
+        """
+        row = db.get(PendingTransaction, (outcome.kind, outcome.key), with_for_update=True)
+        # Another worker took the lease over, or a late replacement was recorded after the check
+        if row is None or row.owner != self.worker_id or json.loads(row.tx_hashes) != outcome.tx_hashes:
+            return False
+        db.delete(row)
+        return True
+
+    def resync_nonce(self):
+        """
+        Make the next allocation re-read the node's pending count, e.g. after a nonce was lost
+        """
+        with get_db_session() as db:
+            row = db.get(TransactionNonce, self.smart_contract.sender_address, with_for_update=True)
+            if row is not None:
+                row.next_nonce = None
+                db.commit()
+
+    def _submit(self, db, kind, key, payload):
+        nonce_row = lock_next_nonce(db, self.w3, self.smart_contract.sender_address, self._resync)
+        self._resync = False
+        gas_price, tx_hash = self._broadcast(kind, key, payload, nonce_row.next_nonce)
+        return self._record(db, nonce_row, kind, key, payload, gas_price, tx_hash)
+
+    async def _submit_async(self, db, kind, key, payload):
+        sender = self.smart_contract.sender_address
+        nonce_row = await load_locked_row_async(
+            db, TransactionNonce, sender, lambda: TransactionNonce(sender_address=sender)
+        )
+        if nonce_row.next_nonce is None or self._resync:
+            nonce_row.next_nonce = await asyncio.to_thread(self.w3.eth.get_transaction_count, sender, 'pending')
+            self._resync = False
+        gas_price, tx_hash = await asyncio.to_thread(self._broadcast, kind, key, payload, nonce_row.next_nonce)
+        return self._record(db, nonce_row, kind, key, payload, gas_price, tx_hash)
+
+    def _broadcast(self, kind, key, payload, nonce):
+        gas_price = self.w3.eth.gas_price
+        try:
+            return gas_price, self._send(kind, key, payload, nonce, gas_price)
+        except Exception:
+            # The caller's transaction rolls back, but the node may have taken the nonce anyway
+            self._resync = True
+            raise
+
+    def _record(self, db, nonce_row, kind, key, payload, gas_price, tx_hash):
+        nonce = nonce_row.next_nonce
+        nonce_row.next_nonce = nonce + 1
+        now = datetime.utcnow()
+        db.add(PendingTransaction(
+            kind=kind,
+            key=key,
+            tx_hashes=json.dumps([tx_hash]),
+            nonce=nonce,
+            gas_price=gas_price,
+            replacements=0,
+            payload=json.dumps(payload),
+            owner=self.worker_id,
+            lease_until=now + timedelta(seconds=self.lease_seconds),
+            submitted_at=now
+        ))
+        logger.info(
+            "Submitted %s transaction %s for %s with nonce %s", kind, tx_hash, key, nonce,
+            extra={f'{kind}_id': key}
+        )
+        return tx_hash
+
+    def _send(self, kind, key, payload, nonce, gas_price):
+        if kind == 'policy':
+            return self.smart_contract.send_create_policy(
+                payload['user_address'], payload['policy_details'], nonce, gas_price
+            )
+        return self.smart_contract.send_process_claim(key, payload['claim_data'], nonce, gas_price)
+
+    def _lease(self):
+        """
+        Renew this worker's leases and take over rows nobody holds; returns snapshots of them
+        """
+        now = datetime.utcnow()
+        with get_db_session() as db:
+            rows = db.scalars(
+                select(PendingTransaction)
+                .where(or_(
+                    PendingTransaction.owner == self.worker_id,
+                    PendingTransaction.lease_until.is_(None),
+                    PendingTransaction.lease_until < now
+                ))
+                .order_by(PendingTransaction.submitted_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            leased = []
+            for row in rows:
+                if row.owner != self.worker_id:
+                    logger.info("Took over %s transaction for %s from %s", row.kind, row.key, row.owner)
+                row.owner = self.worker_id
+                row.lease_until = now + timedelta(seconds=self.lease_seconds)
+                leased.append(LeasedTransaction(row))
+            db.commit()
+        self.leased = len(leased)
+        return leased
+
+    def _check(self, pending):
+        outcome = self._find_receipt(pending)
+        if outcome is not None:
+            return outcome
+
+        if (datetime.utcnow() - pending.submitted_at).total_seconds() < self.replace_after:
+            return None
+
+        if pending.payload is None or pending.nonce is None:
+            # Recovered from before payloads were kept: nothing to rebroadcast, only detect drops
+            if any(self._is_known(tx_hash) for tx_hash in pending.tx_hashes):
+                return None
+            return self._dropped(pending)
+
+        if self.w3.eth.get_transaction_count(self.smart_contract.sender_address, 'latest') > pending.nonce:
+            # The nonce is used up; unless ours was mined meanwhile, something else took it
+            return self._find_receipt(pending) or self._dropped(pending)
+
+        if pending.replacements >= self.max_replacements:
+            # The nonce is still unused, so ours can yet be mined; settle it only once something uses it up
+            return self._cancel(pending)
+
+        return self._replace(pending)
+
+    def _find_receipt(self, pending):
+        # Any earlier broadcast of the same nonce may be the one that got mined
+        for tx_hash in reversed(pending.tx_hashes):
+            receipt = self._get_receipt(tx_hash)
+            if receipt is not None:
+                return TransactionOutcome(
+                    pending.kind, pending.key, tx_hash, receipt, receipt['status'] == 1, pending.tx_hashes
+                )
+        return None
+
+    def _replace(self, pending):
+        gas_price = self._replacement_gas_price(pending)
+        try:
+            tx_hash = self._send(pending.kind, pending.key, pending.payload, pending.nonce, gas_price)
+        except Exception as e:
+            logger.error("Error replacing %s transaction for %s: %s", pending.kind, pending.key, e)
+            return None
+
+        # Recorded even if the lease moved on, so whoever reconciles the row checks this hash too
+        self._record_rebroadcast(pending, gas_price, tx_hash)
+        logger.info(
+            "Replaced %s transaction for %s with %s (nonce %s, gas price %s)",
+            pending.kind, pending.key, tx_hash, pending.nonce, gas_price
+        )
+        return None
+
+    def _cancel(self, pending):
+        """
+        Out of replacements: take the nonce back with a zero-value transfer to the sender itself
+
+        Whichever of the two gets mined uses the nonce up, and the next check
+        settles the transaction from that. The cancellation's hash is not one of
+        the row's, since its receipt says nothing about the policy or claim.
+        """
+        gas_price = self._replacement_gas_price(pending)
+        try:
+            tx_hash = self.smart_contract.send_cancel(pending.nonce, gas_price)
+        except Exception as e:
+            logger.error("Error cancelling %s transaction for %s: %s", pending.kind, pending.key, e)
+            return None
+
+        self._record_rebroadcast(pending, gas_price)
+        logger.info(
+            "Cancelling %s transaction for %s with %s (nonce %s, gas price %s)",
+            pending.kind, pending.key, tx_hash, pending.nonce, gas_price
+        )
+        return None
+
+    def _replacement_gas_price(self, pending):
+        # Nodes only accept a same-nonce replacement with a gas price bump of at least 10%
+        return max(int(pending.gas_price * 1.125) + 1, self.w3.eth.gas_price)
+
+    def _record_rebroadcast(self, pending, gas_price, tx_hash=None):
+        with get_db_session() as db:
+            row = db.get(PendingTransaction, (pending.kind, pending.key), with_for_update=True)
+            if row is not None:
+                if tx_hash is not None:
+                    row.tx_hashes = json.dumps(json.loads(row.tx_hashes) + [tx_hash])
+                row.gas_price = gas_price
+                row.replacements = (row.replacements or 0) + 1
+                row.submitted_at = datetime.utcnow()
+                db.commit()
+
+    def _dropped(self, pending):
+        logger.error("%s transaction for %s was dropped: %s", pending.kind, pending.key, pending.tx_hashes[-1])
+        return TransactionOutcome(pending.kind, pending.key, pending.tx_hashes[-1], None, False, pending.tx_hashes)
+
+    def _get_receipt(self, tx_hash):
+        from web3.exceptions import TransactionNotFound
+        try:
+            return self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+
+    def _is_known(self, tx_hash):
+        from web3.exceptions import TransactionNotFound
+        try:
+            self.w3.eth.get_transaction(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+
+class ReceiptReconciler:
+    """
+    Apply transaction outcomes to pending Policy and Claim rows
+    """
+    def __init__(self, transaction_manager):
+        self.transaction_manager = transaction_manager
+        self.smart_contract = transaction_manager.smart_contract
+
+    def reconcile_once(self):
+        outcomes = self.transaction_manager.poll()
+        if not outcomes:
+            return outcomes
+
+        applied = []
+        stale_keys = []
+        changes = PortfolioChanges()
+        with get_db_session() as db:
+            for outcome in outcomes:
+                if not self.transaction_manager.settle(db, outcome):
+                    continue
+                apply = self._apply_policy_outcome if outcome.kind == 'policy' else self._apply_claim_outcome
+                stale_keys.extend(apply(db, outcome, changes))
+                applied.append(outcome)
+            # Once for the whole batch, so summary rows are locked in a consistent order
+            stale_keys.extend(changes.apply(db))
+            db.commit()
+        query_cache.invalidate(*stale_keys)
+        # After the commit: submitters lock the nonce row before the summary rows locked above
+        if any(outcome.receipt is None for outcome in applied):
+            self.transaction_manager.resync_nonce()
+        return applied
+
+    async def run(self, interval=None):
+        interval = interval or settings.TX_RECEIPT_POLL_SECONDS
+        while True:
+            try:
+                await asyncio.to_thread(self.reconcile_once)
+            except Exception as e:
+                logger.error("Error reconciling transactions: %s", e)
+            await asyncio.sleep(interval)
+
+    def _apply_policy_outcome(self, db, outcome, changes):
+        """
+        Update the policy row and count it into changes; returns the cache keys it made stale
+        """
+        policy = db.query(Policy).filter_by(policy_id=outcome.key).with_for_update().first()
+        if policy is None:
+            return [policy_key(outcome.key)]
+        stale_keys = [policy_key(outcome.key), user_policies_key(policy.user.wallet_address)]
+        if policy.status != PolicyStatus.PENDING:
+            # Event ingestion activated it from its PolicyCreated event already
+            return stale_keys
+        policy.tx_hash = outcome.tx_hash
+        if outcome.succeeded:
+            policy.status = PolicyStatus.ACTIVE
+            # The client holds the placeholder id, so it stays the policy's public id
+            policy.chain_policy_id = self.smart_contract.created_policy_id(outcome.receipt)
+        else:
+            policy.status = PolicyStatus.CANCELLED
+        changes.policy(policy, old_status=PolicyStatus.PENDING)
+        return stale_keys
+
+    def _apply_claim_outcome(self, db, outcome, changes):
+        status = ClaimStatus.PROCESSING if outcome.succeeded else ClaimStatus.REJECTED
+        settle_pending_claim(db, outcome.key, status, changes, outcome.tx_hash)
+        return [claim_key(outcome.key)]
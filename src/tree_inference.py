@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import numpy as np
+
+ARTIFACT_MAGIC = b"SECURCF1"
+ARTIFACT_ALIGNMENT = 64
+ARRAY_NAMES = (
+    'feature',
+    'threshold',
+    'children_left',
+    'children_right',
+    'leaf_values',
+    'roots',
+    'mean',
+    'scale'
+)
+
+class CompiledForest:
+    """
+    Flattened random forest and scaler for low-latency inference
+    """
+    def __init__(self, feature, threshold, children_left, children_right,
+                 leaf_values, roots, max_depth, mean, scale, version=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.max_depth = max_depth
+        self.mean = mean
+        self.scale = scale
+        self.version = version
+
+    @classmethod
+    def from_sklearn(cls, model, scaler):
+        """
+        Flatten a fitted RandomForestClassifier and StandardScaler into contiguous arrays
+        """
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point back at themselves so every row can take max_depth steps
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+
+            value = tree.value[:, 0, :]
+            values.append(value / value.sum(axis=1, keepdims=True))
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        n_features = model.n_features_in_
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+            children_left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+            children_right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+            leaf_values=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            mean=np.asarray(mean, dtype=np.float64),
+            scale=np.asarray(scale, dtype=np.float64)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map an artifact written by save(); the arrays are read-only views
+        of the file, so every process loading it shares the same physical pages
+        """
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        header_length = int(buffer[len(ARTIFACT_MAGIC):len(ARTIFACT_MAGIC) + 8].view('<u8')[0])
+        header_start = len(ARTIFACT_MAGIC) + 8
+        header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+
+        arrays = {}
+        for name, layout in header['arrays'].items():
+            dtype = np.dtype(layout['dtype'])
+            count = int(np.prod(layout['shape']))
+            arrays[name] = np.frombuffer(
+                buffer, dtype=dtype, count=count, offset=header['data_offset'] + layout['offset']
+            ).reshape(layout['shape'])
+        return cls(max_depth=header['max_depth'], version=header['version'], **arrays)
+
+    @staticmethod
+    def is_artifact(path):
+        with open(path, 'rb') as f:
+            return f.read(len(ARTIFACT_MAGIC)) == ARTIFACT_MAGIC
+
+    def save(self, path, version=None):
+        """
+        Write the arrays in a flat, aligned layout that load() can memory-map
+
+        The file is written beside the target and renamed into place, so
+        processes still mapping the previous artifact keep a consistent copy.
+        """
+        layouts = {}
+        offset = 0
+        for name in ARRAY_NAMES:
+            array = getattr(self, name)
+            offset = _align(offset)
+            layouts[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+
+        header = {'version': version or self.version, 'max_depth': int(self.max_depth), 'arrays': layouts}
+        header_length = len(json.dumps(dict(header, data_offset=0)).encode()) + 32
+        header['data_offset'] = _align(len(ARTIFACT_MAGIC) + 8 + header_length)
+        header_bytes = json.dumps(header).encode().ljust(header_length)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(ARTIFACT_MAGIC)
+            f.write(np.array([header_length], dtype='<u8').tobytes())
+            f.write(header_bytes)
+            for name in ARRAY_NAMES:
+                f.seek(header['data_offset'] + layouts[name]['offset'])
+                f.write(np.ascontiguousarray(getattr(self, name)).tobytes())
+        os.replace(tmp_path, path)
+
+    def predict_proba(self, features):
+        """
+        Predict class probabilities for raw (unscaled) feature rows
+        """
+        # Scale exactly as StandardScaler does, then round to float32 like sklearn trees
+        features = np.asarray(features, dtype=np.float64)
+        features = ((features - self.mean) / self.scale).astype(np.float32)
+
+        rows = np.arange(features.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (features.shape[0], self.roots.size))
+        for _ in range(self.max_depth):
+            go_left = features[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+
+        return self.leaf_values[nodes].mean(axis=1)
+
+def _align(offset):
+    return -(-offset // ARTIFACT_ALIGNMENT) * ARTIFACT_ALIGNMENT
+
+def main():
+    from .risk_assessment import RiskAssessment
+
+    parser = argparse.ArgumentParser(description="Convert a joblib risk model into a memory-mappable artifact")
+    parser.add_argument("source", help="joblib artifact written by RiskAssessment.save_model")
+    parser.add_argument("target", help="compiled artifact to write")
+    parser.add_argument("--version", help="defaults to the version saved in the source")
+    args = parser.parse_args()
+
+    assessor = RiskAssessment()
+    assessor.load_model(args.source, args.version)
+    assessor.save_compiled(args.target)
+    print(f"Wrote {args.target} (version {assessor.version})")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
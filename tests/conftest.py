@@ -0,0 +1,58 @@
+"""
+Shared test setup: a scratch SQLite database and no log files, configured before src is imported
+
+Set TEST_DATABASE_URL to run against a scratch PostgreSQL database instead;
+the schema is dropped and recreated for every test that uses the database.
+"""
+import os
+import tempfile
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="secur-tests-")
+os.environ["DATABASE_URL"] = os.environ.get("TEST_DATABASE_URL", f"sqlite:///{TEST_DIR}/test.db")
+os.environ["LOG_TO_FILE"] = "false"
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["EVIDENCE_BACKEND"] = "local"
+os.environ["EVIDENCE_LOCAL_DIR"] = os.path.join(TEST_DIR, "evidence")
+os.environ["MODEL_DIR"] = os.path.join(TEST_DIR, "models")
+os.makedirs(os.environ["MODEL_DIR"], exist_ok=True)
+
+@pytest.fixture
+def database():
+    """
+    An empty, fully migrated schema
+    """
+    from src.database import get_engine, init_db
+    from src.models import Base
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+    yield engine
+
+@pytest.fixture(scope="session")
+def training_data():
+    from benchmarks.bench_inference import make_training_data
+    return make_training_data(300)
+
+@pytest.fixture(scope="session")
+def trained_assessor(training_data):
+    from src.risk_assessment import RiskAssessment
+    assessor = RiskAssessment()
+    assessor.train_model(*training_data)
+    return assessor
+
+@pytest.fixture
+def api(database, trained_assessor, monkeypatch):
+    """
+    The app on an in-process chain stand-in and a trained model, without its background tasks
+    """
+    from tests.fake_chain import InProcessChain
+    from src.api import app, insurance_manager, async_manager
+    from src.cache import query_cache
+    chain = InProcessChain()
+    monkeypatch.setattr(insurance_manager, "smart_contract", chain)
+    monkeypatch.setattr(async_manager, "smart_contract", chain)
+    insurance_manager.risk_assessor.activate(trained_assessor)
+    query_cache.local.clear()
+    app.state.chain = chain
+    return app
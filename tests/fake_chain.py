@@ -0,0 +1,64 @@
+"""
+In-process stand-in for SmartContract, shared by the tests and the end-to-end benchmark
+"""
+import asyncio
+import time
+import uuid
+from hexbytes import HexBytes
+
+class InProcessChain:
+    """
+    Stand-in for SmartContract: every transaction succeeds after block_time seconds
+
+    Results are shaped like web3's receipts (transactionHash, status, logs),
+    so callers decode them exactly as they do the real client's.
+    """
+    def __init__(self, block_time=0.0):
+        self.block_time = block_time
+        self.contract_address = "0x" + "c" * 40
+        self.transactions = 0
+
+    def _receipt(self, event, args):
+        self.transactions += 1
+        return {
+            'transactionHash': HexBytes(uuid.uuid4().bytes * 2),
+            'status': 1,
+            'logs': [{'address': self.contract_address, 'event': event, 'args': args}]
+        }
+
+    def _policy_receipt(self):
+        # Random ids, so runs against a database kept from an earlier run don't collide
+        return self._receipt('PolicyCreated', {'policyId': uuid.uuid4().int >> 64})
+
+    def _claim_receipt(self, claim_id):
+        return self._receipt('ClaimProcessed', {'claimId': claim_id})
+
+    def create_insurance_contract(self, user_address, policy_details):
+        time.sleep(self.block_time)
+        return self._policy_receipt()
+
+    def process_claim(self, claim_id, claim_data):
+        time.sleep(self.block_time)
+        return self._claim_receipt(claim_id)
+
+    async def create_insurance_contract_async(self, user_address, policy_details):
+        await asyncio.sleep(self.block_time)
+        return self._policy_receipt()
+
+    async def process_claim_async(self, claim_id, claim_data):
+        await asyncio.sleep(self.block_time)
+        return self._claim_receipt(claim_id)
+
+    def create_insurance_contracts(self, applications):
+        # One block confirms the whole batch, as with back-to-back nonces on a real node
+        time.sleep(self.block_time)
+        return [self._policy_receipt() for _ in applications]
+
+    def created_policy_id(self, receipt):
+        for log in receipt['logs']:
+            if log['address'] == self.contract_address and log['event'] == 'PolicyCreated':
+                return str(log['args']['policyId'])
+        return None
+
+    def is_connected(self):
+        return True
@@ -0,0 +1,68 @@
+"""
+Hot endpoints return FastJSONResponse, which FastAPI passes through without checking it against the
+route's response_model; these tests keep the real payloads and the documented models in step.
+"""
+import asyncio
+import typing
+import httpx
+from pydantic import BaseModel, parse_obj_as
+from fastapi.routing import APIRoute
+
+APPLICATION = {'wallet_address': "0x" + "d" * 40, 'age': 40, 'claim_history': 0, 'risk_factors': 0.3,
+               'requested_coverage': 10000, 'duration': 365}
+
+def response_model(app, method, path):
+    for route in app.routes:
+        if isinstance(route, APIRoute) and method in route.methods and route.path == path:
+            return route.response_model
+    raise LookupError(f"{method} {path}")
+
+def assert_matches(model, body):
+    """
+    body validates against model, and every object carries exactly the fields its model declares
+    """
+    parse_obj_as(model, body)
+    origin, args = typing.get_origin(model), typing.get_args(model)
+    if origin is typing.Union:
+        model = next(arg for arg in args if isinstance(body, list) == (typing.get_origin(arg) is list))
+        origin, args = typing.get_origin(model), typing.get_args(model)
+    if origin is list:
+        for item in body:
+            assert_matches(args[0], item)
+    elif isinstance(model, type) and issubclass(model, BaseModel):
+        assert set(body) == set(model.__fields__), model.__name__
+        for name, field in model.__fields__.items():
+            if body[name] is not None:
+                assert_matches(field.outer_type_, body[name])
+
+def test_every_payload_matches_its_response_model(api):
+    async def exchange(client, method, path, route=None, **kwargs):
+        response = await client.request(method, path, **kwargs)
+        assert response.status_code == 200, response.text
+        assert_matches(response_model(api, method, route or path), response.json())
+        return response.json()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://test") as client:
+            policy = await exchange(client, "POST", "/apply-insurance", json=APPLICATION)
+            await exchange(client, "GET", f"/policy/{policy['policy_id']}", "/policy/{policy_id}",
+                           headers={'Authorization': "Bearer token"})
+            user_policies = "/user-policies/{user_address}"
+            await exchange(client, "GET", f"/user-policies/{APPLICATION['wallet_address']}", user_policies)
+            await exchange(client, "GET", f"/user-policies/{APPLICATION['wallet_address']}", user_policies,
+                           params={'limit': 1})
+            await exchange(client, "GET", f"/user-portfolio/{APPLICATION['wallet_address']}",
+                           "/user-portfolio/{user_address}")
+
+            evidence = await exchange(client, "POST", "/evidence", params={'filename': "photo.jpg"},
+                                      content=b"evidence", headers={'Content-Type': "image/jpeg"})
+            await exchange(client, "GET", f"/evidence/{evidence['sha256']}", "/evidence/{sha256}")
+            claim = {'claim_id': "claim-1", 'policy_id': policy['policy_id'], 'amount': 100.0,
+                     'evidence_hash': evidence['evidence_hash']}
+            await exchange(client, "POST", "/submit-claim", json=claim)
+            await exchange(client, "GET", "/claim-status/claim-1", "/claim-status/{claim_id}")
+
+            await exchange(client, "POST", "/risk-assessment", json={'user_data': APPLICATION})
+            await exchange(client, "POST", "/risk-assessment/batch", json={'users': [APPLICATION] * 2})
+
+    asyncio.run(run())
\ No newline at end of file
@@ -0,0 +1,24 @@
+import asyncio
+from tests.test_portfolio_summary import application
+
+def test_waiting_for_the_chain_holds_no_connection(api, monkeypatch):
+    from src.api import async_manager
+    from src.database import get_async_engine
+    chain = api.state.chain
+    create = chain.create_insurance_contract_async
+    checked_out = []
+
+    async def create_insurance_contract_async(*args):
+        checked_out.append(get_async_engine().pool.checkedout())
+        return await create(*args)
+
+    monkeypatch.setattr(chain, "create_insurance_contract_async", create_insurance_contract_async)
+
+    async def run():
+        # Once as a new user, then as an existing one whose lookup opens a transaction
+        for _ in range(2):
+            await async_manager.process_insurance_application(application(1))
+        await get_async_engine().dispose()
+
+    asyncio.run(run())
+    assert checked_out == [0, 0]
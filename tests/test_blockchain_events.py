@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+import pytest
+from src.blockchain_events import BlockchainEventManager
+from tests.test_portfolio_summary import assert_summaries_match_a_rebuild
+
+WALLET = "0x" + "b" * 40
+
+class FakeLogs:
+    def __init__(self, chain, name):
+        self.chain = chain
+        self.name = name
+
+    def get_logs(self, fromBlock, toBlock):
+        self.chain.on_get_logs()
+        return [event for event in self.chain.events[self.name] if fromBlock <= event.blockNumber <= toBlock]
+
+class FakeChain:
+    """
+    Stand-in for SmartContract with a head block, per-block hashes and a log of contract events
+    """
+    def __init__(self, head=20):
+        self.contract = SimpleNamespace(address="0x" + "c" * 40, events=SimpleNamespace(
+            PolicyCreated=FakeLogs(self, 'PolicyCreated'), ClaimProcessed=FakeLogs(self, 'ClaimProcessed')
+        ))
+        self.w3 = SimpleNamespace(eth=SimpleNamespace(block_number=head, get_block=self.get_block))
+        self.events = {'PolicyCreated': [], 'ClaimProcessed': []}
+        self.fork = 0
+        self.forked_from = None
+        self.on_get_logs = lambda: None
+
+    def get_block(self, number):
+        fork = self.fork if self.forked_from is not None and number >= self.forked_from else 0
+        return SimpleNamespace(hash=bytes.fromhex(f"{fork:02x}{number:062x}"))
+
+    def policy_created(self, block, policy_id, tx_hash):
+        self.events['PolicyCreated'].append(SimpleNamespace(blockNumber=block, transactionHash=bytes.fromhex(tx_hash),
+            args=SimpleNamespace(policyId=policy_id, userAddress=WALLET, coverageAmount=10000, timestamp=1_700_000_000)))
+
+    def claim_processed(self, block, claim_id, policy_id, status):
+        self.events['ClaimProcessed'].append(SimpleNamespace(blockNumber=block, args=SimpleNamespace(
+            claimId=claim_id, policyId=policy_id, amount=100.0, status=status, timestamp=1_700_000_100)))
+
+    def reorg(self, from_block):
+        """
+        Replace every block from from_block onwards, dropping the events they held
+        """
+        self.fork += 1
+        self.forked_from = from_block
+        for name, events in self.events.items():
+            self.events[name] = [event for event in events if event.blockNumber < from_block]
+
+@pytest.fixture
+def chain(database):
+    return FakeChain()
+
+def ingester(chain):
+    return BlockchainEventManager(chain, start_block=0, confirmations=2, batch_blocks=100, max_batch_blocks=100)
+
+def rows():
+    from src.database import get_db_session
+    from src.models import Policy, Claim
+    with get_db_session() as db:
+        policies = {policy.policy_id: (policy.chain_policy_id, policy.status.value) for policy in db.query(Policy)}
+        claims = {claim.claim_id: claim.status.value for claim in db.query(Claim)}
+    return policies, claims
+
+def test_claim_for_an_unknown_policy_is_skipped(chain):
+    chain.claim_processed(5, 1, 99, 1)
+    assert ingester(chain).backfill()['last_block'] == 18
+    assert rows() == ({}, {})
+
+def test_rows_from_abandoned_blocks_are_confirmed_again_by_the_replay(chain):
+    from src.database import get_db_session
+    from src.models import PolicyClaimStats
+    chain.policy_created(16, 1, "aa" * 32)
+    chain.policy_created(17, 2, "bb" * 32)
+    chain.claim_processed(18, 1, 1, 2)
+    manager = ingester(chain)
+    manager.backfill()
+    assert rows() == ({"1": ("1", "active"), "2": ("2", "active")}, {"1": "rejected"})
+
+    # The reorg dropped the claim and mined the second policy again, after another one took its id
+    chain.reorg(17)
+    chain.policy_created(17, 2, "cc" * 32)
+    chain.policy_created(18, 3, "bb" * 32)
+    manager.backfill()
+    # The public id already handed out stays with its transaction, whatever the contract now calls it
+    assert rows() == ({"1": ("1", "active"), "2": ("3", "active"), "2-" + "cc" * 32: ("2", "active")},
+                      {"1": "pending"})
+    with get_db_session() as db:
+        # The rejection no longer stands, so the claim counts toward the policy's total again
+        assert [stats.claimed_total for stats in db.query(PolicyClaimStats)] == [100.0]
+    assert_summaries_match_a_rebuild()
+
+def test_abandoned_policy_is_left_pending(chain):
+    chain.policy_created(18, 1, "aa" * 32)
+    manager = ingester(chain)
+    manager.backfill()
+    chain.reorg(18)
+    manager.backfill()
+    assert rows() == ({"1": (None, "pending")}, {})
+    assert_summaries_match_a_rebuild()
+
+def test_range_is_not_applied_when_the_checkpoint_moved_during_get_logs(chain):
+    chain.policy_created(5, 1, "aa" * 32)
+    first, second = ingester(chain), ingester(chain)
+
+    def race():
+        # Another ingester commits the same range while the first is still fetching
+        chain.on_get_logs = lambda: None
+        assert second.ingest_next_range()
+
+    chain.on_get_logs = race
+    assert not first.ingest_next_range()
+    assert first.ingest_next_range()
+    assert (first.events_processed, second.events_processed) == (0, 1)
+    assert rows() == ({"1": ("1", "active")}, {})
+
+def test_chain_changing_below_the_rewind_point_rewinds_again(chain):
+    chain.policy_created(16, 1, "aa" * 32)
+    chain.policy_created(18, 2, "bb" * 32)
+    manager = ingester(chain)
+    manager.backfill()
+    chain.reorg(18)
+    assert not manager.ingest_next_range()
+    assert manager.last_block == 16
+
+    # Before the replay, the chain changes again under the block the ingester stepped back to
+    chain.reorg(15)
+    manager.backfill()
+    assert rows() == ({"1": (None, "pending"), "2": (None, "pending")}, {})
+    assert_summaries_match_a_rebuild()
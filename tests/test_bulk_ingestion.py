@@ -0,0 +1,120 @@
+import asyncio
+import json
+import httpx
+import pytest
+from src.bulk_ingestion import RowParser
+from src.exceptions import ValidationError
+
+HEADER = "wallet_address,age,claim_history,risk_factors,requested_coverage,duration,occupation"
+
+def feed_all(parser, text):
+    return [(parser.record_line, parsed) for parsed in map(parser.feed, text.split("\n")) if parsed is not None]
+
+def test_csv_quoted_field_spans_lines():
+    parser = RowParser("csv")
+    rows = feed_all(parser, "\n".join([
+        HEADER,
+        '0xaaa,30,0,0.5,10000,365,"line one',
+        'line two, with a comma"',
+        '0xbbb,40,1,0.2,5000,180,"He said ""hi"""',
+    ]))
+    parser.finish()
+    assert [line for line, _ in rows] == [2, 4]
+    assert rows[0][1]['occupation'] == "line one\nline two, with a comma"
+    assert rows[0][1]['age'] == 30
+    assert rows[1][1]['occupation'] == 'He said "hi"'
+
+def test_csv_blank_lines_inside_quotes_are_kept():
+    parser = RowParser("csv")
+    rows = feed_all(parser, f'{HEADER}\n0xaaa,30,0,0.5,10000,365,"a\n\nb"\n\n')
+    assert rows[0][1]['occupation'] == "a\n\nb"
+
+def test_csv_unterminated_quote_is_reported():
+    parser = RowParser("csv")
+    feed_all(parser, f'{HEADER}\n0xaaa,30,0,0.5,10000,365,"never closed')
+    with pytest.raises(ValidationError, match="Unterminated"):
+        parser.finish()
+
+def test_csv_column_count_mismatch_keeps_parsing():
+    parser = RowParser("csv")
+    parser.feed(HEADER)
+    with pytest.raises(ValidationError):
+        parser.feed("0xaaa,30")
+    assert parser.feed("0xbbb,40,1,0.2,5000,180,")['wallet_address'] == "0xbbb"
+
+def test_ndjson_lines():
+    parser = RowParser("ndjson")
+    row = {'wallet_address': "0xaaa", 'age': 30, 'claim_history': 0, 'risk_factors': 0.5,
+           'requested_coverage': 10000, 'duration': 365}
+    assert parser.feed(json.dumps(row))['requested_coverage'] == 10000.0
+    assert parser.feed("") is None
+    with pytest.raises(ValidationError):
+        parser.feed("[1, 2]")
+
+def application(i):
+    return {'wallet_address': f"0x{i:040x}", 'age': 30 + i, 'claim_history': 0, 'risk_factors': 0.5,
+            'requested_coverage': 10000, 'duration': 365}
+
+def test_bulk_endpoint_streams_results_for_every_row(api):
+    # Regression: StreamingResponse's disconnect listener used to swallow the request body chunks
+    n_rows = 25
+
+    async def body():
+        for i in range(n_rows):
+            yield (json.dumps(application(i)) + "\n").encode()
+            await asyncio.sleep(0)
+
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://test") as client:
+            response = await client.post("/apply-insurance/bulk?format=ndjson", content=body())
+            return [json.loads(line) for line in response.text.splitlines()]
+
+    results = asyncio.run(post())
+    assert results[-1]['summary']['created'] == n_rows
+    assert sorted(result['row'] for result in results[:-1]) == list(range(1, n_rows + 1))
+    assert all(result['ok'] for result in results[:-1])
+
+def test_fire_mode_commits_each_batch_before_broadcasting_the_next(api, monkeypatch):
+    from src.api import insurance_manager
+    from src.bulk_ingestion import BulkApplicationIngester
+    from src.database import get_db_session
+    from src.models import Policy
+    from src.transaction_manager import TransactionManager
+    from tests.test_transaction_manager import FakeChain
+
+    chain = FakeChain()
+    committed_at_broadcast = []
+    send = chain.send_create_policy
+
+    def send_create_policy(*args):
+        with get_db_session() as db:
+            committed_at_broadcast.append(db.query(Policy).count())
+        return send(*args)
+
+    monkeypatch.setattr(chain, "send_create_policy", send_create_policy)
+    monkeypatch.setattr(insurance_manager, "smart_contract", chain)
+    monkeypatch.setattr(insurance_manager, "transaction_manager", TransactionManager(chain))
+    ingester = BulkApplicationIngester(insurance_manager, chunk_size=5, submit_batch_size=2)
+    lines = [json.dumps(application(i)) for i in range(5)]
+
+    results = list(ingester.ingest(lines, "ndjson"))
+    assert results[-1]['summary']['created'] == 5
+    assert committed_at_broadcast == [0, 0, 2, 2, 4]
+
+def test_cli_loads_the_model_and_creates_every_row(database, trained_assessor, tmp_path, monkeypatch, capsys):
+    import sys
+    from src import bulk_ingestion, insurance_manager
+    from tests.fake_chain import InProcessChain
+
+    model_path = str(tmp_path / "model.joblib")
+    trained_assessor.save_model(model_path, "cli-test")
+    input_path = tmp_path / "applicants.ndjson"
+    input_path.write_text("".join(json.dumps(application(i)) + "\n" for i in range(3)))
+    monkeypatch.setattr(insurance_manager, "SmartContract", lambda *args: InProcessChain())
+    monkeypatch.setattr(sys, "argv", ["bulk_ingestion", str(input_path), "--model", model_path])
+
+    bulk_ingestion.main()
+    results = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [result['ok'] for result in results[:-1]] == [True] * 3
+    assert results[-1]['summary']['created'] == 3
+    assert {result['policy']['risk_score'] is not None for result in results[:-1]} == {True}
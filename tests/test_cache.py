@@ -0,0 +1,130 @@
+import asyncio
+import enum
+import time
+import pytest
+from src.cache import LRUTTLCache, InMemorySharedBackend, ReadThroughCache
+
+class Status(enum.Enum):
+    ACTIVE = "active"
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUTTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1) and cache.get("c") == (True, 3)
+    assert cache.evictions == 1
+
+def test_entries_expire():
+    cache = LRUTTLCache(max_size=10, ttl=60)
+    cache.set("a", 1, ttl=0)
+    assert cache.get("a") == (False, None)
+    assert cache.expirations == 1
+
+def test_loader_runs_once_until_invalidated():
+    cache = ReadThroughCache(max_size=10, ttl=60)
+    loads = []
+    loader = lambda: loads.append(1) or len(loads)
+    assert cache.get_or_load("policy:1", loader) == 1
+    assert cache.get_or_load("policy:1", loader) == 1
+    cache.invalidate("policy:1")
+    assert cache.get_or_load("policy:1", loader) == 2
+    assert cache.written_recently("policy:1")
+    assert not cache.written_recently("policy:2")
+
+def test_value_loaded_across_an_invalidation_is_not_cached():
+    cache = ReadThroughCache(max_size=10, ttl=60)
+
+    def loader():
+        # The database read happened before a writer committed and invalidated the key
+        cache.invalidate("policy:1")
+        return "stale"
+
+    assert cache.get_or_load("policy:1", loader) == "stale"
+    assert cache.get_or_load("policy:1", lambda: "fresh") == "fresh"
+    assert cache.get_or_load("policy:1", lambda: "later") == "fresh"
+    assert cache.stats()['stale_loads'] == 1
+
+def test_async_value_loaded_across_an_invalidation_is_not_cached():
+    cache = ReadThroughCache(max_size=10, ttl=60)
+
+    async def stale():
+        cache.invalidate("policy:1")
+        return "stale"
+
+    async def fresh():
+        return "fresh"
+
+    async def run():
+        assert await cache.get_or_load_async("policy:1", stale) == "stale"
+        assert await cache.get_or_load_async("policy:1", fresh) == "fresh"
+        assert await cache.get_or_load_async("policy:1", stale) == "fresh"
+
+    asyncio.run(run())
+
+@pytest.fixture
+def workers():
+    """
+    Two workers' caches sharing one backend, both subscribed to invalidations
+    """
+    shared = InMemorySharedBackend()
+    caches = [ReadThroughCache(max_size=10, ttl=60, shared=shared) for _ in range(2)]
+    for cache in caches:
+        cache.start()
+    return caches
+
+def test_shared_tier_answers_other_workers(workers):
+    first, second = workers
+    first.get_or_load("policy:1", lambda: {'status': Status.ACTIVE})
+    assert second.get_or_load("policy:1", lambda: pytest.fail("loaded again")) == {'status': "active"}
+    assert second.stats()['shared_hits'] == 1
+
+def test_every_tier_returns_plain_json(workers):
+    first, _ = workers
+    value = first.get_or_load("policy:1", lambda: {'status': Status.ACTIVE, 'amount': 1.5})
+    assert value == {'status': "active", 'amount': 1.5}
+    assert first.get_or_load("policy:1", lambda: None) == value
+
+def test_invalidation_reaches_other_workers(workers):
+    first, second = workers
+    first.get_or_load("policy:1", lambda: "old")
+    second.get_or_load("policy:1", lambda: "old")
+
+    first.invalidate("policy:1")
+    assert second.local.get("policy:1") == (False, None)
+    assert second.written_recently("policy:1")
+    assert second.get_or_load("policy:1", lambda: "new") == "new"
+
+def test_load_invalidated_by_another_worker_is_not_shared(workers):
+    first, second = workers
+
+    def loader():
+        second.invalidate("policy:1")
+        return "stale"
+
+    assert first.get_or_load("policy:1", loader) == "stale"
+    assert second.get_or_load("policy:1", lambda: "fresh") == "fresh"
+    assert first.get_or_load("policy:1", lambda: "later") == "fresh"
+
+def test_invalidations_are_missed_until_started():
+    shared = InMemorySharedBackend()
+    first, second = ReadThroughCache(shared=shared), ReadThroughCache(shared=shared)
+    second.get_or_load("policy:1", lambda: "old")
+    first.invalidate("policy:1")
+    assert second.local.get("policy:1") == (True, "old")
+
+    second.start()
+    second.get_or_load("policy:2", lambda: "old")
+    first.invalidate("policy:2")
+    assert second.local.get("policy:2") == (False, None)
+
+def test_shared_entries_expire():
+    shared = InMemorySharedBackend()
+    shared.set("policy:1", "value", ttl=0, generation=0)
+    time.sleep(0.001)
+    assert shared.get("policy:1") == (False, None, 0)
+    shared.delete("policy:1")
+    assert not shared.set("policy:1", "value", ttl=60, generation=0)
+    assert shared.set("policy:1", "value", ttl=60, generation=1)
\ No newline at end of file
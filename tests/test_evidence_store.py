@@ -0,0 +1,17 @@
+from src.evidence_store import IPFSBackend
+
+
+def test_client_filename_cannot_inject_multipart_headers(tmp_path):
+    path = tmp_path / "evidence"
+    path.write_bytes(b"photo")
+    filename = 'a"\r\nContent-Type: text/html\r\n\r\nx.jpg'
+
+    body = b"".join(IPFSBackend(host="ipfs", port=5001)._multipart_body(str(path), filename, "ab" * 32, "b"))
+
+    head = body.split(b"\r\n\r\n", 1)[0].decode()
+    assert head.splitlines() == [
+        "--b",
+        'Content-Disposition: form-data; name="file"; filename="' + "ab" * 32 + '"; '
+        "filename*=UTF-8''a%22%0D%0AContent-Type%3A%20text%2Fhtml%0D%0A%0D%0Ax.jpg",
+        "Content-Type: application/octet-stream"
+    ]
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from src.exceptions import ClaimError, FraudScreeningError
+from src.fraud_screening import FraudScreener
+
+APPLICATION = {'wallet_address': "0x" + "f" * 40, 'age': 40, 'claim_history': 0, 'risk_factors': 0.3,
+               'requested_coverage': 10000, 'duration': 365}
+
+def claim_data(policy, claim_id, amount=100.0):
+    return {'claim_id': claim_id, 'policy_id': policy['policy_id'], 'amount': amount,
+            'evidence_hash': f"Qm{claim_id}"}
+
+def committed(claim_id):
+    """
+    The claim's status and its policy's claimed total, as another connection sees them
+    """
+    from src.database import get_db_session
+    from src.models import Claim, PolicyClaimStats
+    with get_db_session() as db:
+        claim = db.query(Claim).filter_by(claim_id=claim_id).one()
+        return claim.status.value, db.get(PolicyClaimStats, claim.policy_id).claimed_total
+
+def test_flag_is_the_default_mode():
+    from src.config import Settings
+    assert Settings.__fields__['FRAUD_SCREENING_MODE'].default == "flag"
+
+def test_explicit_zero_limits_are_not_replaced_by_the_defaults():
+    screener = FraudScreener(mode="reject", max_policy_claims=0, max_user_claims=0, max_user_window_amount=0)
+    assert (screener.max_policy_claims, screener.max_user_claims, screener.max_user_window_amount) == (0, 0, 0)
+    with pytest.raises(ValueError):
+        FraudScreener(window_seconds=0)
+
+def test_zero_claim_limit_rejects_the_first_claim(api, monkeypatch):
+    from src.api import insurance_manager
+    monkeypatch.setattr(insurance_manager, "fraud_screener", FraudScreener(mode="reject", max_policy_claims=0))
+    policy = insurance_manager.process_insurance_application(APPLICATION)
+    with pytest.raises(ClaimError, match="fraud screening") as rejected:
+        insurance_manager.submit_claim(claim_data(policy, "claim-0"))
+    assert isinstance(rejected.value.__context__, FraudScreeningError)
+
+def test_screening_commits_before_the_chain_call(api, monkeypatch):
+    from src.api import insurance_manager
+    chain = insurance_manager.smart_contract
+    policy = insurance_manager.process_insurance_application(APPLICATION)
+    seen = []
+    process_claim = chain.process_claim
+
+    def observe(claim_id, data):
+        # The aggregate rows are unlocked and the pending claim is visible while the chain works
+        seen.append(committed(claim_id))
+        return process_claim(claim_id, data)
+
+    monkeypatch.setattr(chain, "process_claim", observe)
+    claim = insurance_manager.submit_claim(claim_data(policy, "claim-0"))
+    assert seen == [("pending", 100.0)]
+    assert claim['status'].value == "processing"
+    assert committed("claim-0") == ("processing", 100.0)
+
+def test_failed_chain_call_withdraws_the_claim(api, monkeypatch):
+    from src.api import insurance_manager, async_manager
+    from src.database import get_db_session
+    from src.models import Claim, PolicyClaimStats
+    from tests.test_portfolio_summary import assert_summaries_match_a_rebuild
+    monkeypatch.setattr(insurance_manager, "fraud_screener", FraudScreener(mode="reject"))
+    monkeypatch.setattr(async_manager, "fraud_screener", insurance_manager.fraud_screener)
+    chain = insurance_manager.smart_contract
+    policy = insurance_manager.process_insurance_application(APPLICATION)
+
+    def unreachable(*args):
+        raise ConnectionError("node unreachable")
+
+    async def unreachable_async(*args):
+        unreachable()
+
+    with monkeypatch.context() as offline:
+        offline.setattr(chain, "process_claim", unreachable)
+        offline.setattr(chain, "process_claim_async", unreachable_async)
+        with pytest.raises(Exception, match="node unreachable"):
+            insurance_manager.submit_claim(claim_data(policy, "claim-0"))
+        with pytest.raises(Exception, match="node unreachable"):
+            asyncio.run(async_manager.submit_claim(claim_data(policy, "claim-0")))
+
+    with get_db_session() as db:
+        assert db.query(Claim).count() == 0
+        stats = db.query(PolicyClaimStats).one()
+        assert (stats.claim_count, stats.claimed_total, stats.window_count, stats.last_claim_at) == (0, 0.0, 0, None)
+    assert_summaries_match_a_rebuild()
+    # Nothing left to trip the duplicate or minimum-interval checks on a retry
+    assert insurance_manager.submit_claim(claim_data(policy, "claim-0"))['status'].value == "processing"
+    assert committed("claim-0") == ("processing", 100.0)
\ No newline at end of file
@@ -0,0 +1,72 @@
+import asyncio
+import httpx
+import pytest
+from src import idempotency
+from src.idempotency import IdempotencyStore
+from src.exceptions import IdempotencyError
+
+def counting_operation(calls, response=None):
+    async def operation():
+        calls.append(1)
+        return response or {'policy_id': f"policy-{len(calls)}"}
+    return operation
+
+def test_response_whose_first_write_failed_is_still_replayed_and_not_run_again(database, monkeypatch):
+    monkeypatch.setattr(idempotency, "COMPLETE_RETRY_SECONDS", 0.001)
+    first, second = IdempotencyStore(), IdempotencyStore()
+    complete = first._complete
+    failures = [ConnectionError("database unreachable")]
+    def flaky_complete(*args):
+        if failures:
+            raise failures.pop()
+        return complete(*args)
+    monkeypatch.setattr(first, "_complete", flaky_complete)
+    calls = []
+
+    async def run():
+        response, replayed = await first.run("apply-insurance:key", "body", counting_operation(calls))
+        assert (response, replayed) == ({'policy_id': "policy-1"}, False)
+        while first.stats()['completing']:
+            await asyncio.sleep(0.001)
+        # Another worker, which has nothing in its in-process index
+        return await second.run("apply-insurance:key", "body", counting_operation(calls))
+
+    assert asyncio.run(run()) == ({'policy_id': "policy-1"}, True)
+    assert calls == [1]
+
+def test_operation_slower_than_the_reservation_timeout_is_not_taken_over(database):
+    first, second = IdempotencyStore(reservation_timeout=0.3), IdempotencyStore(reservation_timeout=0.3)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.6)
+        return {'policy_id': "policy-1"}
+
+    async def run():
+        task = asyncio.create_task(first.run("apply-insurance:key", "body", slow))
+        await asyncio.sleep(0.45)
+        with pytest.raises(IdempotencyError):
+            await second.run("apply-insurance:key", "body", counting_operation(calls))
+        return await task
+
+    assert asyncio.run(run()) == ({'policy_id': "policy-1"}, False)
+    assert calls == [1]
+
+def test_claim_is_keyed_by_claim_id_whatever_idempotency_key_is_sent(api):
+    application = {'wallet_address': "0x" + "f" * 40, 'age': 40, 'claim_history': 0, 'risk_factors': 0.3,
+                   'requested_coverage': 10000, 'duration': 365}
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api), base_url="http://test") as client:
+            policy = (await client.post("/apply-insurance", json=application)).json()
+            claim = {'claim_id': "claim-keyed", 'policy_id': policy['policy_id'], 'amount': 100.0,
+                     'evidence_hash': "Qm" + "e" * 44}
+            first = await client.post("/submit-claim", json=claim, headers={'Idempotency-Key': "a"})
+            second = await client.post("/submit-claim", json=claim, headers={'Idempotency-Key': "b"})
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert first.status_code == second.status_code == 200
+    assert second.headers.get('Idempotent-Replayed') == "true"
+    assert second.json() == first.json()
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+import pytest
+from src.exceptions import RiskAssessmentError
+from src.micro_batcher import RiskScoringBatcher
+
+
+class FlakyAssessor:
+    """
+    Returns nothing for its first batch, then scores each row by age
+    """
+    def __init__(self, failures=1):
+        self.failures = failures
+
+    def analyze_batch(self, rows):
+        if self.failures:
+            self.failures -= 1
+            return None
+        return [{'risk_score': row['age']} for row in rows]
+
+
+def test_a_batch_that_cannot_be_delivered_fails_its_callers_and_keeps_the_worker():
+    batcher = RiskScoringBatcher(FlakyAssessor())
+
+    async def run():
+        with pytest.raises(TypeError):
+            await asyncio.wait_for(batcher.score({'age': 30}), 1)
+        worker = batcher._worker
+        result = await asyncio.wait_for(batcher.score({'age': 40}), 1)
+        assert batcher._worker is worker
+        await batcher.close()
+        return result
+
+    assert asyncio.run(run()) == {'risk_score': 40}
+
+
+def test_requests_queued_behind_a_dead_worker_are_still_served():
+    batcher = RiskScoringBatcher(FlakyAssessor(failures=0))
+
+    async def run():
+        batcher._ensure_worker()
+        await batcher.close()
+        stranded = asyncio.get_running_loop().create_future()
+        await batcher._queue.put(({'age': 20}, stranded))
+        # The next caller restarts the worker on the same queue
+        result = await asyncio.wait_for(batcher.score({'age': 50}), 1)
+        await batcher.close()
+        return await asyncio.wait_for(stranded, 1), result
+
+    assert asyncio.run(run()) == ({'risk_score': 20}, {'risk_score': 50})
+
+
+class SlowAssessor:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def analyze_batch(self, rows):
+        self.started.set()
+        self.release.wait(5)
+        return [{'risk_score': row['age']} for row in rows]
+
+
+def test_close_fails_in_flight_and_queued_requests():
+    assessor = SlowAssessor()
+    batcher = RiskScoringBatcher(assessor, max_batch_size=1)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        in_flight = loop.create_task(batcher.score({'age': 30}))
+        await loop.run_in_executor(None, assessor.started.wait, 1)
+        queued = loop.create_task(batcher.score({'age': 40}))
+        await asyncio.sleep(0.01)
+        await batcher.close()
+        assessor.release.set()
+        return await asyncio.wait_for(asyncio.gather(in_flight, queued, return_exceptions=True), 1)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [RiskAssessmentError, RiskAssessmentError]
@@ -0,0 +1,64 @@
+import os
+import joblib
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from src.model_registry import ModelRegistry
+from src.exceptions import RiskAssessmentError
+from src.config import settings
+
+class RunsCodeWhenUnpickled:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return (os.mkdir, (self.marker,))
+
+@pytest.fixture
+def registry(tmp_path, trained_assessor):
+    model_dir = tmp_path / "models"
+    model_dir.mkdir()
+    trained_assessor.save_model(str(tmp_path / "configured.joblib"), version="configured")
+    trained_assessor.save_compiled(str(model_dir / "next.forest"), version="next")
+    return ModelRegistry(model_path=str(tmp_path / "configured.joblib"), model_dir=str(model_dir))
+
+def test_swap_artifact_loads_compiled_artifact_from_model_dir(registry):
+    info = registry.swap_artifact("next.forest")
+    assert info['version'] == "next"
+    assert info['inference_engine'] == "compiled"
+
+@pytest.mark.parametrize("name", ["../configured.joblib", "/etc/passwd", "sub/next.forest", ".."])
+def test_swap_artifact_refuses_names_outside_model_dir(registry, name):
+    with pytest.raises(RiskAssessmentError):
+        registry.swap_artifact(name)
+    assert registry.swaps == 0
+
+def test_swap_artifact_never_unpickles(registry, tmp_path):
+    marker = tmp_path / "unpickled"
+    joblib.dump(RunsCodeWhenUnpickled(str(marker)), os.path.join(registry.model_dir, "evil.joblib"))
+    with pytest.raises(RiskAssessmentError, match="not a compiled model artifact"):
+        registry.swap_artifact("evil.joblib")
+    assert not marker.exists()
+
+def test_swap_artifact_refuses_configured_pickle(registry):
+    with pytest.raises(RiskAssessmentError):
+        registry.swap_artifact()
+
+def test_swap_reloads_configured_pickle(registry):
+    # SIGHUP and startup trust MODEL_PATH, which only the operator can change
+    assert registry.swap()['version'] == "configured"
+
+def test_admin_token_required(monkeypatch):
+    from src.api import require_admin
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials="anything")
+
+    monkeypatch.setattr(settings, "ADMIN_API_TOKEN", "")
+    with pytest.raises(HTTPException) as disabled:
+        require_admin(credentials)
+    assert disabled.value.status_code == 403
+
+    monkeypatch.setattr(settings, "ADMIN_API_TOKEN", "s3cret")
+    with pytest.raises(HTTPException) as rejected:
+        require_admin(credentials)
+    assert rejected.value.status_code == 401
+    require_admin(HTTPAuthorizationCredentials(scheme="Bearer", credentials="s3cret"))
\ No newline at end of file
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from src.insurance_manager import calculate_premium
+from src.portfolio_rerating import PortfolioRerater
+from tests.test_portfolio_summary import assert_summaries_match_a_rebuild
+
+def apply(n, **fields):
+    from src.api import insurance_manager
+    return [
+        insurance_manager.process_insurance_application({
+            'wallet_address': f"0x{i:040x}", 'age': 30 + 7 * i, 'claim_history': 0,
+            'requested_coverage': 5000 * (i + 1), 'duration': 365, **fields
+        })
+        for i in range(n)
+    ]
+
+def test_rerating_with_the_serving_model_leaves_fresh_premiums_unchanged(api, trained_assessor):
+    apply(5)
+
+    stats = PortfolioRerater(trained_assessor, chunk_size=2).run(dry_run=True)
+    assert stats['policies'] == 5
+    assert stats['increased'] == stats['decreased'] == 0
+    assert stats['premium_after'] == stats['premium_before']
+
+def test_client_only_inputs_are_rerated_as_they_were_scored(api, trained_assessor):
+    # The database keeps neither of these; only the stored features do
+    apply(5, claim_history=4, risk_factors=87.5, income=52000.0)
+
+    stats = PortfolioRerater(trained_assessor, chunk_size=2).run(dry_run=True)
+    assert stats['policies'] == 5
+    assert stats['increased'] == stats['decreased'] == 0
+    assert stats['premium_after'] == pytest.approx(stats['premium_before'])
+
+class ConstantModel:
+    version = "constant"
+
+    def __init__(self, risk_score):
+        self.risk_score = risk_score
+
+    def score_matrix(self, features):
+        return np.full(len(features), self.risk_score)
+
+def test_rerating_writes_new_premiums_and_keeps_summaries_in_step(api):
+    from src.api import insurance_manager
+    policies = apply(3, risk_factors=12.0)
+
+    stats = PortfolioRerater(ConstantModel(0.9), chunk_size=2).run()
+    assert stats['updated'] == 3
+    for i, policy in enumerate(policies):
+        details = insurance_manager.get_policy_details(policy['policy_id'])
+        assert details['premium'] == pytest.approx(calculate_premium(5000 * (i + 1), 0.9))
+    assert_summaries_match_a_rebuild()
+
+    assert PortfolioRerater(ConstantModel(0.9)).run()['updated'] == 0
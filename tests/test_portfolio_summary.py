@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from src.portfolio_summary import PortfolioChanges, _summary_select
+
+def summaries():
+    from src.database import get_db_session
+    from src.models import UserPortfolioSummary
+    with get_db_session() as db:
+        return {
+            summary.user_id: (summary.policy_count, summary.active_policy_count, summary.total_coverage,
+                              summary.total_premium, summary.open_claim_count)
+            for summary in db.query(UserPortfolioSummary)
+            if summary.policy_count or summary.open_claim_count
+        }
+
+def recomputed():
+    from src.database import get_engine
+    with get_engine().connect() as conn:
+        return {row[0]: tuple(row[1:6]) for row in conn.execute(_summary_select()) if row[1] or row[5]}
+
+def assert_summaries_match_a_rebuild():
+    actual, expected = summaries(), recomputed()
+    assert actual.keys() == expected.keys()
+    for user_id, totals in expected.items():
+        assert actual[user_id] == pytest.approx(totals), f"user {user_id}"
+
+def application(i, coverage=10000):
+    return {'wallet_address': f"0x{i:040x}", 'age': 30 + i, 'claim_history': 0, 'risk_factors': 0.3,
+            'requested_coverage': coverage, 'duration': 365}
+
+def claim(manager, policy, claim_id):
+    return manager.submit_claim({'claim_id': claim_id, 'policy_id': policy['policy_id'], 'amount': 100.0,
+                                 'evidence_hash': f"Qm{claim_id}"})
+
+def test_writes_keep_summaries_equal_to_a_rebuild(api, trained_assessor):
+    from src.api import insurance_manager, async_manager
+    from src.policy_expiration import PolicyExpirationSweeper
+    from src.portfolio_rerating import PortfolioRerater
+    first = insurance_manager.process_insurance_application(application(1))
+    insurance_manager.process_insurance_application(application(1, coverage=20000))
+    third = asyncio.run(async_manager.process_insurance_application(application(2)))
+    claim(insurance_manager, first, "claim-1")
+    asyncio.run(async_manager.submit_claim({'claim_id': "claim-2", 'policy_id': third['policy_id'],
+                                            'amount': 100.0, 'evidence_hash': "Qmclaim-2"}))
+    assert_summaries_match_a_rebuild()
+    # Both of the first wallet's policies are active and one has an open claim
+    assert summaries()[1][:2] == (2, 2) and summaries()[1][4] == 1
+
+    PortfolioRerater(trained_assessor).run()
+    assert_summaries_match_a_rebuild()
+
+    assert PolicyExpirationSweeper().sweep(now=datetime.utcnow() + timedelta(days=400)) == 3
+    assert_summaries_match_a_rebuild()
+    assert all(totals[1] == 0 for totals in summaries().values())
+
+def test_changes_to_one_user_are_summed_before_the_row_is_written(database):
+    from src.database import get_db_session
+    from src.models import User, Policy, PolicyStatus, ClaimStatus
+    with get_db_session() as db:
+        user = User(wallet_address="0x" + "1" * 40)
+        policy = Policy(policy_id="policy-1", user=user, coverage_amount=1000.0, premium=10.0,
+                        status=PolicyStatus.ACTIVE)
+        db.add(policy)
+        changes = PortfolioChanges()
+        changes.policy(policy)
+        changes.claim(policy, ClaimStatus.PENDING)
+        changes.claim(policy, ClaimStatus.REJECTED, old_status=ClaimStatus.PENDING)
+        policy.premium = 12.5
+        changes.premium(policy, 2.5)
+        assert changes.apply(db) == ["portfolio:" + "0x" + "1" * 40]
+        db.commit()
+        # A status change between two closed states leaves the summary alone
+        changes = PortfolioChanges()
+        changes.claim(policy, ClaimStatus.APPROVED, old_status=ClaimStatus.REJECTED)
+        assert changes.apply(db) == []
+    assert summaries() == {1: (1, 1, 1000.0, 12.5, 0)}
+    assert_summaries_match_a_rebuild()
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Query-plan regression check for the queries InsuranceManager issues
+
+Seeds the test database, records the SQL that each read path and the claim
+write path actually execute, runs EXPLAIN on every statement and fails when a
+hot query falls back to a sequential scan. Run it directly to seed a larger
+dataset into another throwaway database (it drops and recreates the schema):
+
+    python -m tests.test_query_plans                                  # temporary SQLite file
+    python -m tests.test_query_plans --database-url postgresql://.../scratch_db
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+import pytest
+
+HOT_TABLES = {
+    'users', 'policies', 'claims', 'risk_assessments', 'user_portfolio_summaries',
+    'policy_claim_stats', 'user_claim_stats', 'claim_evidence', 'idempotency_keys'
+}
+WALLET = f"0x{7:040x}"
+CLAIMABLE_POLICY = "policy-claimable"
+
+def seed(n_users, policies_per_user):
+    from sqlalchemy import insert, text
+    from src.database import get_engine, get_db_session
+    from src.fraud_screening import rebuild_aggregates
+    from src.portfolio_summary import rebuild_portfolio_summaries
+    from src.models import User, Policy, Claim, RiskAssessment, PolicyStatus, ClaimStatus
+
+    start = datetime(2024, 1, 1)
+    statuses = list(PolicyStatus)
+    n_policies = n_users * policies_per_user
+    with get_db_session() as db:
+        db.execute(insert(User), [
+            {'id': i, 'wallet_address': f"0x{i:040x}", 'age': 20 + i % 60, 'credit_score': 600 + i % 200}
+            for i in range(1, n_users + 1)
+        ])
+        db.execute(insert(Policy), [
+            {
+                'id': i,
+                'policy_id': f"policy-{i}",
+                'chain_policy_id': str(i),
+                'user_id': 1 + i % n_users,
+                'coverage_amount': 10000.0,
+                'premium': 100.0,
+                'status': statuses[i % len(statuses)],
+                'start_date': start + timedelta(hours=i),
+                'end_date': start + timedelta(days=365, hours=i),
+                'tx_hash': f"0x{i:064x}"
+            }
+            for i in range(1, n_policies + 1)
+        ])
+        # Seeded policies are long expired; the claim write path needs one it can claim against
+        db.execute(insert(Policy), [{
+            'id': n_policies + 1,
+            'policy_id': CLAIMABLE_POLICY,
+            'user_id': 7,
+            'coverage_amount': 10000.0,
+            'premium': 100.0,
+            'status': PolicyStatus.ACTIVE,
+            'start_date': datetime.utcnow(),
+            'end_date': datetime.utcnow() + timedelta(days=365)
+        }])
+        db.execute(insert(Claim), [
+            {
+                'id': i,
+                'claim_id': f"claim-{i}",
+                'policy_id': 1 + (i * 7) % n_policies,
+                'amount': 500.0,
+                'status': ClaimStatus.PROCESSING,
+                'evidence_hash': f"Qm{i:044d}"
+            }
+            for i in range(1, n_users + 1)
+        ])
+        db.execute(insert(RiskAssessment), [
+            {'user_id': i, 'risk_score': 0.5, 'risk_factors': "[]"} for i in range(1, n_users + 1)
+        ])
+        db.commit()
+    with get_engine().begin() as conn:
+        rebuild_aggregates(conn)
+        rebuild_portfolio_summaries(conn)
+        conn.execute(text("ANALYZE"))
+
+def _with_session(func):
+    from src.database import get_db_session
+    with get_db_session() as db:
+        return func(db)
+
+def _submit_claim(manager):
+    manager.submit_claim({
+        'claim_id': "claim-query-plans",
+        'policy_id': CLAIMABLE_POLICY,
+        'amount': 100.0,
+        'evidence_hash': "QmQueryPlans"
+    })
+
+def _idempotent_request():
+    # Reserve, complete, then replay the same key, as a retried /submit-claim does
+    from src.idempotency import IdempotencyStore
+    store = IdempotencyStore()
+    operation = lambda: asyncio.sleep(0, result={'claim_id': "claim-idempotent"})
+    asyncio.run(store.run("claim:claim-idempotent", "fingerprint", operation))
+    IdempotencyStore()._reserve("claim:claim-idempotent", "fingerprint")
+
+def _filtered_page(manager):
+    from src.models import PolicyStatus
+    return manager.get_user_policies_page(
+        WALLET, status=PolicyStatus.ACTIVE, start_from=datetime(2024, 1, 1), start_to=datetime(2025, 1, 1)
+    )
+
+def _expiration_candidates(db):
+    from src.policy_expiration import PolicyExpirationSweeper
+    return db.execute(PolicyExpirationSweeper()._candidates(datetime(2025, 1, 1))).all()
+
+QUERY_PATHS = [
+    ("get_policy_details", lambda manager: manager._fetch_policy_details("policy-42")),
+    ("get_claim_status", lambda manager: manager._fetch_claim_status("claim-42")),
+    ("get_user_policies", lambda manager: manager._fetch_user_policies(WALLET)),
+    ("get_user_policies_page", lambda manager: manager.get_user_policies_page(WALLET, limit=50)),
+    ("get_user_policies_page cursor", lambda manager: manager.get_user_policies_page(WALLET, after_id=1000)),
+    ("get_user_policies_page filtered", _filtered_page),
+    ("get_portfolio_summary", lambda manager: manager._fetch_portfolio_summary(WALLET)),
+    ("_get_or_create_user", lambda manager: _with_session(
+        lambda db: manager._get_or_create_user(db, {'wallet_address': WALLET})
+    )),
+    ("_validate_policy_for_claim", lambda manager: _with_session(
+        lambda db: manager._validate_policy_for_claim(db, {'policy_id': "policy-42", 'claim_id': "claim-new"})
+    )),
+    ("submit_claim", _submit_claim),
+    ("idempotency reserve and replay", lambda manager: _idempotent_request()),
+    ("expiration sweep candidates", lambda manager: _with_session(_expiration_candidates)),
+]
+
+def capture_queries(path, manager):
+    """
+    Run one query path (bypassing the cache) and return the SELECTs it issued
+    """
+    from sqlalchemy import event
+    from src.database import get_engine
+    from src.exceptions import InsuranceError
+
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            recorded.append((statement, parameters))
+
+    engine = get_engine()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        path(manager)
+    except InsuranceError:
+        # Seeded policies may be expired; the rejected path has still issued its query
+        pass
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return recorded
+
+def sequential_scans(statement, parameters):
+    from src.database import get_engine
+    engine = get_engine()
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return sorted(set(_postgres_seq_scans(plan[0]['Plan'])))
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        scans = []
+        for row in rows:
+            match = re.match(r"SCAN (?:TABLE )?(\w+)(.*)", row[-1])
+            if match and match.group(1) in HOT_TABLES and "USING" not in match.group(2):
+                scans.append(match.group(1))
+        return scans
+
+def _postgres_seq_scans(node):
+    if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') in HOT_TABLES:
+        yield node['Relation Name']
+    for child in node.get('Plans', []):
+        yield from _postgres_seq_scans(child)
+
+@pytest.fixture(scope="module")
+def manager():
+    """
+    An InsuranceManager on a seeded database, waiting for receipts from an in-process chain
+    """
+    from tests.fake_chain import InProcessChain
+    from src.database import get_engine, init_db
+    from src.insurance_manager import InsuranceManager
+    from src.models import Base
+    Base.metadata.drop_all(bind=get_engine())
+    init_db()
+    seed(int(os.environ.get("QUERY_PLAN_USERS", 5000)), int(os.environ.get("QUERY_PLAN_POLICIES_PER_USER", 5)))
+    return InsuranceManager(None, None, smart_contract=InProcessChain())
+
+@pytest.mark.parametrize("label, path", QUERY_PATHS, ids=[label for label, _ in QUERY_PATHS])
+def test_hot_queries_use_indexes(manager, label, path):
+    queries = capture_queries(path, manager)
+    assert queries, f"{label} issued no SELECT"
+    failures = []
+    for statement, parameters in queries:
+        scans = sequential_scans(statement, parameters)
+        if scans:
+            failures.append(f"sequential scan on {', '.join(scans)}: {' '.join(statement.split())}")
+    assert not failures, "\n".join(failures)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=f"sqlite:///{tempfile.mkdtemp()}/query_plans.db")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--policies-per-user", type=int, default=5)
+    args = parser.parse_args()
+
+    # conftest.py points the run at TEST_DATABASE_URL before src is imported
+    os.environ["TEST_DATABASE_URL"] = args.database_url
+    os.environ["QUERY_PLAN_USERS"] = str(args.users)
+    os.environ["QUERY_PLAN_POLICIES_PER_USER"] = str(args.policies_per_user)
+    sys.exit(pytest.main(["-q", "-v", __file__]))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
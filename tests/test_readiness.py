@@ -0,0 +1,29 @@
+import asyncio
+from src.readiness import Readiness
+
+def test_failed_component_is_retried_until_it_comes_up():
+    outcomes = iter([ConnectionError("database unreachable"), False, True])
+    def check():
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    readiness = Readiness(retry_seconds=0.001, max_retry_seconds=0.002)
+    readiness.pending("database")
+    assert asyncio.run(readiness.bring_up("database", check, "not yet"))
+    assert readiness.is_ready()
+    assert readiness.components["database"]['attempts'] == 3
+
+def test_failed_component_is_reported_while_it_retries():
+    async def run():
+        readiness = Readiness(retry_seconds=60)
+        task = asyncio.create_task(readiness.bring_up("blockchain", lambda: False, "node unreachable"))
+        while readiness.components.get("blockchain", {}).get('status') != 'failed':
+            await asyncio.sleep(0.001)
+        task.cancel()
+        return readiness.report()
+
+    report = asyncio.run(run())
+    assert not report['ready']
+    assert report['components']['blockchain']['error'] == "node unreachable"
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from src.risk_assessment import RiskAssessment, extract_feature_matrix
+
+APPLICATIONS = [
+    {'age': 65, 'claim_history': 3, 'risk_factors': 0.4, 'requested_coverage': 20000, 'credit_score': 700},
+    {'age': 30, 'claim_history': 0, 'risk_factors': 0.1, 'requested_coverage': 5000, 'credit_score': None},
+    {'age': 45, 'claim_history': 1, 'risk_factors': 0.2, 'coverage_amount': None, 'requested_coverage': 8000},
+    {'age': 50, 'claim_history': None, 'coverage_amount': 12000, 'income': 40000.0},
+    {'age': 28},
+]
+
+def test_batch_and_single_scoring_agree_on_missing_fields(trained_assessor):
+    batch = trained_assessor.analyze_batch(APPLICATIONS)
+    for user_data, batched in zip(APPLICATIONS, batch):
+        single = trained_assessor.analyze_user_risk(user_data)
+        assert batched['risk_factors'] == single['risk_factors']
+        assert batched['risk_score'] == pytest.approx(single['risk_score'])
+
+def test_none_is_the_same_as_a_missing_field():
+    assessor = RiskAssessment()
+    features = extract_feature_matrix(APPLICATIONS)
+    assert not np.isnan(features).any()
+    assert features.tolist() == [assessor._extract_features(user_data) for user_data in APPLICATIONS]
+    # credit_score None reads as 0, and coverage_amount None falls back to requested_coverage
+    assert assessor._analyze_risk_factors(APPLICATIONS[1]) == ['Low Credit Score']
+    assert features[2, 3] == 8000
@@ -0,0 +1,30 @@
+from sqlalchemy import update
+from src.risk_assessment import extract_feature_matrix
+from src.training_pipeline import TrainingPipeline
+
+APPLICATION = {'wallet_address': "0x" + "e" * 40, 'age': 52, 'claim_history': 3, 'risk_factors': 0.3,
+               'requested_coverage': 25000, 'duration': 365, 'income': 64000, 'health_score': 71}
+
+def test_training_rows_match_the_features_the_application_was_scored_on(api):
+    from src.api import insurance_manager
+    insurance_manager.process_insurance_application(dict(APPLICATION))
+
+    pipeline = TrainingPipeline()
+    features, _ = pipeline.load_training_matrix(1)
+    served = extract_feature_matrix([APPLICATION])
+    assert features.tolist() == served.tolist()
+    assert served[0].tolist() == [52, 3, 0.3, 25000, 64000, 0, 0, 71]
+
+def test_policies_without_scored_features_train_on_database_columns(api):
+    from src.api import insurance_manager
+    from src.database import get_db_session
+    from src.models import Policy
+    insurance_manager.process_insurance_application(dict(APPLICATION))
+    with get_db_session() as db:
+        db.execute(update(Policy).values(risk_features=None))
+        db.commit()
+
+    features, _ = TrainingPipeline().load_training_matrix(1)
+    # Only the persisted columns reach training; the client-only features are 0,
+    # and claim_history counts the holder's recorded claims, of which there are none
+    assert features[0].tolist() == [52, 0, 0, 25000, 0, 0, 0, 0]
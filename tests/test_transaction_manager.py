@@ -0,0 +1,350 @@
+import functools
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from web3.exceptions import TransactionNotFound
+from src.transaction_manager import TransactionManager, ReceiptReconciler, broadcast_in_order
+from tests.test_portfolio_summary import assert_summaries_match_a_rebuild
+
+SENDER = "0x" + "a" * 40
+
+class FakeEth:
+    """
+    Just enough of w3.eth for the transaction manager: a mempool, mined receipts and per-sender nonces
+    """
+    def __init__(self):
+        self.gas_price = 10
+        self.block_number = 0
+        self.accounts = [SENDER]
+        self.default_account = SENDER
+        self.mempool = {}
+        self.receipts = {}
+        self.mined_nonce = 0
+
+    def get_transaction_count(self, address, block_identifier='latest'):
+        if block_identifier == 'pending':
+            return max([self.mined_nonce, *(tx['nonce'] + 1 for tx in self.mempool.values())])
+        return self.mined_nonce
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.receipts[tx_hash]
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.mempool and tx_hash not in self.receipts:
+            raise TransactionNotFound(tx_hash)
+        return self.mempool.get(tx_hash) or self.receipts[tx_hash]
+
+class FakeW3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+class FakeChain:
+    """
+    Stand-in for SmartContract whose transactions sit in the mempool until the test mines or drops them
+    """
+    contract_address = "0x" + "c" * 40
+    sender_address = SENDER
+
+    def __init__(self):
+        self.w3 = FakeW3()
+        self.next_policy_id = 1
+
+    def send_create_policy(self, user_address, policy_details, nonce, gas_price):
+        return self._send('policy', nonce, gas_price)
+
+    def send_process_claim(self, claim_id, claim_data, nonce, gas_price):
+        return self._send('claim', nonce, gas_price)
+
+    def send_cancel(self, nonce, gas_price):
+        return self._send('cancel', nonce, gas_price)
+
+    def created_policy_id(self, receipt):
+        return receipt.get('policyId')
+
+    def mine(self, tx_hash, status=1):
+        eth = self.w3.eth
+        tx = eth.mempool.pop(tx_hash)
+        # Every other broadcast of the same nonce is now invalid
+        for other, pending in list(eth.mempool.items()):
+            if pending['nonce'] == tx['nonce']:
+                del eth.mempool[other]
+        receipt = {'transactionHash': tx_hash, 'status': status}
+        if tx['kind'] == 'policy' and status == 1:
+            receipt['policyId'] = str(self.next_policy_id)
+            self.next_policy_id += 1
+        eth.receipts[tx_hash] = receipt
+        eth.mined_nonce = max(eth.mined_nonce, tx['nonce'] + 1)
+        eth.block_number += 1
+        return receipt
+
+    def drop(self, tx_hash):
+        del self.w3.eth.mempool[tx_hash]
+
+    def _send(self, kind, nonce, gas_price):
+        # Bare hex, as the event stand-in in test_blockchain_events reports transaction hashes
+        tx_hash = uuid.uuid4().hex * 2
+        self.w3.eth.mempool[tx_hash] = {'kind': kind, 'nonce': nonce, 'gasPrice': gas_price}
+        return tx_hash
+
+@pytest.fixture
+def chain():
+    return FakeChain()
+
+@pytest.fixture
+def manager(api, chain, monkeypatch):
+    """
+    The API's InsuranceManager in fire-and-reconcile mode on the fake chain
+    """
+    from src.api import insurance_manager
+    monkeypatch.setattr(insurance_manager, "smart_contract", chain)
+    monkeypatch.setattr(insurance_manager, "transaction_manager", TransactionManager(chain, replace_after=0))
+    return insurance_manager
+
+def application(i=0):
+    return {'wallet_address': f"0x{i:040x}", 'age': 35, 'claim_history': 0, 'risk_factors': 0.3,
+            'requested_coverage': 10000, 'duration': 365}
+
+def test_policy_id_returned_to_the_client_survives_reconciliation(manager, chain):
+    policy = manager.process_insurance_application(application())
+    assert policy['policy_id'].startswith("pending-")
+    assert policy['chain_policy_id'] is None
+
+    chain.mine(policy['tx_hash'])
+    ReceiptReconciler(manager.transaction_manager).reconcile_once()
+
+    details = manager.get_policy_details(policy['policy_id'])
+    assert details['status'].value == "active"
+    assert details['chain_policy_id'] == "1"
+    assert details['policy_id'] == policy['policy_id']
+def test_async_submission_commits_with_the_policy(manager, chain, monkeypatch):
+    import asyncio
+    from src.api import async_manager
+    monkeypatch.setattr(async_manager, "transaction_manager", manager.transaction_manager)
+    policy = asyncio.run(async_manager.process_insurance_application(application(1)))
+    assert pending_rows() == {('policy', policy['policy_id']): (manager.transaction_manager.worker_id, 0)}
+
+def pending_rows():
+    from src.database import get_db_session
+    from src.models import PendingTransaction
+    with get_db_session() as db:
+        return {(row.kind, row.key): (row.owner, row.nonce) for row in db.query(PendingTransaction)}
+
+def submit(transaction_manager, key):
+    from src.database import get_db_session
+    with get_db_session() as db:
+        tx_hash = transaction_manager.submit_claim(db, key, {'amount': 1.0, 'evidence_hash': "Qm"})
+        db.commit()
+    return tx_hash
+
+def test_workers_share_one_nonce_sequence(database, chain):
+    workers = [TransactionManager(chain, worker_id=f"worker-{i}") for i in range(2)]
+    for i in range(6):
+        submit(workers[i % 2], f"claim-{i}")
+    nonces = sorted(tx['nonce'] for tx in chain.w3.eth.mempool.values())
+    assert nonces == list(range(6))
+
+@pytest.mark.skipif(
+    os.environ["DATABASE_URL"].startswith("sqlite"),
+    reason="SQLite ignores row locks; set TEST_DATABASE_URL to a PostgreSQL database"
+)
+def test_concurrent_batches_and_submissions_take_distinct_nonces(database, chain, monkeypatch):
+    count = chain.w3.eth.get_transaction_count
+
+    def slow_count(*args):
+        # Widens the window in which readers that skip the allocator act on the same pending count
+        pending = count(*args)
+        time.sleep(0.2)
+        return pending
+
+    monkeypatch.setattr(chain.w3.eth, "get_transaction_count", slow_count)
+    batch = [functools.partial(chain.send_create_policy, SENDER, {}) for _ in range(3)]
+    with ThreadPoolExecutor(3) as pool:
+        batches = [pool.submit(broadcast_in_order, chain, batch) for _ in range(2)]
+        single = pool.submit(submit, TransactionManager(chain), "claim-0")
+        assert all(len(future.result()) == 3 for future in batches) and single.result()
+    assert sorted(tx['nonce'] for tx in chain.w3.eth.mempool.values()) == list(range(7))
+
+def test_failed_broadcast_does_not_consume_a_nonce(database, chain, monkeypatch):
+    transaction_manager = TransactionManager(chain)
+    submit(transaction_manager, "claim-0")
+    def unreachable(*args):
+        raise ConnectionError("node unreachable")
+    monkeypatch.setattr(chain, "send_process_claim", unreachable)
+    with pytest.raises(ConnectionError):
+        submit(transaction_manager, "claim-1")
+    monkeypatch.undo()
+    submit(transaction_manager, "claim-2")
+    assert sorted(tx['nonce'] for tx in chain.w3.eth.mempool.values()) == [0, 1]
+    assert set(pending_rows()) == {('claim', "claim-0"), ('claim', "claim-2")}
+
+def test_only_the_lease_holder_reconciles_a_transaction(database, chain):
+    first = TransactionManager(chain, worker_id="first", lease_seconds=60)
+    second = TransactionManager(chain, worker_id="second", lease_seconds=60)
+    tx_hash = submit(first, "claim-0")
+    chain.mine(tx_hash)
+
+    assert second.poll() == []
+    outcomes = first.poll()
+    assert [outcome.key for outcome in outcomes] == ["claim-0"]
+    assert second.leased == 0 and first.leased == 1
+
+def test_lapsed_lease_is_taken_over(database, chain):
+    stopped = TransactionManager(chain, worker_id="stopped", lease_seconds=0)
+    survivor = TransactionManager(chain, worker_id="survivor")
+    tx_hash = submit(stopped, "claim-0")
+    chain.mine(tx_hash)
+
+    outcomes = survivor.poll()
+    assert [outcome.tx_hash for outcome in outcomes] == [tx_hash]
+    assert pending_rows()[('claim', "claim-0")][0] == "survivor"
+
+    # The previous owner can no longer settle it
+    from src.database import get_db_session
+    with get_db_session() as db:
+        assert not stopped.settle(db, outcomes[0])
+        assert survivor.settle(db, outcomes[0])
+        db.commit()
+    assert pending_rows() == {}
+
+def claim_for(manager, policy, claim_id):
+    return manager.submit_claim({'claim_id': claim_id, 'policy_id': policy['policy_id'], 'amount': 100.0,
+                                 'evidence_hash': f"Qm{claim_id}"})
+
+def reconcile(manager):
+    return ReceiptReconciler(manager.transaction_manager).reconcile_once()
+
+def test_mined_claim_moves_to_processing(manager, chain):
+    policy = manager.process_insurance_application(application())
+    chain.mine(policy['tx_hash'])
+    reconcile(manager)
+    claim = claim_for(manager, policy, "claim-mined")
+    assert claim['status'].value == "pending"
+
+    chain.mine(claim['tx_hash'])
+    outcomes = reconcile(manager)
+    assert [(outcome.kind, outcome.succeeded) for outcome in outcomes] == [('claim', True)]
+    assert manager.get_claim_status("claim-mined")['status'].value == "processing"
+    assert pending_rows() == {}
+    assert_summaries_match_a_rebuild()
+
+def test_reverted_policy_is_cancelled(manager, chain):
+    policy = manager.process_insurance_application(application())
+    chain.mine(policy['tx_hash'], status=0)
+    reconcile(manager)
+    details = manager.get_policy_details(policy['policy_id'])
+    assert details['status'].value == "cancelled"
+    assert details['chain_policy_id'] is None
+    assert_summaries_match_a_rebuild()
+
+def test_stuck_transaction_is_replaced_and_the_replacement_settles_it(manager, chain):
+    policy = manager.process_insurance_application(application())
+    assert reconcile(manager) == []
+    replacements = [tx_hash for tx_hash in chain.w3.eth.mempool if tx_hash != policy['tx_hash']]
+    assert len(replacements) == 1
+    original, replacement = chain.w3.eth.mempool[policy['tx_hash']], chain.w3.eth.mempool[replacements[0]]
+    assert replacement['nonce'] == original['nonce']
+    assert replacement['gasPrice'] > original['gasPrice']
+
+    chain.mine(replacements[0])
+    reconcile(manager)
+    details = manager.get_policy_details(policy['policy_id'])
+    assert details['status'].value == "active"
+    assert details['tx_hash'] == replacements[0]
+
+def test_original_broadcast_mined_after_a_replacement_still_counts(manager, chain):
+    policy = manager.process_insurance_application(application())
+    reconcile(manager)
+    assert len(chain.w3.eth.mempool) == 2
+
+    chain.mine(policy['tx_hash'])
+    reconcile(manager)
+    details = manager.get_policy_details(policy['policy_id'])
+    assert details['status'].value == "active"
+    assert details['tx_hash'] == policy['tx_hash']
+
+def test_replacement_mined_and_ingested_before_reconciling_activates_the_placeholder(manager, chain):
+    from tests.test_blockchain_events import FakeChain as EventChain, ingester, rows
+    policy = manager.process_insurance_application(application())
+    reconcile(manager)
+    replacement = next(tx_hash for tx_hash in chain.w3.eth.mempool if tx_hash != policy['tx_hash'])
+    chain.mine(replacement)
+
+    # Event ingestion sees the PolicyCreated event of the replacement first
+    events = EventChain()
+    events.policy_created(5, 1, replacement)
+    ingester(events).backfill()
+    reconcile(manager)
+    assert rows()[0] == {policy['policy_id']: ("1", "active")}
+    assert manager.get_policy_details(policy['policy_id'])['tx_hash'] == replacement
+    assert pending_rows() == {}
+    assert_summaries_match_a_rebuild()
+
+def test_nonce_taken_by_another_transaction_is_dropped(manager, chain):
+    from src.database import get_db_session
+    from src.models import TransactionNonce
+    policy = manager.process_insurance_application(application())
+    chain.drop(policy['tx_hash'])
+    # Something outside this service mined a transaction with the same nonce
+    chain.w3.eth.mined_nonce += 1
+
+    outcomes = reconcile(manager)
+    assert [(outcome.succeeded, outcome.receipt) for outcome in outcomes] == [(False, None)]
+    assert manager.get_policy_details(policy['policy_id'])['status'].value == "cancelled"
+    with get_db_session() as db:
+        assert db.get(TransactionNonce, SENDER).next_nonce is None
+
+def cancellations(chain):
+    return [tx_hash for tx_hash, tx in chain.w3.eth.mempool.items() if tx['kind'] == 'cancel']
+
+def test_claim_out_of_replacements_is_cancelled_and_rejected_once_the_cancellation_is_mined(manager, chain):
+    policy = manager.process_insurance_application(application())
+    chain.mine(policy['tx_hash'])
+    reconcile(manager)
+    manager.transaction_manager.max_replacements = 0
+    claim = claim_for(manager, policy, "claim-dropped")
+    chain.drop(claim['tx_hash'])
+
+    # The nonce is still unused, so nothing is settled yet
+    assert reconcile(manager) == []
+    assert manager.get_claim_status("claim-dropped")['status'].value == "pending"
+    [cancellation] = cancellations(chain)
+
+    chain.mine(cancellation)
+    reconcile(manager)
+    assert manager.get_claim_status("claim-dropped")['status'].value == "rejected"
+    assert_summaries_match_a_rebuild()
+
+def test_claim_mined_after_its_cancellation_was_sent_still_counts(manager, chain):
+    policy = manager.process_insurance_application(application())
+    chain.mine(policy['tx_hash'])
+    reconcile(manager)
+    manager.transaction_manager.max_replacements = 0
+    claim = claim_for(manager, policy, "claim-late")
+    reconcile(manager)
+    assert len(cancellations(chain)) == 1
+
+    chain.mine(claim['tx_hash'])
+    reconcile(manager)
+    assert manager.get_claim_status("claim-late")['status'].value == "processing"
+    assert pending_rows() == {}
+    assert_summaries_match_a_rebuild()
+
+def test_recovered_transaction_unknown_to_the_node_is_dropped(manager, chain):
+    from src.database import get_db_session
+    from src.models import PendingTransaction
+    policy = manager.process_insurance_application(application())
+    with get_db_session() as db:
+        # As left by migration 7: no nonce, no payload to rebroadcast, no owner
+        row = db.get(PendingTransaction, ('policy', policy['policy_id']))
+        row.nonce = row.payload = row.owner = row.lease_until = None
+        db.commit()
+
+    assert reconcile(manager) == []
+    assert manager.get_policy_details(policy['policy_id'])['status'].value == "pending"
+    chain.drop(policy['tx_hash'])
+    reconcile(manager)
+    assert manager.get_policy_details(policy['policy_id'])['status'].value == "cancelled"
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+from src.tree_inference import CompiledForest, ARTIFACT_ALIGNMENT
+
+def fit(seed, n_classes=2, **forest_options):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(400, 6)) * rng.uniform(0.5, 50, size=6) + rng.uniform(-10, 10, size=6)
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (n_classes > 2) * (X[:, 3] > 0)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=15, random_state=seed, **forest_options)
+    model.fit(scaler.transform(X), y)
+    return model, scaler, rng.normal(size=(250, 6)) * 20
+
+def assert_parity(forest, model, scaler, X):
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(scaler.transform(X)), rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("options", [{}, {'max_depth': 3}, {'min_samples_leaf': 20}, {'max_features': None}])
+def test_predictions_match_sklearn(seed, options):
+    model, scaler, X = fit(seed, **options)
+    assert_parity(CompiledForest.from_sklearn(model, scaler), model, scaler, X)
+
+def test_multiclass_predictions_match_sklearn():
+    model, scaler, X = fit(0, n_classes=3)
+    assert model.n_classes_ == 3
+    assert_parity(CompiledForest.from_sklearn(model, scaler), model, scaler, X)
+
+def test_forest_of_leaf_only_trees():
+    model, scaler, X = fit(1, min_samples_split=10_000)
+    assert all(estimator.tree_.node_count == 1 for estimator in model.estimators_)
+    forest = CompiledForest.from_sklearn(model, scaler)
+    assert forest.max_depth == 0
+    assert_parity(forest, model, scaler, X)
+
+def test_leaf_only_trees_mixed_with_deep_ones():
+    model, scaler, X = fit(2)
+    stumps, _, _ = fit(2, min_samples_split=10_000)
+    model.estimators_ = model.estimators_[:10] + stumps.estimators_[:5]
+    assert_parity(CompiledForest.from_sklearn(model, scaler), model, scaler, X)
+
+def test_save_and_load_round_trip(tmp_path):
+    model, scaler, X = fit(3)
+    forest = CompiledForest.from_sklearn(model, scaler)
+    path = str(tmp_path / "model.forest")
+    forest.save(path, version="2.0.0")
+
+    assert CompiledForest.is_artifact(path)
+    loaded = CompiledForest.load(path)
+    assert loaded.version == "2.0.0"
+    assert loaded.max_depth == forest.max_depth
+    for name in ('feature', 'threshold', 'children_left', 'children_right', 'leaf_values', 'roots', 'mean', 'scale'):
+        array = getattr(loaded, name)
+        np.testing.assert_array_equal(array, getattr(forest, name))
+        assert array.dtype == getattr(forest, name).dtype
+        # Views straight into the read-only mapping, aligned for vectorized loads
+        assert not array.flags.writeable
+        assert array.ctypes.data % ARTIFACT_ALIGNMENT == 0
+    assert_parity(loaded, model, scaler, X)
+
+def test_save_replaces_an_artifact_that_is_still_mapped(tmp_path):
+    first_model, scaler, X = fit(4)
+    second_model, _, _ = fit(5)
+    path = str(tmp_path / "model.forest")
+    CompiledForest.from_sklearn(first_model, scaler).save(path, version="1")
+    mapped = CompiledForest.load(path)
+
+    CompiledForest.from_sklearn(second_model, scaler).save(path, version="2")
+    assert CompiledForest.load(path).version == "2"
+    assert_parity(mapped, first_model, scaler, X)
+
+def test_joblib_file_is_not_an_artifact(tmp_path):
+    path = tmp_path / "model.joblib"
+    path.write_bytes(b"\x80\x04\x95" + b"\x00" * 32)
+    assert not CompiledForest.is_artifact(str(path))
\ No newline at end of file